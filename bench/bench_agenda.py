@@ -0,0 +1,135 @@
+# --- START OF FILE bench/bench_agenda.py ---
+"""
+Benchmark do motor de agenda: agrupamento/ordenação + renderers.
+Compara o caminho antigo do resumo (build_sections + generate_ascii_tree, cada um
+agrupando e interpretando as datas por conta própria) com uma agenda única.
+
+    python -m bench.bench_agenda --sizes 100 10000 100000
+"""
+import argparse
+import time
+from datetime import datetime, date
+from src.utils import parse_smart_date
+from src.agenda import build_agenda, tree_lines, summary_sections, painel_lines, ini_lines, notify_lines
+from bench.synthetic import make_tasks
+
+# =========================================
+#       REPRODUÇÃO DO CAMINHO ANTIGO (resumo smart, estilo diff)
+# =========================================
+
+def legacy_sections(all_tasks, mode, today):
+    grouped_tasks = {}
+    for t in all_tasks:
+        d = parse_smart_date(t.get('data', ''))
+        if not d: continue
+        delta_days = (d.date() - today).days
+        if delta_days < 0: continue
+        prio = t.get('prioridade', 'low')
+        if (mode == 'manual') or (prio in ['critical', 'medium'] or delta_days <= 30):
+            grouped_tasks.setdefault(t.get('tipo', 'Geral'), []).append((d, t, delta_days))
+    sections = []
+    for cat in sorted(grouped_tasks.keys()):
+        lines = []
+        for d, t, dias in sorted(grouped_tasks[cat], key=lambda x: x[0]):
+            prio_raw = t.get('prioridade', 'low')
+            if prio_raw == 'critical' or dias <= 7: ico = "🚨"
+            elif prio_raw == 'medium' or dias <= 30: ico = "⚠️"
+            else: ico = "🔹"
+            t_str = "HOJE 🔥" if dias == 0 else ("AMANHÃ" if dias == 1 else f"em {dias}d")
+            lines.append(f"{ico} {t['materia']}: {t['data']} ({t_str})")
+        sections.append((cat, lines))
+    return sections
+
+def legacy_tree(tasks, mode):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    dados = {}
+    for p in tasks:
+        tipo = p.get('tipo', 'Geral')
+        if tipo not in dados: dados[tipo] = {}
+        if p['materia'] not in dados[tipo]: dados[tipo][p['materia']] = []
+        dados[tipo][p['materia']].append(p)
+    lines = ["🌲 *Visão Geral*", "```diff"]
+    priority = ["Provas", "Trabalhos"]
+    tipos = [t for t in priority + [x for x in sorted(dados.keys()) if x not in priority] if t in dados]
+    for tipo in tipos:
+        lines.append(f"+ : : {tipo.upper()} : :")
+        materias = sorted(dados[tipo].keys())
+        for j, materia in enumerate(materias):
+            prefix = "└──" if j == len(materias)-1 else "├──"
+            lines.append(f"#  {prefix} {materia}")
+            docs = sorted(dados[tipo][materia], key=lambda x: parse_smart_date(x['data']) or datetime.max)
+            indent = "    " if prefix == "└──" else "│   "
+            for k, d in enumerate(docs):
+                conn = "└──" if k == len(docs)-1 else "├──"
+                dt_obj = parse_smart_date(d['data'])
+                delta_days = (dt_obj - today).days if dt_obj else 999
+                prio = d.get('prioridade', 'low')
+                tag = "[URG]" if prio == 'critical' else ("[MED]" if prio == 'medium' else "[LOW]")
+                obs = d.get('observacoes', '')
+                content = f"{conn} {'(' + obs + ') ' if obs else ''}{d['data']} {tag}"
+                color_type = "none"
+                if delta_days < 0: color_type = "gray"
+                elif mode == 'manual':
+                    if prio == 'critical': color_type = "red"
+                    elif prio == 'medium': color_type = "orange"
+                else:
+                    if prio == 'critical' or delta_days <= 7: color_type = "red"
+                    elif prio == 'medium' or delta_days <= 30: color_type = "orange"
+                if color_type == "orange": lines.append(f"'  {indent}{content}'")
+                elif color_type in ("red", "gray"): lines.append(f"-  {indent}{content}")
+                else: lines.append(f"   {indent}{content}")
+    lines.append("```")
+    return "\n".join(lines)
+
+# =========================================
+#       MEDIÇÃO
+# =========================================
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+def run(n, repeat):
+    tasks = make_tasks(n)
+    today = date.today()
+
+    def legacy():
+        return legacy_sections(tasks, 'smart', today), legacy_tree(tasks, 'smart')
+    def unified():
+        agenda = build_agenda(tasks, today)
+        return summary_sections(agenda, 'smart'), "\n".join(tree_lines(agenda, 'smart', 'diff'))
+
+    if legacy() != unified():
+        print(f"❌ {n} eventos: saída divergente do caminho antigo")
+        raise SystemExit(1)
+
+    agenda = build_agenda(tasks, today)
+    rows = [
+        ("resumo legacy", best_of(legacy, repeat)),
+        ("resumo agenda única", best_of(unified, repeat)),
+        ("  build_agenda", best_of(lambda: build_agenda(tasks, today), repeat)),
+        ("  tree diff", best_of(lambda: "\n".join(tree_lines(agenda, 'smart', 'diff')), repeat)),
+        ("  tree ansi", best_of(lambda: "\n".join(tree_lines(agenda, 'smart', 'ansi')), repeat)),
+        ("  painel horizontal", best_of(lambda: "\n".join(painel_lines(agenda, 'horizontal', "🎓")), repeat)),
+        ("  ini vertical", best_of(lambda: "\n".join(ini_lines(agenda, 'v')), repeat)),
+        ("  notify", best_of(lambda: "\n".join(notify_lines(agenda, 'smart')), repeat)),
+    ]
+    print(f"\n📅 {n} eventos (melhor de {repeat})", flush=True)
+    for label, dt in rows:
+        print(f"{label:<24} {dt * 1000:10.2f}ms  {n / dt:12.0f} eventos/s", flush=True)
+    print(f"   speedup do resumo: {rows[0][1] / rows[1][1]:.1f}x", flush=True)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    for n in args.sizes: run(n, args.repeat)
+
+if __name__ == "__main__":
+    main()
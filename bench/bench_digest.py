@@ -0,0 +1,83 @@
+# --- START OF FILE bench/bench_digest.py ---
+"""
+Benchmark de uma passada de resumos do notifier (sem Mongo): o caminho antigo,
+que montava agenda, resumo e árvore para cada usuário devido, contra o lote
+(render_digests), que monta uma agenda por cluster e um resumo por (cluster, modo).
+
+    python -m bench.bench_digest --clusters 1000 --per-cluster 100 --linked 0.5
+"""
+import argparse
+import random
+import time
+from datetime import date
+from src.agenda import build_agenda, tree_lines, summary_sections
+from src.read_model import build_groups, flatten_view
+from src.digest import Digest, render_digests
+from bench.synthetic import make_tasks
+
+def legacy_digest(cluster, mode, style, views, today):
+    all_tasks = [t for uid in cluster for t in flatten_view(views[uid])]
+    if not all_tasks: return Digest(False, [], None)
+    agenda = build_agenda(all_tasks, today)
+    return Digest(True, summary_sections(agenda, mode), "\n".join(tree_lines(agenda, mode, style)))
+
+def make_pass(clusters, per_cluster, linked, seed=42):
+    """Read models e pedidos (cluster, modo, estilo) de uma passada. Cluster vinculado =
+    conta do Telegram + conta do Discord com a mesma agenda, cada uma com o seu pedido."""
+    rnd = random.Random(seed)
+    views, requests = {}, []
+    for c in range(clusters):
+        tg = c
+        tasks = make_tasks(per_cluster, seed=c)
+        for i, t in enumerate(tasks): t["_id"] = i
+        views[tg] = {"user_id": tg, "version": 1, "groups": build_groups(tasks)}
+        mode = 'manual' if rnd.random() < 0.25 else 'smart'
+        if rnd.random() < linked:
+            dc = 10**17 + c  # id do Discord (estilo ansi)
+            views[dc] = {"user_id": dc, "version": 1, "groups": []}
+            cluster = (tg, dc)
+            requests += [(cluster, mode, 'diff'), (cluster, mode, 'ansi')]
+        else: requests.append(((tg,), mode, 'diff'))
+    return views, requests
+
+def best_of(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+def run(clusters, per_cluster, linked, repeat):
+    today = date.today()
+    views, requests = make_pass(clusters, per_cluster, linked)
+
+    def legacy():
+        return {req: legacy_digest(*req, views, today) for req in requests}
+    def batch():
+        return render_digests(requests, views, today)
+
+    old, new = legacy(), batch()
+    if any((old[r].sections, old[r].tree) != (new[r].sections, new[r].tree) for r in requests):
+        print("❌ Lote divergente do caminho por usuário")
+        raise SystemExit(1)
+
+    n = clusters * per_cluster
+    rows = [("por usuário", best_of(legacy, repeat)), ("lote", best_of(batch, repeat))]
+    print(f"\n🔔 {len(requests)} pedidos, {n} eventos ({linked:.0%} vinculados, melhor de {repeat})", flush=True)
+    for label, dt in rows:
+        print(f"{label:<16} {dt * 1000:10.2f}ms  {n / dt:12.0f} eventos/s", flush=True)
+    print(f"   speedup: {rows[0][1] / rows[1][1]:.2f}x", flush=True)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clusters", type=int, default=1000)
+    ap.add_argument("--per-cluster", type=int, default=100)
+    ap.add_argument("--linked", type=float, default=0.5, help="fração de clusters com Telegram + Discord")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    run(args.clusters, args.per_cluster, args.linked, args.repeat)
+
+if __name__ == "__main__":
+    main()
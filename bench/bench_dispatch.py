@@ -0,0 +1,127 @@
+# --- START OF FILE bench/bench_dispatch.py ---
+"""
+Benchmark do envio de notificações contra endpoints falsos locais (Telegram e
+Discord), com latência simulada. Não precisa de Mongo nem de tokens reais.
+
+    python -m bench.bench_dispatch --users 10000 --latency-ms 20
+
+O caminho antigo (requests.post sequencial + sleep de 0.5s por chunk no Discord)
+roda só numa amostra (--legacy-users) e a vazão é extrapolada.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from src.config import Config
+from src.dispatch import Dispatcher, DmChannelCache, Outbox
+
+# =========================================
+#       SERVIDOR FALSO
+# =========================================
+
+class FakeApi(BaseHTTPRequestHandler):
+    latency = 0.02
+    hits = {"telegram": 0, "discord_dm": 0, "discord_msg": 0}
+    lock = threading.Lock()
+    protocol_version = "HTTP/1.1"  # keep-alive, como as APIs reais
+
+    def log_message(self, *args): pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        if "/sendMessage" in self.path: kind, body = "telegram", {"ok": True}
+        elif self.path.endswith("/users/@me/channels"): kind, body = "discord_dm", {"id": "900000000000000000"}
+        else: kind, body = "discord_msg", {"id": "1"}
+        with self.lock: self.hits[kind] += 1
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("X-RateLimit-Remaining", "4")
+        self.send_header("X-RateLimit-Reset-After", "1.0")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_server(latency):
+    FakeApi.latency = latency
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), FakeApi)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_address[1]}"
+
+# =========================================
+#       CARGA
+# =========================================
+
+def make_users(n, discord_ratio, seed=42):
+    rnd = random.Random(seed)
+    users = []
+    for i in range(n):
+        uid = 100000000000000000 + i if rnd.random() < discord_ratio else 1000000 + i
+        summary = "⏰ **Resumo (Smart)**\n" + "\n".join(f"🔹 Matéria {j}: 10/10/2030 (em {j}d)" for j in range(rnd.randint(3, 20)))
+        tree = "```diff\n" + "\n".join(f"+ Evento {j}" for j in range(rnd.randint(5, 40))) + "\n```"
+        users.append((uid, [summary, tree]))
+    return users
+
+def legacy_send(base, target_id, text):
+    # Reprodução do notifier antigo: sem sessão, DM aberta a cada mensagem
+    target_id = str(target_id)
+    if len(target_id) > 15:
+        headers = {"Authorization": f"Bot {Config.DISCORD_TOKEN}", "Content-Type": "application/json"}
+        resp = requests.post(f"{base}/users/@me/channels", json={"recipient_id": target_id}, headers=headers)
+        if resp.status_code in [200,201]:
+            cid = resp.json()["id"]
+            for c in [text[i:i+1900] for i in range(0, len(text), 1900)]:
+                requests.post(f"{base}/channels/{cid}/messages", json={"content": c}, headers=headers)
+                time.sleep(0.5)
+    else:
+        requests.post(f"{base}/bot{Config.TELEGRAM_TOKEN}/sendMessage", json={"chat_id": target_id, "text": text, "parse_mode": "Markdown"})
+
+def timed(label, fn, n):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<28} {dt:8.2f}s  {n / dt:10.1f} usuários/s", flush=True)
+    return dt
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=10000)
+    ap.add_argument("--discord-ratio", type=float, default=0.1)
+    ap.add_argument("--latency-ms", type=float, default=20)
+    ap.add_argument("--legacy-users", type=int, default=300)
+    ap.add_argument("--rate", type=float, default=1000)
+    ap.add_argument("--skip-legacy", action="store_true")
+    args = ap.parse_args()
+
+    srv, base = start_server(args.latency_ms / 1000)
+    Config.TELEGRAM_API_URL, Config.DISCORD_API_URL = base, base
+    Config.TELEGRAM_TOKEN, Config.DISCORD_TOKEN = "bench", "bench"
+    # O servidor falso não limita; os token buckets ficam com --rate (msgs/s por plataforma)
+    Config.TELEGRAM_RATE = Config.DISCORD_RATE = args.rate
+    users = make_users(args.users, args.discord_ratio)
+    print(f"📨 Dispatch benchmark: {args.users} usuários ({args.discord_ratio:.0%} Discord), latência {args.latency_ms}ms", flush=True)
+
+    try:
+        if not args.skip_legacy:
+            sample = users[:args.legacy_users]
+            dt = timed(f"legacy (amostra {len(sample)})", lambda: [legacy_send(base, u, t) for u, texts in sample for t in texts], len(sample))
+            print(f"{'legacy (extrapolado)':<28} {dt * len(users) / len(sample):8.2f}s", flush=True)
+
+        for k in FakeApi.hits: FakeApi.hits[k] = 0
+        dispatcher = Dispatcher(dm_channels=DmChannelCache(None), outbox=Outbox(None))  # sem Mongo
+        def run():
+            for uid, texts in users: dispatcher.send(uid, *texts)
+            dispatcher.flush()
+        timed("dispatcher", run, len(users))
+        dispatcher.shutdown()
+        print(f"   requisições: {FakeApi.hits}", flush=True)
+    finally:
+        srv.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# --- START OF FILE bench/bench_import.py ---
+"""
+Benchmark do import JSON (replace/merge): caminho antigo (item a item) vs engine em lote.
+Precisa de um Mongo acessível via MONGO_URI.
+
+    python -m bench.bench_import --items 50000
+"""
+import argparse
+import time
+from src.database import db
+from src.importer import prepare_import_items, import_items
+from bench.synthetic import make_tasks
+
+BENCH_USER = -424242  # ID fictício, limpo ao final
+
+def legacy_import(user_id, items, mode):
+    # Reprodução do fluxo anterior: insert_many único + update_one por item
+    if mode == "replace":
+        db.provas.delete_many({"user_id": user_id})
+        db.provas.insert_many(items)
+        db.user_settings.update_one({"user_id": user_id}, {"$set": {"custom_cats": []}})
+        for it in items:
+            db.user_settings.update_one({"user_id": user_id}, {"$addToSet": {"custom_cats": it["tipo"]}}, upsert=True)
+        return
+    existing_sigs = set()
+    for doc in db.provas.find({"user_id": user_id}):
+        existing_sigs.add((str(doc.get("tipo", "")).strip().lower(), str(doc.get("materia", "")).strip().lower(),
+                           str(doc.get("data", "")).strip(), str(doc.get("observacoes", "")).strip().lower()))
+    final_list = []
+    for it in items:
+        sig = (str(it["tipo"]).strip().lower(), str(it["materia"]).strip().lower(),
+               str(it["data"]).strip(), str(it["observacoes"]).strip().lower())
+        if sig not in existing_sigs:
+            final_list.append(it)
+            existing_sigs.add(sig)
+    if final_list:
+        db.provas.insert_many(final_list)
+        for it in final_list:
+            db.user_settings.update_one({"user_id": user_id}, {"$addToSet": {"custom_cats": it["tipo"]}}, upsert=True)
+
+def fresh_items(n):
+    return prepare_import_items(make_tasks(n), BENCH_USER, "bench")
+
+def timed(label, fn, n):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<28} {dt:8.2f}s  {n / dt:10.0f} itens/s", flush=True)
+    return dt
+
+def cleanup():
+    db.provas.delete_many({"user_id": BENCH_USER})
+    db.agenda_views.delete_many({"user_id": BENCH_USER})  # import_items reconstrói o read model
+    db.user_settings.delete_many({"user_id": BENCH_USER})
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=50000)
+    ap.add_argument("--skip-legacy", action="store_true")
+    args = ap.parse_args()
+    n = args.items
+
+    print(f"📦 Import benchmark: {n} itens", flush=True)
+    try:
+        if not args.skip_legacy:
+            cleanup()
+            timed("legacy replace", lambda: legacy_import(BENCH_USER, fresh_items(n), "replace"), n)
+            timed("legacy merge (tudo dup)", lambda: legacy_import(BENCH_USER, fresh_items(n), "merge"), n)
+        cleanup()
+        timed("bulk replace", lambda: import_items(BENCH_USER, fresh_items(n), mode="replace"), n)
+        timed("bulk merge (tudo dup)", lambda: import_items(BENCH_USER, fresh_items(n), mode="merge"), n)
+    finally:
+        cleanup()
+
+if __name__ == "__main__":
+    main()
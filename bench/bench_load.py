@@ -0,0 +1,98 @@
+# --- START OF FILE bench/bench_load.py ---
+"""
+Benchmark da carga de leitura (sem Mongo): memória e tempo para transformar o read
+model em eventos (dicts do caminho antigo vs registros Event) e tamanho dos
+documentos importados com e sem a lista de campos permitidos.
+
+    python -m bench.bench_load --sizes 10000 100000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from src.read_model import build_groups, flatten_view
+from src.importer import prepare_import_items
+from bench.synthetic import make_tasks
+
+# =========================================
+#       REPRODUÇÃO DO CAMINHO ANTIGO
+# =========================================
+
+def legacy_flatten(view):
+    uid = view["user_id"]
+    for g in view.get("groups", []):
+        for m in g["materias"]:
+            for it in m["items"]:
+                yield {
+                    "_id": it["_id"], "user_id": uid, "materia": m["materia"], "data": it["data"],
+                    "tipo": g["tipo"], "prioridade": it["prioridade"], "observacoes": it["observacoes"],
+                }
+
+def legacy_prepare(data_import, user_id, origin):
+    items = []
+    for item in data_import:
+        if not isinstance(item, dict): continue
+        if "materia" not in item or "data" not in item: continue
+        new_item = item.copy()
+        new_item.pop("_id", None)
+        new_item["user_id"] = user_id
+        new_item["origin"] = origin
+        new_item.setdefault("tipo", "Geral")
+        new_item.setdefault("prioridade", "low")
+        new_item.setdefault("observacoes", "")
+        items.append(new_item)
+    return items
+
+def with_junk(tasks):
+    """JSON de import 'sujo': chaves que o bot não usa (export de outra ferramenta)."""
+    return [dict(t, _id=str(i), sent_24h=True, anexos=["slides.pdf"] * 3, notas="x" * 200)
+            for i, t in enumerate(tasks)]
+
+# =========================================
+#       MEDIÇÃO
+# =========================================
+
+def retained(fn):
+    """(resultado, KB que continuam alocados depois da chamada, segundos)."""
+    tracemalloc.start()
+    try:
+        t0 = time.perf_counter()
+        result = fn()
+        dt = time.perf_counter() - t0
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current / 1024, dt
+
+def run(n):
+    tasks = make_tasks(n)
+    for i, t in enumerate(tasks): t["_id"] = i
+    view = {"user_id": 1, "version": 1, "groups": build_groups(tasks)}
+
+    old, old_kb, old_dt = retained(lambda: list(legacy_flatten(view)))
+    new, new_kb, new_dt = retained(lambda: list(flatten_view(view)))
+    if [(d["_id"], d["tipo"], d["materia"], d["data"]) for d in old] != [(e["_id"], e["tipo"], e["materia"], e["data"]) for e in new]:
+        print(f"❌ {n} eventos: flatten divergente do caminho antigo")
+        raise SystemExit(1)
+    del old, new
+
+    raw = with_junk(tasks)
+    old_docs = legacy_prepare(raw, 1, "bench")
+    new_docs = prepare_import_items(raw, 1, "bench")
+    old_bytes = len(json.dumps(old_docs))
+    new_bytes = len(json.dumps(new_docs))
+
+    print(f"\n📦 {n} eventos", flush=True)
+    print(f"{'flatten dicts':<24} {old_kb:10.0f} KB {old_dt * 1000:10.2f}ms", flush=True)
+    print(f"{'flatten Event':<24} {new_kb:10.0f} KB {new_dt * 1000:10.2f}ms  ({1 - new_kb / old_kb:.0%} menos memória)", flush=True)
+    print(f"{'import (copy)':<24} {old_bytes / 1024:10.0f} KB gravados", flush=True)
+    print(f"{'import (whitelist)':<24} {new_bytes / 1024:10.0f} KB gravados  ({1 - new_bytes / old_bytes:.0%} menor)", flush=True)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    args = ap.parse_args()
+    for n in args.sizes: run(n)
+
+if __name__ == "__main__":
+    main()
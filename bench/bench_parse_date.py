@@ -0,0 +1,58 @@
+# --- START OF FILE bench/bench_parse_date.py ---
+"""
+Microbenchmark do parse_smart_date: parser original vs caminho rápido memoizado.
+Antes de medir, confere que os dois devolvem exatamente o mesmo resultado.
+
+    python -m bench.bench_parse_date --items 100000
+"""
+import argparse
+import random
+import time
+from src.utils import parse_smart_date, _parse_smart_date_legacy, _parse_smart_date_cached
+from bench.synthetic import make_tasks
+
+# Formatos aceitos pelo bot + casos de borda (inválidos, bissexto, ano curto, lixo)
+EDGE_CASES = [
+    "", "10/12", "1/2", "31/12", "01/01", "29/02", "29/02/2024", "29/02/2023", "31/04/2025",
+    "10-12-2025", "10.12.2025", "2025-12-10", "2025/1/5", "10/12/25", "5/6/0025", "0000/01/01",
+    "00/01/2025", "32/01/2025", "10/13", "10/12/2025/1", "10", "abc", "10 de 12", "dia 10/12!",
+    "1/1/1", "12/10/99", "7/7/2030", "٣/٤/2025",
+]
+
+def corpus(n, seed=42):
+    rnd = random.Random(seed)
+    dates = [t["data"] for t in make_tasks(n, seed=seed)]
+    # Mistura formatos curtos (dd/mm) como os digitados no chat
+    for i in range(0, len(dates), 3): dates[i] = dates[i][:5]
+    for i in range(1, len(dates), 7): dates[i] = dates[i].replace("/", "-")
+    rnd.shuffle(dates)
+    return dates
+
+def timed(label, fn, n):
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    print(f"{label:<28} {dt:8.3f}s  {n / dt:12.0f} parses/s", flush=True)
+    return dt
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=100000)
+    args = ap.parse_args()
+
+    dates = corpus(args.items) + EDGE_CASES
+    diffs = [d for d in dates if parse_smart_date(d) != _parse_smart_date_legacy(d)]
+    if diffs:
+        print(f"❌ {len(diffs)} resultados divergentes, ex.: {diffs[:10]}")
+        raise SystemExit(1)
+    print(f"✅ {len(dates)} datas: resultados idênticos ({len(EDGE_CASES)} casos de borda)", flush=True)
+
+    n = len(dates)
+    base = timed("legacy", lambda: [_parse_smart_date_legacy(d) for d in dates], n)
+    _parse_smart_date_cached.cache_clear()
+    cold = timed("rápido (cache frio)", lambda: [parse_smart_date(d) for d in dates], n)
+    warm = timed("rápido (cache quente)", lambda: [parse_smart_date(d) for d in dates], n)
+    print(f"   speedup: {base / cold:.1f}x frio, {base / warm:.1f}x quente", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# --- START OF FILE bench/run.py ---
+"""
+Suíte de benchmarks dos caminhos quentes (parsers e renderers), sem Mongo.
+Mede ops/s (melhor de --repeat) e o pico de memória (tracemalloc) de cada caso,
+e compara com um baseline salvo para pegar regressões.
+
+    python -m bench.run                              # roda tudo
+    python -m bench.run -k tree --items 20000        # só os casos com "tree" no nome
+    python -m bench.run --save bench/baseline.json   # grava o baseline
+    python -m bench.run --compare bench/baseline.json --tolerance 0.25
+
+Com --compare, sai com código 1 se algum caso ficar mais lento (ops/s) ou usar
+mais memória que o baseline além da tolerância. Casos cujo módulo não importa
+(ex.: discord.py ausente) aparecem como pulados.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import date
+from bench.synthetic import make_varied_tasks, make_cli_bodies, make_time_strings
+
+# =========================================
+#       CASOS
+# =========================================
+# Cada caso recebe o tamanho e devolve (função sem argumentos, nº de operações por chamada)
+
+def case_parse_date_cold(n):
+    from src.utils import parse_smart_date, _parse_smart_date_cached
+    dates = [t["data"] for t in make_varied_tasks(n)]
+    def run():
+        _parse_smart_date_cached.cache_clear()
+        for d in dates: parse_smart_date(d)
+    return run, len(dates)
+
+def case_parse_date_warm(n):
+    from src.utils import parse_smart_date
+    dates = [t["data"] for t in make_varied_tasks(n)]
+    for d in dates: parse_smart_date(d)
+    def run():
+        for d in dates: parse_smart_date(d)
+    return run, len(dates)
+
+def case_parse_time_string(n):
+    from src.utils import parse_time_string
+    texts = make_time_strings(n)
+    def run():
+        for t in texts: parse_time_string(t)
+    return run, len(texts)
+
+def case_parse_cli_args(n):
+    from src.utils import parse_cli_args
+    bodies = make_cli_bodies(n)
+    def run():
+        for b in bodies: parse_cli_args(b)
+    return run, len(bodies)
+
+def _ascii_tree(style):
+    def case(n):
+        from src.agenda import generate_ascii_tree
+        tasks = make_varied_tasks(n)
+        return (lambda: generate_ascii_tree(tasks, 'smart', style)), len(tasks)
+    return case
+
+def _painel(layout):
+    def case(n):
+        from src.worker import gerar_painel
+        tasks = make_varied_tasks(n)
+        return (lambda: "\n".join(gerar_painel(0, tasks, layout))), len(tasks)
+    return case
+
+def _discord_tree(mode):
+    def case(n):
+        from src.discord_bot import generate_discord_tree
+        tasks = make_varied_tasks(n)
+        return (lambda: "\n".join(generate_discord_tree(tasks, mode)[1])), len(tasks)
+    return case
+
+CASES = {
+    "parse_smart_date (frio)": case_parse_date_cold,
+    "parse_smart_date (quente)": case_parse_date_warm,
+    "parse_time_string": case_parse_time_string,
+    "parse_cli_args": case_parse_cli_args,
+    "generate_ascii_tree diff": _ascii_tree("diff"),
+    "generate_ascii_tree ansi": _ascii_tree("ansi"),
+    "gerar_painel vertical": _painel("vertical"),
+    "gerar_painel horizontal": _painel("horizontal"),
+    "generate_discord_tree v": _discord_tree("v"),
+    "generate_discord_tree h": _discord_tree("h"),
+    "generate_discord_tree notify": _discord_tree("notify"),
+}
+
+# =========================================
+#       MEDIÇÃO
+# =========================================
+
+def measure(fn, ops, repeat):
+    fn()  # aquecimento (imports, caches de módulo)
+    best = min(_timed(fn) for _ in range(repeat))
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"ops_per_s": ops / best, "peak_kb": peak / 1024}
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+def compare(results, baseline, tolerance):
+    """Lista de regressões (nome, métrica, atual, baseline)."""
+    bad = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if not b: continue
+        if r["ops_per_s"] < b["ops_per_s"] * (1 - tolerance): bad.append((name, "ops/s", r["ops_per_s"], b["ops_per_s"]))
+        if r["peak_kb"] > b["peak_kb"] * (1 + tolerance): bad.append((name, "pico KB", r["peak_kb"], b["peak_kb"]))
+    return bad
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", type=int, default=10000)
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("-k", dest="filter", default="", help="roda só os casos que contêm este texto")
+    ap.add_argument("--save", help="grava os resultados como baseline (JSON)")
+    ap.add_argument("--compare", help="baseline (JSON) para comparar")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    args = ap.parse_args()
+
+    print(f"🏁 {args.items} itens, melhor de {args.repeat} ({date.today()})", flush=True)
+    print(f"{'caso':<32} {'ops/s':>14} {'pico KB':>12}", flush=True)
+    results = {}
+    for name, case in CASES.items():
+        if args.filter not in name: continue
+        try: fn, ops = case(args.items)
+        except ImportError as e:
+            print(f"{name:<32} {'pulado':>14}  ({e})", flush=True)
+            continue
+        r = results[name] = measure(fn, ops, args.repeat)
+        print(f"{name:<32} {r['ops_per_s']:14.0f} {r['peak_kb']:12.1f}", flush=True)
+
+    if args.save:
+        with open(args.save, "w") as f: json.dump({"items": args.items, "results": results}, f, indent=2)
+        print(f"💾 Baseline salvo em {args.save}", flush=True)
+
+    if args.compare:
+        with open(args.compare) as f: saved = json.load(f)
+        if saved.get("items") != args.items:
+            print(f"⚠️ Baseline medido com {saved.get('items')} itens (agora {args.items}): comparação aproximada", flush=True)
+        bad = compare(results, saved["results"], args.tolerance)
+        for name, metric, now, base in bad:
+            print(f"❌ {name}: {metric} {now:.1f} vs baseline {base:.1f}", flush=True)
+        if bad: raise SystemExit(1)
+        print(f"✅ Sem regressões (tolerância {args.tolerance:.0%})", flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# --- START OF FILE bench/synthetic.py ---
+import random
+from datetime import datetime, timedelta
+
+# =========================================
+#       GERADORES DE AGENDA SINTÉTICA
+# =========================================
+
+TIPOS = ["Provas", "Trabalhos", "Listas", "Seminarios", "Tcc", "Atps", "Quiz"]
+MATERIAS = ["Cálculo", "SO2", "LFA", "Redes", "Compiladores", "BD", "IA", "Física", "Estatística", "Grafos"]
+PRIOS = ["low", "low", "low", "medium", "critical"]
+
+def make_tasks(n, seed=42, user_id=None):
+    """Gera n eventos no formato salvo em db.provas (data em dd/mm/YYYY)."""
+    rnd = random.Random(seed)
+    today = datetime.now()
+    tasks = []
+    for i in range(n):
+        d = today + timedelta(days=rnd.randint(-30, 180))
+        item = {
+            "tipo": rnd.choice(TIPOS),
+            "materia": f"{rnd.choice(MATERIAS)} {i % 50}",
+            "data": d.strftime("%d/%m/%Y"),
+            "prioridade": rnd.choice(PRIOS),
+            "observacoes": f"Obs {i}" if rnd.random() < 0.3 else "",
+        }
+        if user_id is not None: item["user_id"] = user_id
+        tasks.append(item)
+    return tasks
+
+# Formatos que o usuário digita (e que parse_smart_date precisa aceitar ou recusar)
+DATE_FORMATS = ["%d/%m/%Y", "%d/%m", "%d-%m-%Y", "%Y-%m-%d", "%d.%m.%y", "%d/%m/%y", "d/m"]
+BAD_DATES = ["", "amanhã", "32/01/2025", "29/02/2023", "10/13", "dia 10"]
+
+def make_varied_tasks(n, seed=42, categories=40, long_obs=0.2, bad_dates=0.02):
+    """Agenda 'difícil': muitas categorias, observações longas e datas em formatos variados/inválidos."""
+    rnd = random.Random(seed)
+    today = datetime.now()
+    tipos = TIPOS + [f"Categoria {i}" for i in range(max(0, categories - len(TIPOS)))]
+    tasks = []
+    for i in range(n):
+        d = today + timedelta(days=rnd.randint(-60, 365))
+        if rnd.random() < bad_dates: data = rnd.choice(BAD_DATES)
+        else:
+            fmt = rnd.choice(DATE_FORMATS)
+            data = f"{d.day}/{d.month}" if fmt == "d/m" else d.strftime(fmt)
+        r = rnd.random()
+        if r < long_obs: obs = " ".join(f"anotação{j}" for j in range(rnd.randint(10, 40)))
+        elif r < 0.5: obs = f"Obs {i}"
+        else: obs = ""
+        tasks.append({
+            "tipo": rnd.choice(tipos),
+            "materia": f"{rnd.choice(MATERIAS)} {i % 80}",
+            "data": data,
+            "prioridade": rnd.choice(PRIOS),
+            "observacoes": obs,
+        })
+    return tasks
+
+def make_cli_bodies(n, seed=42):
+    """Corpos de comando como chegam no add/del/alert (com e sem aspas/flags)."""
+    rnd = random.Random(seed)
+    shapes = [
+        "Provas Cálculo 10/12",
+        "Provas 'Cálculo Numérico' 10/12 -alta",
+        'Trabalhos "Redes de Computadores" 2025-12-10 -obs "entregar no moodle" -media',
+        "Listas LFA 5/6 -baixa -obs sala",
+        "-f 1h30m -mode smart",
+        "Seminarios IA 10.12.25 texto livre de observação",
+    ]
+    return [rnd.choice(shapes) for _ in range(n)]
+
+def make_time_strings(n, seed=42):
+    rnd = random.Random(seed)
+    shapes = ["1h", "1h 30m", "2d", "10s", "45min", "1w 2d 3h", "90 seg", "12H", "lixo"]
+    return [rnd.choice(shapes) for _ in range(n)]
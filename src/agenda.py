@@ -0,0 +1,260 @@
+# --- START OF FILE src/agenda.py ---
+"""
+Modelo único da agenda para todas as visões (painel do Telegram, árvores diff/ansi,
+!tree do Discord, resumo periódico).
+
+A agenda é agrupada tipo → matéria → eventos e ordenada por data uma vez só; cada
+evento vira um Entry com a data já interpretada e os dias até hoje. Os renderers
+só percorrem a estrutura pronta e geram linhas.
+"""
+from datetime import datetime, timedelta
+from src.utils import parse_smart_date
+
+PRIORITY_TIPOS = ["Provas", "Trabalhos"]
+TAGS = {"critical": "[URG]", "medium": "[MED]"}
+NO_DATE = 999  # delta dos eventos com data ilegível (vão para o fim)
+
+class Entry:
+    __slots__ = ("tipo", "materia", "data", "prio", "obs", "when", "delta")
+
+    def __init__(self, tipo, materia, data, prio, obs, when, delta):
+        self.tipo = tipo
+        self.materia = materia
+        self.data = data
+        self.prio = prio
+        self.obs = obs
+        self.when = when    # datetime ou None
+        self.delta = delta  # dias até hoje (NO_DATE se sem data)
+
+def _date_key(e):
+    return e.when or datetime.max
+
+class Agenda:
+    __slots__ = ("today", "entries", "groups")
+
+    def __init__(self, today, entries, groups):
+        self.today = today
+        self.entries = entries  # ordem original (resumo)
+        self.groups = groups    # [(tipo, [(materia, [Entry por data])])], tipos e matérias em ordem alfabética
+
+    def __len__(self):
+        return len(self.entries)
+
+    def ordered_groups(self):
+        """Grupos com Provas e Trabalhos na frente (ordem das árvores de alerta)."""
+        by_tipo = dict(self.groups)
+        tipos = [t for t in PRIORITY_TIPOS if t in by_tipo] + [t for t, _ in self.groups if t not in PRIORITY_TIPOS]
+        return [(t, by_tipo[t]) for t in tipos]
+
+def build_agenda(tasks, today):
+    """Agenda agrupada e ordenada. today é um date (dia de referência para o delta)."""
+    parsed = {}  # data → (datetime, delta): a mesma data se repete muito numa agenda
+    entries = []
+    dados = {}
+    for t in tasks:
+        data = t.get('data', '')
+        hit = parsed.get(data)
+        if hit is None:
+            when = parse_smart_date(data)
+            hit = parsed[data] = (when, (when.date() - today).days if when else NO_DATE)
+        e = Entry(t.get('tipo', 'Geral'), t['materia'], data, t.get('prioridade', 'low'), t.get('observacoes', ''), *hit)
+        entries.append(e)
+        dados.setdefault(e.tipo, {}).setdefault(e.materia, []).append(e)
+
+    groups = [
+        (tipo, [(materia, sorted(materias[materia], key=_date_key)) for materia in sorted(materias)])
+        for tipo, materias in sorted(dados.items())
+    ]
+    return Agenda(today, entries, groups)
+
+def _branches(items):
+    """(é o último, item) para desenhar ├── / └──."""
+    last = len(items) - 1
+    return ((k == last, it) for k, it in enumerate(items))
+
+# =========================================
+#       TELEGRAM: PAINEL (vertical / horizontal)
+# =========================================
+
+def doc_line(e):
+    icon = "🚨" if e.prio == 'critical' else ("⚠️" if e.prio == 'medium' else "")
+    return " ".join([p for p in (e.obs, e.data, icon) if p])
+
+def painel_lines(agenda, layout, titulo):
+    yield titulo
+    for tipo, materias in agenda.groups:
+        yield f"\n: : *{tipo}* : :"
+        for is_last_mat, (materia, docs) in _branches(materias):
+            prefix = "└──" if is_last_mat else "├──"
+            yield f"`{prefix} {materia}`"
+            indent = "    " if is_last_mat else "│   "
+
+            if layout == "horizontal":
+                formatted = [doc_line(e) for e in docs]
+                for k in range(0, len(formatted), 2):
+                    conn = "└──" if k+2 >= len(formatted) else "├──"
+                    yield f"`{indent}{conn} {' - '.join(formatted[k:k+2])}`"
+            else:
+                for is_last, e in _branches(docs):
+                    conn = "└──" if is_last else "├──"
+                    yield f"`{indent}{conn} {doc_line(e)}`"
+
+# =========================================
+#       ÁRVORE DE ALERTA (diff no Telegram / ansi no Discord)
+# =========================================
+
+ESC = "\u001b["
+RESET = f"{ESC}0m"
+COR_TITULO    = f"{ESC}1;37m" # BRANCO (Categorias)
+COR_TAG_TEXT  = f"{ESC}1;37m" # BRANCO (Flags [URG])
+COR_ESTRUTURA = f"{ESC}0;34m" # Azul Escuro (Árvore)
+COR_MATERIA   = f"{ESC}1;35m" # Roxo (Eventos)
+COR_URGENTE   = f"{ESC}1;31m" # Vermelho (Para a DATA)
+COR_MEDIO     = f"{ESC}1;33m" # Amarelo (Para a DATA)
+COR_BAIXO     = f"{ESC}0;34m" # Azul (Para a DATA e Obs)
+
+def _ansi_color(e, mode):
+    if e.delta < 0 or e.prio == 'critical': return COR_URGENTE
+    if mode == 'smart' and e.delta <= 7: return COR_URGENTE
+    if e.prio == 'medium' or (mode == 'smart' and e.delta <= 30): return COR_MEDIO
+    return COR_BAIXO
+
+def _diff_line(e, mode, content):
+    # Diff não suporta cores livres: '-' vermelho/cinza, aspas laranja
+    if e.delta < 0: return f"-  {content}"
+    if mode == 'manual':
+        if e.prio == 'critical': return f"-  {content}"
+        if e.prio == 'medium': return f"'  {content}'"
+    else:
+        if e.prio == 'critical' or e.delta <= 7: return f"-  {content}"
+        if e.prio == 'medium' or e.delta <= 30: return f"'  {content}'"
+    return f"   {content}"
+
+def tree_lines(agenda, mode='smart', style='diff'):
+    ansi = style == 'ansi'
+    if ansi: yield "```ansi"
+    else:
+        yield "🌲 *Visão Geral*"
+        yield "```diff"
+
+    for tipo, materias in agenda.ordered_groups():
+        if ansi: yield f"\n{COR_TITULO}: : {tipo.upper()} : :{RESET}"
+        else: yield f"+ : : {tipo.upper()} : :"
+
+        for is_last_mat, (materia, docs) in _branches(materias):
+            prefix = "└──" if is_last_mat else "├──"
+            if ansi: yield f"{COR_ESTRUTURA}{prefix} {RESET}{COR_MATERIA}{materia}{RESET}"
+            else: yield f"#  {prefix} {materia}"
+            indent = "    " if is_last_mat else "│   "
+
+            for is_last, e in _branches(docs):
+                conn = "└──" if is_last else "├──"
+                tag = TAGS.get(e.prio, "[LOW]")
+                obs_str = f"({e.obs}) " if e.obs else ""
+                if ansi:
+                    yield (
+                        f"{COR_ESTRUTURA}{indent}{conn} {RESET}"
+                        f"{COR_BAIXO}{obs_str}{RESET}"
+                        f"{_ansi_color(e, mode)}{e.data}{RESET} "
+                        f"{COR_TAG_TEXT}{tag}{RESET}"
+                    )
+                else:
+                    yield _diff_line(e, mode, f"{indent}{conn} {obs_str}{e.data} {tag}")
+    yield "```"
+
+def generate_ascii_tree(tasks, mode='smart', style='diff', today=None):
+    if not tasks: return "📭 *Lista vazia!*"
+    # Sem today: dia de Brasília, como o painel e o resumo (o servidor roda em UTC)
+    today = today or (datetime.utcnow() - timedelta(hours=3)).date()
+    return "\n".join(tree_lines(build_agenda(tasks, today), mode, style))
+
+# =========================================
+#       DISCORD: !tree (ini v/h e notify)
+# =========================================
+
+LOGO = r"""
+ ___  ___  ________ ________  ________  _________
+|\  \|\  \|\  _____\\   ____\|\   __  \|\___   ___\
+\ \  \\\  \ \  \__/\ \  \___|\ \  \|\  \|___ \  \_|
+ \ \  \\\  \ \   __\\ \  \    \ \   __  \   \ \  \
+  \ \  \\\  \ \  \_| \ \  \____\ \  \ \  \   \ \  \
+   \ \_______\ \__\   \ \_______\ \__\ \__\   \ \__\
+    \|_______|\|__|    \|_______|\|__|\|__|    \|__|
+"""
+LOGO_BLOCK = f"```ansi\n{COR_MATERIA}{LOGO}{RESET}\n```"
+
+def _notify_color(e, notify_mode):
+    color = COR_URGENTE if e.prio == 'critical' else (COR_MEDIO if e.prio == 'medium' else COR_BAIXO)
+    if notify_mode == 'smart':
+        if e.delta <= 7: color = COR_URGENTE
+        elif e.delta <= 30 and e.prio != 'critical': color = COR_MEDIO
+    return color
+
+def notify_lines(agenda, notify_mode='smart'):
+    yield "```ansi"
+    for tipo, materias in agenda.ordered_groups():
+        yield f"\n{COR_TITULO}: : {tipo} : :{RESET}"
+        for is_last_mat, (materia, docs) in _branches(materias):
+            prefix = "└──" if is_last_mat else "├──"
+            yield f"{COR_ESTRUTURA}{prefix} {RESET}{COR_MATERIA}{materia}{RESET}"
+            indent = "    " if is_last_mat else "│   "
+            for is_last, e in _branches(docs):
+                conn = "└──" if is_last else "├──"
+                obs_str = f"({e.obs}) " if e.obs else ""
+                # Obs -> Data -> Tag
+                yield (
+                    f"{COR_ESTRUTURA}{indent}{conn} {RESET}"
+                    f"{COR_BAIXO}{obs_str}{RESET}"
+                    f"{_notify_color(e, notify_mode)}{e.data}{RESET} "
+                    f"{COR_TAG_TEXT}{TAGS.get(e.prio, '[LOW]')}{RESET}"
+                )
+    yield "```"
+
+def _ini_item(e):
+    # Mantemos a ordem padrão para o modo INI (não colorido)
+    obs_str = f"{e.obs} " if e.obs else ""
+    tag = f" {TAGS[e.prio]}" if e.prio in TAGS else ""
+    return f"{obs_str}{e.data}{tag}"
+
+def ini_lines(agenda, mode='v'):
+    yield "```ini"
+    yield "[ 🌲 VISÃO HORIZONTAL ]" if mode == 'h' else "[ 🌲 VISÃO VERTICAL ]"
+    for tipo, materias in agenda.groups:
+        yield f"\n[{tipo.upper()}]"
+        for is_last_mat, (materia, docs) in _branches(materias):
+            prefix = "└──" if is_last_mat else "├──"
+            yield f"{prefix} {materia}"
+            indent = "    " if is_last_mat else "│   "
+            items = [_ini_item(e) for e in docs]
+            if mode == 'h':
+                yield f"{indent}└── {' | '.join(items)}"
+            else:
+                for is_last, txt in _branches(items):
+                    yield f"{indent}{'└──' if is_last else '├──'} {txt}"
+    yield "```"
+
+# =========================================
+#       RESUMO PERIÓDICO
+# =========================================
+
+def summary_sections(agenda, mode):
+    """[(categoria, [linhas])] com os eventos futuros que passam no filtro do modo."""
+    grouped = {}
+    for e in agenda.entries:
+        if not e.when or e.delta < 0: continue
+        # Smart: crítico/médio ou até 30 dias; Manual: tudo
+        if mode == 'manual' or e.prio in ('critical', 'medium') or e.delta <= 30:
+            grouped.setdefault(e.tipo, []).append(e)
+
+    sections = []
+    for cat in sorted(grouped):
+        lines = []
+        for e in sorted(grouped[cat], key=_date_key):
+            # Ícones condizentes com a árvore
+            if e.prio == 'critical' or e.delta <= 7: ico = "🚨"
+            elif e.prio == 'medium' or e.delta <= 30: ico = "⚠️"
+            else: ico = "🔹"
+            t_str = "HOJE 🔥" if e.delta == 0 else ("AMANHÃ" if e.delta == 1 else f"em {e.delta}d")
+            lines.append(f"{ico} {e.materia}: {e.data} ({t_str})")
+        sections.append((cat, lines))
+    return sections
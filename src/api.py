@@ -6,6 +6,8 @@ from collections import defaultdict
 from prometheus_fastapi_instrumentator import Instrumentator
 from src.config import Config
 from src.database import db
+from src.read_model import export_agenda
+from src.bus import start_listener
 
 app = FastAPI(
     title="Academic Bot Master",
@@ -14,6 +16,11 @@ app = FastAPI(
 )
 Instrumentator().instrument(app).expose(app)
 
+@app.on_event("startup")
+def start_bus():
+    # Mantém o cache local do read model coerente com as escritas dos outros serviços
+    start_listener()
+
 # ==========================================
 #       🛡️ SISTEMA ANTI-SPAM INTELIGENTE
 # ==========================================
@@ -152,11 +159,8 @@ async def export_json_via_link(token: str):
     
     user_id = user_settings["user_id"]
     
-    # 2. Busca as provas desse usuário (Limpa dados sensíveis)
-    tasks = list(db.provas.find(
-        {"user_id": user_id}, 
-        {"_id": 0, "user_id": 0, "sent_24h": 0}
-    ))
+    # 2. Busca as provas desse usuário no read model (sem dados sensíveis)
+    tasks = export_agenda(user_id)
     
     # 3. Retorna JSON formatado
     return {
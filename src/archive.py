@@ -0,0 +1,54 @@
+# --- START OF FILE src/archive.py ---
+"""
+Armazenamento quente/frio: eventos vencidos há mais de ARCHIVE_GRACE_DAYS saem
+de db.provas e vão (em lotes) para db.provas_archive. O notifier roda o job
+periodicamente; também dá para rodar na mão:
+
+    python -m src.archive
+"""
+from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError
+from src.database import db
+from src.config import Config
+from src.read_model import refresh_agenda
+
+HISTORY_PROJECTION = {"_id": 0, "tipo": 1, "materia": 1, "data": 1, "prioridade": 1, "observacoes": 1, "user_id": 1}
+
+def get_brt_now():
+    return datetime.utcnow() - timedelta(hours=3)
+
+def archive_past_events(grace_days=None, batch_size=None):
+    """Move os eventos vencidos para o arquivo. Retorna quantos foram movidos."""
+    grace = Config.ARCHIVE_GRACE_DAYS if grace_days is None else grace_days
+    batch_size = batch_size or Config.ARCHIVE_BATCH_SIZE
+    now = get_brt_now()
+    cutoff = now - timedelta(days=grace)
+
+    moved = 0
+    users = set()
+    while True:
+        batch = list(db.provas.find({"due_at": {"$lt": cutoff}}).limit(batch_size))
+        if not batch: break
+
+        for doc in batch: doc["archived_at"] = now
+        try:
+            db.provas_archive.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Lote já copiado numa execução interrompida: o _id existente é ignorado
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])): raise
+
+        db.provas.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        users.update(doc["user_id"] for doc in batch)
+        moved += len(batch)
+
+    if users: refresh_agenda(*users)
+    return moved
+
+def load_history(user_ids, limit=200):
+    """Eventos arquivados (mais recentes primeiro), no mesmo formato de db.provas."""
+    if not isinstance(user_ids, (list, tuple, set)): user_ids = [user_ids]
+    cursor = db.provas_archive.find({"user_id": {"$in": list(user_ids)}}, HISTORY_PROJECTION)
+    return list(cursor.sort("due_at", -1).limit(limit))
+
+if __name__ == "__main__":
+    print(f"🗄️ {archive_past_events()} eventos arquivados.")
@@ -0,0 +1,224 @@
+# --- START OF FILE src/bus.py ---
+"""
+Barramento de invalidação entre serviços (api, worker, notifier, discord_bot).
+
+Cada escrita na agenda incrementa a versão do read model (db.agenda_views) e
+gera um evento (user_id, version). Quem mantém cache local registra um handler
+com @on_change e chama start_listener() no boot. Mudanças de agendamento
+(db.user_settings: frequência/modo de alerta) chegam em @on_settings_change;
+só o processo que registra esse handler (notifier) escuta user_settings.
+
+- Mongo em replica set (inclusive single-node): change streams.
+- Mongo standalone: fanout exchange no RabbitMQ, publicado por publish_change()
+  e publish_settings_change().
+
+BUS_MODE=auto|changestream|rabbit|off (padrão auto).
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+import pika
+from src.config import Config
+from src.database import db
+
+_handlers = {"agenda": [], "settings": []}
+_mode = None
+_listening = threading.Event()
+
+def on_change(fn):
+    """Registra fn(user_id, version). user_id=None significa 'limpe tudo' (reconexão)."""
+    _handlers["agenda"].append(fn)
+    return fn
+
+def on_settings_change(fn):
+    """Registra fn(user_id). user_id=None significa 'recarregue tudo' (reconexão)."""
+    _handlers["settings"].append(fn)
+    return fn
+
+def is_listening():
+    return _listening.is_set()
+
+def _dispatch(kind, user_id, version=None):
+    for fn in _handlers[kind]:
+        try:
+            if kind == "agenda": fn(user_id, version)
+            else: fn(user_id)
+        except Exception as e: print(f"⚠️ Bus handler: {e}", flush=True)
+
+def _dispatch_reset():
+    _dispatch("agenda", None)
+    _dispatch("settings", None)
+
+def bus_mode():
+    global _mode
+    if _mode: return _mode
+    if Config.BUS_MODE in ("changestream", "rabbit", "off"):
+        _mode = Config.BUS_MODE
+        return _mode
+    try:
+        hello = db.client.admin.command("hello")
+        _mode = "changestream" if hello.get("setName") else "rabbit"
+    except Exception:
+        _mode = "rabbit"
+    return _mode
+
+# =========================================
+#       PUBLICAÇÃO (fallback RabbitMQ)
+# =========================================
+
+class _Publisher:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.ch = None
+
+    def _connect(self):
+        creds = pika.PlainCredentials(Config.RABBIT_USER, Config.RABBIT_PASS)
+        self.conn = pika.BlockingConnection(pika.ConnectionParameters(host=Config.RABBIT_HOST, credentials=creds))
+        self.ch = self.conn.channel()
+        self.ch.exchange_declare(exchange=Config.BUS_EXCHANGE, exchange_type="fanout")
+
+    def publish(self, body):
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if not self.conn or self.conn.is_closed: self._connect()
+                    self.ch.basic_publish(exchange=Config.BUS_EXCHANGE, routing_key="", body=body)
+                    return
+                except Exception as e:
+                    # Conexão ociosa derrubada pelo broker: reconecta uma vez
+                    self.conn = None
+                    if attempt: print(f"❌ Bus publish: {e}", flush=True)
+
+_publisher = _Publisher()
+
+def publish_change(user_id, version):
+    # Com change streams o próprio Mongo entrega o evento
+    if bus_mode() != "rabbit": return
+    _publisher.publish(json.dumps({"kind": "agenda", "user_id": user_id, "version": version}))
+
+def publish_settings_change(user_id):
+    if bus_mode() != "rabbit": return
+    _publisher.publish(json.dumps({"kind": "settings", "user_id": user_id}))
+
+# =========================================
+#       ESCUTA
+# =========================================
+
+# Só estes campos mudam o agendamento; lease, custom_cats etc. não acordam ninguém
+SETTINGS_FIELDS = ("periodic_interval", "notify_mode", "next_periodic_run")
+
+def _changestream_pipeline():
+    match = [{"ns.coll": "agenda_views"}]
+    # user_settings só para quem tem @on_settings_change (o notifier): cada evento custa um lookup
+    if _handlers["settings"]:
+        touched = [{f"updateDescription.updatedFields.{f}": {"$exists": True}} for f in SETTINGS_FIELDS]
+        touched.append({"updateDescription.removedFields": {"$in": list(SETTINGS_FIELDS)}})
+        match.append({"ns.coll": "user_settings", "$or": [{"operationType": {"$ne": "update"}}] + touched})
+    return [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}, "$or": match}},
+        {"$project": {"ns.coll": 1, "fullDocument.user_id": 1, "fullDocument.version": 1}}
+    ]
+
+def _listen_changestream():
+    pipeline = _changestream_pipeline()
+    resume = None
+    while True:
+        try:
+            with db.watch(pipeline, full_document="updateLookup", resume_after=resume) as stream:
+                _listening.set()
+                _dispatch("agenda", None)  # o que foi cacheado antes de escutar não é confiável
+                for change in stream:
+                    resume = stream.resume_token
+                    doc = change.get("fullDocument") or {}
+                    if "user_id" not in doc: continue
+                    if change["ns"]["coll"] == "agenda_views": _dispatch("agenda", doc["user_id"], doc.get("version"))
+                    else: _dispatch("settings", doc["user_id"])
+        except Exception as e:
+            print(f"⚠️ Bus (change stream): {e}", flush=True)
+        _listening.clear()
+        _dispatch_reset()  # pode ter perdido eventos
+        time.sleep(5)
+
+def _listen_rabbit():
+    def callback(ch, method, properties, body):
+        try:
+            msg = json.loads(body)
+            _dispatch(msg.get("kind", "agenda"), msg["user_id"], msg.get("version"))
+        except Exception as e:
+            print(f"⚠️ Bus msg inválida: {e}", flush=True)
+
+    while True:
+        try:
+            creds = pika.PlainCredentials(Config.RABBIT_USER, Config.RABBIT_PASS)
+            conn = pika.BlockingConnection(pika.ConnectionParameters(host=Config.RABBIT_HOST, credentials=creds))
+            ch = conn.channel()
+            ch.exchange_declare(exchange=Config.BUS_EXCHANGE, exchange_type="fanout")
+            q = ch.queue_declare(queue="", exclusive=True).method.queue
+            ch.queue_bind(exchange=Config.BUS_EXCHANGE, queue=q)
+            ch.basic_consume(queue=q, on_message_callback=callback, auto_ack=True)
+            _listening.set()
+            _dispatch("agenda", None)  # o que foi cacheado antes de escutar não é confiável
+            ch.start_consuming()
+        except Exception as e:
+            print(f"⚠️ Bus (rabbit): {e}", flush=True)
+        _listening.clear()
+        _dispatch_reset()
+        time.sleep(5)
+
+_started = False
+
+def start_listener():
+    global _started
+    if _started or bus_mode() == "off": return
+    _started = True
+    target = _listen_changestream if bus_mode() == "changestream" else _listen_rabbit
+    threading.Thread(target=target, name="change-bus", daemon=True).start()
+    print(f"📡 Bus de invalidação: {bus_mode()}", flush=True)
+
+# =========================================
+#       CACHE LOCAL VERSIONADO
+# =========================================
+
+class VersionedCache:
+    """Cache LRU por user_id; só aceita/mantém valores da versão mais nova conhecida.
+    A versão mais alta anunciada pelo bus fica registrada mesmo sem entrada no cache,
+    para recusar um put atrasado de uma leitura que começou antes da escrita."""
+    def __init__(self, maxsize=5000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.seen = OrderedDict()  # key -> maior versão conhecida
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None: return None
+            self.data.move_to_end(key)
+            return item[1]
+
+    def _see(self, key, version):
+        if version is None: return
+        if self.seen.get(key, version) <= version: self.seen[key] = version
+        self.seen.move_to_end(key)
+        while len(self.seen) > self.maxsize * 2: self.seen.popitem(last=False)
+
+    def put(self, key, version, value):
+        with self.lock:
+            if version is not None and self.seen.get(key, version) > version: return
+            self._see(key, version)
+            self.data[key] = (version, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize: self.data.popitem(last=False)
+
+    def invalidate(self, key, version=None):
+        with self.lock:
+            if key is None:
+                self.data.clear()
+                self.seen.clear()
+                return
+            self._see(key, version)
+            cur = self.data.get(key)
+            if cur is None: return
+            if version is None or cur[0] is None or cur[0] < version: del self.data[key]
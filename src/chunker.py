@@ -0,0 +1,75 @@
+# --- START OF FILE src/chunker.py ---
+"""
+Quebra de mensagens longas no limite de cada plataforma (Discord 2000, Telegram 4096).
+
+Recebe as linhas de um renderer (ou um texto pronto) e vai emitindo mensagens
+conforme enchem, sem montar a string inteira. Corta só entre linhas; um bloco de
+código aberto (```ansi, ```diff...) é fechado no fim do pedaço e reaberto no
+próximo, e linhas maiores que o limite são partidas fora das sequências ANSI.
+"""
+import re
+
+DISCORD_LIMIT = 2000
+TELEGRAM_LIMIT = 4096
+LIMITS = {"discord": DISCORD_LIMIT, "telegram": TELEGRAM_LIMIT}
+
+FENCE = "```"
+_CLOSE = "\n" + FENCE
+_SGR = re.compile(r"\x1b\[[0-9;]*m")
+_RESET = "\x1b[0m"
+
+def _split_long(line, room):
+    """Parte uma linha maior que room sem cortar escapes ANSI; a cor ativa é repetida no pedaço seguinte."""
+    color = ""
+    while len(color) + len(line) > room:
+        cut = room - len(color)
+        esc = line.rfind("\x1b", 0, cut)
+        if esc > 0 and "m" not in line[esc:cut]: cut = esc  # não separa o ESC do seu 'm'
+        head, line = line[:cut], line[cut:]
+        yield color + head
+        sgrs = _SGR.findall(color + head)
+        color = sgrs[-1] if sgrs and sgrs[-1] != _RESET else ""
+    yield color + line
+
+def chunk_messages(source, limit):
+    """Gera mensagens de até limit caracteres a partir de um texto ou de um iterável de linhas."""
+    if isinstance(source, str): source = source.split("\n")
+    buf, size, fence = [], 0, None  # fence: cabeçalho do bloco aberto (ex.: "```ansi")
+
+    lines = iter(source)
+    nxt = next(lines, None)  # uma linha de antecedência: o bloco só abre se a primeira do corpo couber
+    while nxt is not None:
+        line, nxt = nxt, next(lines, None)
+        if line.startswith(FENCE):
+            # Abre/fecha bloco de código; o fechamento sempre cabe (fica reservado)
+            if not fence and buf:
+                body = nxt is not None and not nxt.startswith(FENCE)
+                first = 1 + min(len(nxt), limit - len(line) - 1 - len(_CLOSE)) if body else 0
+                # Cabeçalho + primeira linha + fechamento; senão o bloco começa no próximo pedaço
+                if size + 1 + len(line) + first + len(_CLOSE) > limit:
+                    yield "\n".join(buf)
+                    buf, size = [], 0
+            fence = None if fence else line
+            size += (1 if buf else 0) + len(line)
+            buf.append(line)
+            continue
+
+        room = limit - (len(fence) + 1 + len(_CLOSE) if fence else 0)
+        for piece in (_split_long(line, room) if len(line) > room else (line,)):
+            if buf and size + 1 + len(piece) + (len(_CLOSE) if fence else 0) > limit:
+                # Fecha o bloco neste pedaço e reabre no próximo
+                yield "\n".join(buf) + (_CLOSE if fence else "")
+                buf, size = ([fence], len(fence)) if fence else ([], 0)
+            size += (1 if buf else 0) + len(piece)
+            buf.append(piece)
+    if buf: yield "\n".join(buf) + (_CLOSE if fence else "")
+
+def with_last(iterable):
+    """(é o último, item) com um item de antecedência, para anexar botões/finalizar só no fim."""
+    it = iter(iterable)
+    try: prev = next(it)
+    except StopIteration: return
+    for item in it:
+        yield False, prev
+        prev = item
+    yield True, prev
@@ -0,0 +1,128 @@
+# --- START OF FILE src/commands.py ---
+"""
+Registro de comandos compartilhado pelo worker (Telegram) e pelo bot do Discord.
+
+Texto: o nome do comando (e os aliases) resolve o handler num dict, então o custo
+do despacho não cresce com o número de comandos. Cada comando declara como quer
+os argumentos (parse="cli" → args/flags, parse="tokens" → lista crua), que são
+tokenizados uma vez por mensagem antes de chamar o handler.
+
+Botões: callback_data "prefixo:resto" encontra o handler pelo prefixo (ou pelo
+valor exato) no mesmo tipo de dict.
+
+Toda execução passa pelos hooks (por padrão, as métricas Prometheus abaixo).
+"""
+import time
+from prometheus_client import Counter, Histogram
+from src.utils import tokenize, parse_cli_args
+
+COMMAND_LATENCY = Histogram('academic_command_seconds', 'Tempo por comando', ['platform', 'command'])
+COMMAND_ERRORS = Counter('academic_command_errors_total', 'Comandos que lançaram exceção', ['platform', 'command'])
+
+def prometheus_hook(platform, name, seconds, failed):
+    COMMAND_LATENCY.labels(platform, name).observe(seconds)
+    if failed: COMMAND_ERRORS.labels(platform, name).inc()
+
+class Invocation:
+    """Uma mensagem de comando já separada e com os argumentos tokenizados."""
+    __slots__ = ("name", "body", "msg_id", "tokens", "args", "flags")
+
+    def __init__(self, name, body, msg_id=None):
+        self.name = name
+        self.body = body
+        self.msg_id = msg_id
+        self.tokens = None
+        self.args = None
+        self.flags = None
+
+class Command:
+    __slots__ = ("name", "fn", "parse", "min_args", "usage")
+
+    def __init__(self, name, fn, parse, min_args, usage):
+        self.name = name          # nome canônico (rótulo da métrica)
+        self.fn = fn
+        self.parse = parse        # None, "cli" ou "tokens"
+        self.min_args = min_args  # abaixo disso chama usage(user_id, inv)
+        self.usage = usage
+
+class Registry:
+    def __init__(self, platform):
+        self.platform = platform
+        self.commands = {}   # nome/alias → Command
+        self.callbacks = {}  # "prefixo:" ou callback_data exato → (nome, fn)
+        self.fallback = None
+        self.hooks = [prometheus_hook]
+
+    # =========================================
+    #       REGISTRO
+    # =========================================
+
+    def command(self, *names, parse=None, min_args=0, usage=None):
+        def deco(fn):
+            cmd = Command(names[0], fn, parse, min_args, usage)
+            for n in names:
+                if n in self.commands: raise ValueError(f"Comando duplicado: {n}")
+                self.commands[n] = cmd
+            return fn
+        return deco
+
+    def callback(self, key):
+        """key terminando em ':' casa com qualquer callback_data com esse prefixo."""
+        def deco(fn):
+            if key in self.callbacks: raise ValueError(f"Callback duplicado: {key}")
+            self.callbacks[key] = (key.rstrip(":"), fn)
+            return fn
+        return deco
+
+    def unknown(self, fn):
+        """Handler para comandos não registrados: fn(user_id, inv)."""
+        self.fallback = fn
+        return fn
+
+    # =========================================
+    #       DESPACHO
+    # =========================================
+
+    @staticmethod
+    def split(text):
+        """'/Add Provas ...' → ('add', 'Provas ...')."""
+        parts = text.strip().split(maxsplit=1)
+        if not parts: return "", ""
+        name = parts[0].lower()
+        if name.startswith("/"): name = name[1:]
+        return name, parts[1].strip() if len(parts) > 1 else ""
+
+    def dispatch(self, user_id, name, body, msg_id=None):
+        inv = Invocation(name, body, msg_id)
+        cmd = self.commands.get(name)
+        if cmd is None:
+            if self.fallback: return self.run("unknown", self.fallback, user_id, inv)
+            return None
+        if cmd.parse == "cli":
+            inv.args, inv.flags = parse_cli_args(body)
+            if len(inv.args) < cmd.min_args and cmd.usage: return cmd.usage(user_id, inv)
+        elif cmd.parse == "tokens":
+            inv.tokens = tokenize(body)
+        return self.run(cmd.name, cmd.fn, user_id, inv)
+
+    def press(self, user_id, data, msg_id=None):
+        """Despacha um callback_data de botão; devolve False se ninguém trata."""
+        key, sep, _ = data.partition(":")
+        hit = self.callbacks.get(key + sep) if sep else self.callbacks.get(data)
+        if hit is None: return False
+        name, fn = hit
+        self.run(name, fn, user_id, data, msg_id)
+        return True
+
+    def run(self, name, fn, *args):
+        t0 = time.perf_counter()
+        failed = True
+        try:
+            result = fn(*args)
+            failed = False
+            return result
+        finally:
+            self.observe(name, time.perf_counter() - t0, failed)
+
+    def observe(self, name, seconds, failed=False):
+        for hook in self.hooks: hook(self.platform, name, seconds, failed)
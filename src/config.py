@@ -1,7 +1,68 @@
 import os
+import sys
+
+def _service_name():
+    # SERVICE_NAME vem do docker-compose; sem ele, deduz pelo módulo em execução
+    name = os.getenv("SERVICE_NAME")
+    if name: return name
+    prog = os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else ""
+    if prog.startswith("uvicorn"): return "api"
+    return os.path.splitext(prog)[0] or "worker"
+
+def _shard_ids(value):
+    # "0-3,6" -> [0, 1, 2, 3, 6]; vazio -> None (todos os shards no processo)
+    ids = []
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        lo, _, hi = part.partition("-")
+        ids.extend(range(int(lo), int(hi or lo) + 1))
+    return ids or None
 
 class Config:
+    SERVICE_NAME = _service_name()
+
     MONGO_URI = os.getenv("MONGO_URI")
+
+    # --- MONGO CLIENT: perfil por serviço (sobrescrevível via env MONGO_*) ---
+    MONGO_PROFILES = {
+        # API: muitas requisições curtas, falha rápido
+        "api":         {"maxPoolSize": 50, "minPoolSize": 5, "serverSelectionTimeoutMS": 3000,
+                        "connectTimeoutMS": 3000, "socketTimeoutMS": 5000, "waitQueueTimeoutMS": 2000,
+                        "w": 1, "readPreference": "primaryPreferred"},
+        # Worker: um consumidor por vez, escritas importantes
+        "worker":      {"maxPoolSize": 10, "minPoolSize": 1, "serverSelectionTimeoutMS": 10000,
+                        "connectTimeoutMS": 5000, "socketTimeoutMS": 30000, "waitQueueTimeoutMS": 10000,
+                        "w": "majority", "readPreference": "primary"},
+        # Notifier: poucas queries, podem ser longas (varreduras em lote)
+        "notifier":    {"maxPoolSize": 5, "minPoolSize": 1, "serverSelectionTimeoutMS": 10000,
+                        "connectTimeoutMS": 5000, "socketTimeoutMS": 60000, "waitQueueTimeoutMS": 10000,
+                        "w": 1, "readPreference": "primaryPreferred"},
+        # Discord: concorrência de vários comandos no mesmo processo
+        "discord_bot": {"maxPoolSize": 20, "minPoolSize": 2, "serverSelectionTimeoutMS": 5000,
+                        "connectTimeoutMS": 5000, "socketTimeoutMS": 10000, "waitQueueTimeoutMS": 5000,
+                        "w": 1, "readPreference": "primary"},
+    }
+    MONGO_ENV_OVERRIDES = {
+        "maxPoolSize": "MONGO_MAX_POOL_SIZE",
+        "minPoolSize": "MONGO_MIN_POOL_SIZE",
+        "serverSelectionTimeoutMS": "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+        "connectTimeoutMS": "MONGO_CONNECT_TIMEOUT_MS",
+        "socketTimeoutMS": "MONGO_SOCKET_TIMEOUT_MS",
+        "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+        "w": "MONGO_WRITE_CONCERN",
+        "readPreference": "MONGO_READ_PREFERENCE",
+    }
+    # zstd vem do extra pymongo[zstd] (requirements.txt); snappy exige python-snappy instalado à parte
+    MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zstd,zlib")
+
+    @classmethod
+    def mongo_options(cls, service=None):
+        opts = dict(cls.MONGO_PROFILES.get(service or cls.SERVICE_NAME, cls.MONGO_PROFILES["worker"]))
+        for key, env in cls.MONGO_ENV_OVERRIDES.items():
+            val = os.getenv(env)
+            if val is None or val == "": continue
+            opts[key] = int(val) if val.isdigit() else val
+        if cls.MONGO_COMPRESSORS: opts["compressors"] = cls.MONGO_COMPRESSORS
+        return opts
     RABBIT_HOST = os.getenv("RABBIT_HOST")
     RABBIT_USER = os.getenv("RABBIT_USER")
     RABBIT_PASS = os.getenv("RABBIT_PASS")
@@ -16,6 +77,54 @@ class Config:
     TG_WEBHOOK_SECRET = os.getenv("TG_WEBHOOK_SECRET")
     
     DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+    # Bot do Discord: threads do repositório (≤ maxPoolSize do perfil discord_bot) e métricas
+    DISCORD_DB_WORKERS = int(os.getenv("DISCORD_DB_WORKERS", "16"))
+    DISCORD_METRICS_PORT = int(os.getenv("DISCORD_METRICS_PORT", "8003"))
+    LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))  # segundos entre amostras do atraso do loop
+    # Sharding do gateway: sem DISCORD_SHARD_COUNT o Discord recomenda o total e este processo roda todos.
+    # Vários processos: mesmo DISCORD_SHARD_COUNT em todos e DISCORD_SHARD_IDS diferentes ("0-3", "4-7")
+    DISCORD_SHARD_COUNT = int(os.getenv("DISCORD_SHARD_COUNT") or 0) or None
+    DISCORD_SHARD_IDS = _shard_ids(os.getenv("DISCORD_SHARD_IDS", ""))
+    # Cache de membros: none (só message_content; ctx.author vem na mensagem) | members (intent privilegiada)
+    DISCORD_MEMBER_CACHE = os.getenv("DISCORD_MEMBER_CACHE", "none")
+
+    # Barramento de invalidação de cache (change streams ou fanout no RabbitMQ)
+    BUS_MODE = os.getenv("BUS_MODE", "auto")  # auto | changestream | rabbit | off
+    BUS_EXCHANGE = "x.academic_changes"
+
+    # Arquivo (hot/cold): eventos vencidos há mais de N dias saem de db.provas
+    ARCHIVE_GRACE_DAYS = int(os.getenv("ARCHIVE_GRACE_DAYS", "7"))
+    ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))  # segundos entre execuções
+    ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+
+    # Notifier: envio concorrente (limite de threads por plataforma)
+    TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+    DISCORD_API_URL = os.getenv("DISCORD_API_URL", "https://discord.com/api/v10")
+    DISPATCH_TELEGRAM_WORKERS = int(os.getenv("DISPATCH_TELEGRAM_WORKERS", "8"))
+    DISPATCH_DISCORD_WORKERS = int(os.getenv("DISPATCH_DISCORD_WORKERS", "4"))
+    DISPATCH_TIMEOUT = int(os.getenv("DISPATCH_TIMEOUT", "10"))  # segundos por requisição
+
+    # Limites de envio (token bucket) e retentativas
+    TELEGRAM_RATE = float(os.getenv("TELEGRAM_RATE", "25"))       # msgs/s no bot todo
+    TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # msgs/s por chat
+    DISCORD_RATE = float(os.getenv("DISCORD_RATE", "40"))         # req/s no bot todo
+    DISCORD_CHAT_RATE = float(os.getenv("DISCORD_CHAT_RATE", "1"))
+    CHAT_BURST = int(os.getenv("CHAT_BURST", "3"))                # rajada por chat (resumo + árvore)
+    SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))    # tentativas na hora, antes da outbox
+    SEND_MAX_WAIT = float(os.getenv("SEND_MAX_WAIT", "30"))       # espera máxima na hora (s)
+    SEND_BACKOFF_BASE = float(os.getenv("SEND_BACKOFF_BASE", "1"))
+    OUTBOX_INTERVAL = int(os.getenv("OUTBOX_INTERVAL", "30"))     # drenagem da outbox (s)
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+    OUTBOX_MAX_DELAY = float(os.getenv("OUTBOX_MAX_DELAY", "3600"))
+
+    # Notifier com várias réplicas: duração do lease sobre alertas/resumos reivindicados
+    LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "300"))
+    LEASE_RETRY = int(os.getenv("LEASE_RETRY", "30"))  # reconfere itens presos em lease alheio
+
+    NOTIFIER_METRICS_PORT = int(os.getenv("NOTIFIER_METRICS_PORT", "8002"))
+
+    # Notifier: ressincroniza a agenda de disparos com o banco (rede de segurança do bus)
+    SCHEDULER_RESYNC = int(os.getenv("SCHEDULER_RESYNC", "600"))  # segundos
 
     # chave para bypass de tempo
     ADMIN_KEY = os.getenv("ADMIN_KEY")
@@ -1,10 +1,93 @@
+import threading
+import time
 import pymongo
 import boto3
+from pymongo import monitoring
+from prometheus_client import Gauge, Counter, Histogram
 from botocore.client import Config as BotoConfig
 from src.config import Config
 
+# =========================================
+#       MÉTRICAS DO POOL (MongoDB)
+# =========================================
+POOL_OPEN = Gauge('mongo_pool_connections', 'Conexões abertas no pool', ['service'])
+POOL_IN_USE = Gauge('mongo_pool_checked_out', 'Conexões em uso', ['service'])
+POOL_MAX = Gauge('mongo_pool_max_size', 'maxPoolSize configurado', ['service'])
+POOL_WAIT = Histogram('mongo_pool_checkout_seconds', 'Espera por uma conexão do pool', ['service'],
+                      buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+POOL_FAILS = Counter('mongo_pool_checkout_failures_total', 'Checkouts que falharam', ['service', 'reason'])
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Alimenta as métricas acima para dimensionar maxPoolSize com a concorrência real."""
+    def __init__(self, service):
+        self.service = service
+        self.local = threading.local()
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): POOL_OPEN.labels(self.service).inc()
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): POOL_OPEN.labels(self.service).dec()
+
+    def connection_check_out_started(self, event):
+        self.local.t0 = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        POOL_FAILS.labels(self.service, str(event.reason)).inc()
+        self._observe_wait()
+
+    def connection_checked_out(self, event):
+        POOL_IN_USE.labels(self.service).inc()
+        self._observe_wait()
+
+    def connection_checked_in(self, event): POOL_IN_USE.labels(self.service).dec()
+
+    def _observe_wait(self):
+        t0 = getattr(self.local, "t0", None)
+        if t0 is not None:
+            POOL_WAIT.labels(self.service).observe(time.perf_counter() - t0)
+            self.local.t0 = None
+
+# =========================================
+#       MÉTRICAS DE COMANDOS (MongoDB)
+# =========================================
+MONGO_CMD = Histogram('mongo_command_seconds', 'Tempo de cada comando no servidor', ['service', 'command', 'collection'],
+                      buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+MONGO_CMD_FAILS = Counter('mongo_command_failures_total', 'Comandos com erro', ['service', 'command'])
+# Só comandos de dados (evita cardinalidade com hello/ping/endSessions etc.)
+_DATA_COMMANDS = {"find", "getMore", "aggregate", "count", "distinct", "insert", "update", "delete", "findAndModify"}
+
+class CommandMetrics(monitoring.CommandListener):
+    def __init__(self, service):
+        self.service = service
+        self.collections = {}
+
+    def started(self, event):
+        if event.command_name not in _DATA_COMMANDS: return
+        coll = event.command.get(event.command_name)
+        if event.command_name == "getMore": coll = event.command.get("collection")
+        self.collections[event.request_id] = coll if isinstance(coll, str) else "-"
+
+    def succeeded(self, event):
+        coll = self.collections.pop(event.request_id, None)
+        if coll is not None:
+            MONGO_CMD.labels(self.service, event.command_name, coll).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        if self.collections.pop(event.request_id, None) is not None:
+            MONGO_CMD_FAILS.labels(self.service, event.command_name).inc()
+
 # MongoDB
-mongo_client = pymongo.MongoClient(Config.MONGO_URI)
+mongo_options = Config.mongo_options()
+POOL_MAX.labels(Config.SERVICE_NAME).set(mongo_options.get("maxPoolSize", 100))
+mongo_client = pymongo.MongoClient(
+    Config.MONGO_URI,
+    appname=f"academic-{Config.SERVICE_NAME}",
+    event_listeners=[PoolMetrics(Config.SERVICE_NAME), CommandMetrics(Config.SERVICE_NAME)],
+    **mongo_options
+)
 db = mongo_client.academic_db
 
 # S3 / MinIO
@@ -21,4 +104,4 @@ s3_client = boto3.client(
 try:
     s3_client.create_bucket(Bucket=Config.BUCKET_NAME)
 except:
-    pass
\ No newline at end of file
+    pass
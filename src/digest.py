@@ -0,0 +1,110 @@
+# --- START OF FILE src/digest.py ---
+"""
+Motor do resumo periódico (notifier e botão "Testar Envio" do worker).
+
+O resultado só muda quando a agenda muda (versão do read model) ou o dia vira,
+então fica memoizado por (cluster, versões, modo, data): o resumo é o mesmo para
+Telegram e Discord e só a árvore de cada estilo é montada à parte na mesma entrada.
+
+Numa passada do notifier, os digests de todos os usuários devidos saem de um
+lote (get_digests): um find para todas as contas, uma agenda por cluster e um
+resumo por (cluster, modo), compartilhados entre as contas vinculadas e estilos.
+"""
+import threading
+from collections import OrderedDict
+from src.agenda import build_agenda, tree_lines, summary_sections
+from src.read_model import load_views, flatten_view
+
+MEMO_SIZE = 2000
+
+_memo = OrderedDict()
+_lock = threading.Lock()
+
+class Digest:
+    __slots__ = ("has_tasks", "sections", "tree")
+
+    def __init__(self, has_tasks, sections, tree):
+        self.has_tasks = has_tasks  # a agenda tem algum evento
+        self.sections = sections    # [(categoria, [linhas])], vazio se nada passou no filtro
+        self.tree = tree
+
+    def summary(self, header, bold="**"):
+        lines = [header, ""]
+        for cat, items in self.sections:
+            lines.append(f"📂 {bold}{cat}{bold}")
+            lines.extend(items)
+            lines.append("")
+        return "\n".join(lines)
+
+class _Shared:
+    """Resumo de um (cluster, modo), igual para todas as plataformas; só a árvore
+    depende do estilo e fica em trees conforme cada estilo é pedido."""
+    __slots__ = ("has_tasks", "sections", "trees")
+
+    def __init__(self, has_tasks, sections):
+        self.has_tasks = has_tasks
+        self.sections = sections
+        self.trees = {}
+
+    def missing(self, style):
+        return self.has_tasks and style not in self.trees
+
+    def digest(self, style):
+        return Digest(self.has_tasks, self.sections, self.trees.get(style))
+
+def render_digests(requests, views, today, shared=None):
+    """{pedido: Digest} a partir dos read models já carregados ({user_id: view}).
+    Uma agenda por cluster e um resumo por (cluster, modo), compartilhados entre os pedidos;
+    shared ({(cluster, modo): _Shared}) traz os resumos já prontos e recebe os novos."""
+    shared = {} if shared is None else shared
+    by_cluster = {}
+    for req in requests: by_cluster.setdefault(req[0], []).append(req)
+
+    out = {}
+    for cluster, reqs in by_cluster.items():
+        # Um cluster por vez: a agenda é descartada antes da próxima
+        agenda = None
+        for req in reqs:
+            _, mode, style = req
+            entry = shared.get((cluster, mode))
+            if entry is None or entry.missing(style):
+                if agenda is None:
+                    tasks = [t for uid in cluster if uid in views for t in flatten_view(views[uid])]
+                    agenda = build_agenda(tasks, today) if tasks else False
+                if entry is None: entry = shared[cluster, mode] = _Shared(bool(agenda), summary_sections(agenda, mode) if agenda else [])
+                if agenda: entry.trees[style] = "\n".join(tree_lines(agenda, mode, style))
+            out[req] = entry.digest(style)
+    return out
+
+def get_digests(requests, today):
+    """Digests de vários pedidos (cluster, modo, estilo) de uma vez: um find para todas as
+    contas e o que não está memoizado é montado junto. Devolve {pedido: Digest}."""
+    requests = list(dict.fromkeys((tuple(c), m, s) for c, m, s in requests))
+    views = {v["user_id"]: v for v in load_views(list({uid for c, _, _ in requests for uid in c}))}
+
+    keys, shared = {}, {}
+    with _lock:
+        for cluster, mode, _ in requests:
+            if (cluster, mode) in keys: continue
+            key = (cluster, tuple(views[uid].get("version") for uid in cluster if uid in views), mode, today)
+            keys[cluster, mode] = key
+            hit = _memo.get(key)
+            if hit is not None:
+                _memo.move_to_end(key)
+                shared[cluster, mode] = hit
+
+    todo = [req for req in requests if req[:2] not in shared or shared[req[:2]].missing(req[2])]
+    out = render_digests(todo, views, today, shared) if todo else {}
+    for req in requests:
+        if req not in out: out[req] = shared[req[:2]].digest(req[2])
+    if not todo: return out
+
+    with _lock:
+        for cm in {req[:2] for req in todo}: _memo[keys[cm]] = shared[cm]
+        while len(_memo) > MEMO_SIZE: _memo.popitem(last=False)
+    return out
+
+def get_digest(cluster, mode, style, today):
+    """Digest de um conjunto de contas vinculadas (tupla de ids) para o dia informado."""
+    req = (tuple(cluster), mode, style)
+    return get_digests([req], today)[req]
@@ -1,27 +1,72 @@
 # --- START OF FILE src/discord_bot.py ---
 import discord
+import asyncio
 import os
-import shlex
+import time
 import re
 import json
 import io
 from datetime import datetime, timedelta
 from discord.ext import commands
-from src.database import db
+from prometheus_client import start_http_server, Gauge, Histogram
 from src.config import Config
 from src.utils import (
-    parse_smart_date, parse_cli_args, parse_time_string,
-    format_seconds, singularize, generate_link_code, 
-    validate_link_code, get_linked_ids, unlink_account, 
-    get_partners, unlink_specific
+    parse_smart_date, parse_cli_args, tokenize, parse_time_string,
+    format_seconds, singularize, periodic_fields, PERIODIC_UNSET
 )
-
-# Configurações
+from src.bus import start_listener
+from src.agenda import build_agenda, notify_lines, ini_lines, LOGO_BLOCK
+from src.chunker import chunk_messages, DISCORD_LIMIT
+from src.commands import Registry
+from src.repository import Repository
+
+# Configurações: só as intents que os comandos usam. Sem a de membros o gateway não manda
+# a lista de membros de cada servidor e o cache não cresce com o tamanho dos servidores.
 intents = discord.Intents.default()
 intents.message_content = True
-intents.members = True
+intents.members = Config.DISCORD_MEMBER_CACHE == "members"
+member_cache = discord.MemberCacheFlags.from_intents(intents) if intents.members else discord.MemberCacheFlags.none()
+
+if Config.DISCORD_SHARD_IDS and not Config.DISCORD_SHARD_COUNT:
+    raise SystemExit("❌ DISCORD_SHARD_IDS exige DISCORD_SHARD_COUNT (o total de shards de todos os processos)")
+
+bot = commands.AutoShardedBot(
+    command_prefix=["!", "/"], intents=intents, help_command=None,
+    shard_count=Config.DISCORD_SHARD_COUNT, shard_ids=Config.DISCORD_SHARD_IDS,
+    member_cache_flags=member_cache, chunk_guilds_at_startup=False,
+)
+
+# O discord.ext já despacha por nome; do registro compartilhado usamos os hooks de métrica
+registry = Registry("discord")
+
+# Todo acesso ao Mongo passa pelo repositório (pool de threads): o loop do gateway nunca espera o banco
+repo = Repository()
+
+# Métricas (porta Config.DISCORD_METRICS_PORT)
+LOOP_LAG = Histogram('discord_loop_lag_seconds', 'Atraso do event loop além do intervalo de amostragem',
+                     buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+SHARD_LATENCY = Gauge('discord_shard_latency_seconds', 'Latência do heartbeat de cada shard deste processo', ['shard'])
+
+async def watch_loop_lag(interval):
+    """Dorme interval e mede quanto o loop demorou a acordar: qualquer código bloqueante aparece aqui."""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, time.perf_counter() - t0 - interval))
+        for shard_id, latency in bot.latencies: SHARD_LATENCY.labels(str(shard_id)).set(latency)
+
+@bot.event
+async def setup_hook():
+    # Guarda a referência: task sem dono pode ser coletada pelo GC
+    bot.loop_lag_task = asyncio.create_task(watch_loop_lag(Config.LOOP_LAG_INTERVAL))
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.command_t0 = time.perf_counter()
 
-bot = commands.Bot(command_prefix=["!", "/"], intents=intents, help_command=None)
+@bot.after_invoke
+async def observe_command(ctx):
+    registry.observe(ctx.command.qualified_name, time.perf_counter() - ctx.command_t0, ctx.command_failed)
 
 # --- UTILITÁRIOS ---
 def get_brt_now():
@@ -31,190 +76,30 @@ def regex_ci(value):
     """Cria regex Case Insensitive para o Mongo"""
     return {"$regex": f"^{re.escape(str(value).strip())}$", "$options": "i"}
 
-async def send_chunked_message(ctx, text):
+async def send_chunked_message(ctx, lines):
     """
-    Envia mensagens longas (>2000 chars) dividindo-as em pedaços,
-    preservando a formatação de bloco de código (ansi/ini).
+    Envia um texto ou as linhas de um renderer em mensagens de até 2000 chars,
+    fechando e reabrindo o bloco de código (ansi/ini) a cada pedaço.
     """
-    if len(text) <= 2000:
-        await ctx.send(text)
-        return
-
-    # Detecta o tipo de bloco de código (ansi ou ini)
-    lines = text.split('\n')
-    block_type = ""
-    
-    # Remove as crases iniciais e finais para processar o miolo
-    clean_lines = []
-    if lines[0].startswith("```"):
-        block_type = lines[0].replace("```", "").strip()
-        lines = lines[1:] # Remove primeira linha
-    
-    if lines and lines[-1].strip() == "```":
-        lines = lines[:-1] # Remove ultima linha
-
-    # Monta os chunks
-    current_chunk = f"```{block_type}\n"
-    
-    for line in lines:
-        # Verifica se adicionar a próxima linha estoura o limite
-        # 2000 - len(```) - margem de segurança
-        if len(current_chunk) + len(line) + 5 > 1990:
-            current_chunk += "```"
-            await ctx.send(current_chunk)
-            # Reinicia o chunk com o cabeçalho
-            current_chunk = f"```{block_type}\n{line}\n"
-        else:
-            current_chunk += f"{line}\n"
-
-    # Envia o restante se houver
-    if len(current_chunk) > len(f"```{block_type}\n"):
-        current_chunk += "```"
-        await ctx.send(current_chunk)
+    for chunk in chunk_messages(lines, DISCORD_LIMIT):
+        await ctx.send(chunk)
 
 def generate_discord_tree(tasks, mode='v', notify_mode='smart'):
     if not tasks: return None, "📭 *Agenda vazia.*"
-
-    now = get_brt_now()
-    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    dados = {}
-    for p in tasks:
-        tipo = p.get('tipo', 'Geral')
-        if tipo not in dados: dados[tipo] = {}
-        if p['materia'] not in dados[tipo]: dados[tipo][p['materia']] = []
-        dados[tipo][p['materia']].append(p)
-
-    lines = []
-    logo_output = None
-
+    agenda = build_agenda(tasks, get_brt_now().date())
     # --- MODO NOTIFY (ANSI COLORIDO) ---
-    if mode == 'notify':
-        ESC = "\u001b["
-        RESET = f"{ESC}0m"
-        
-        # CORES ATUALIZADAS
-        COR_TITULO    = f"{ESC}1;37m" # BRANCO
-        COR_TAG_TEXT  = f"{ESC}1;37m" # BRANCO
-        
-        COR_ESTRUTURA = f"{ESC}0;34m" # Azul Escuro
-        COR_MATERIA   = f"{ESC}1;35m" # Roxo
-        
-        COR_URGENTE   = f"{ESC}1;31m" # Vermelho
-        COR_MEDIO     = f"{ESC}1;33m" # Amarelo
-        COR_BAIXO     = f"{ESC}0;34m" # Azul
-
-        arte = r"""
- ___  ___  ________ ________  ________  _________
-|\  \|\  \|\  _____\\   ____\|\   __  \|\___   ___\
-\ \  \\\  \ \  \__/\ \  \___|\ \  \|\  \|___ \  \_|
- \ \  \\\  \ \   __\\ \  \    \ \   __  \   \ \  \
-  \ \  \\\  \ \  \_| \ \  \____\ \  \ \  \   \ \  \
-   \ \_______\ \__\   \ \_______\ \__\ \__\   \ \__\
-    \|_______|\|__|    \|_______|\|__|\|__|    \|__|
-"""
-        logo_output = f"```ansi\n{COR_MATERIA}{arte}{RESET}\n```"
-        lines.append("```ansi")
-        
-        tipos = sorted(dados.keys())
-        priority = ["Provas", "Trabalhos"]
-        tipos = priority + [x for x in tipos if x not in priority]
-        tipos = [t for t in tipos if t in dados]
-
-        for tipo in tipos:
-            lines.append(f"\n{COR_TITULO}: : {tipo} : :{RESET}")
-            materias = sorted(dados[tipo].keys())
-            for j, materia in enumerate(materias):
-                prefix = "└──" if j == len(materias)-1 else "├──"
-                lines.append(f"{COR_ESTRUTURA}{prefix} {RESET}{COR_MATERIA}{materia}{RESET}")
-                docs = sorted(dados[tipo][materia], key=lambda x: parse_smart_date(x['data']) or datetime.max)
-                indent = "    " if prefix == "└──" else "│   "
-                
-                for k, d in enumerate(docs):
-                    dt_obj = parse_smart_date(d['data'])
-                    delta_days = (dt_obj - today).days if dt_obj else 999
-                    prio = d.get('prioridade', 'low')
-                    
-                    obs = d.get('observacoes', '')
-                    obs_str = f"({obs}) " if obs else ""
-                    
-                    # Definição do Texto da TAG
-                    tag_text = "[LOW]"
-                    if prio == 'critical': tag_text = "[URG]"
-                    elif prio == 'medium': tag_text = "[MED]"
-
-                    # Definição da COR da DATA
-                    final_color = COR_BAIXO # Padrão Azul
-                    
-                    if prio == 'critical': 
-                        final_color = COR_URGENTE
-                    elif prio == 'medium': 
-                        final_color = COR_MEDIO
-
-                    if notify_mode == 'smart':
-                        if delta_days < 0 or delta_days <= 7:
-                            final_color = COR_URGENTE
-                        elif delta_days <= 30 and prio != 'critical':
-                            final_color = COR_MEDIO
-                    
-                    content = d['data']
-                    conn = "└──" if k == len(docs)-1 else "├──"
-                    
-                    # MONTAGEM DA LINHA: Obs -> Data -> Tag
-                    str_line = (
-                        f"{COR_ESTRUTURA}{indent}{conn} {RESET}"
-                        f"{COR_BAIXO}{obs_str}{RESET}"
-                        f"{final_color}{content}{RESET} "
-                        f"{COR_TAG_TEXT}{tag_text}{RESET}"
-                    )
-                    lines.append(str_line)
-        lines.append("```")
-        return logo_output, "\n".join(lines)
-
+    if mode == 'notify': return LOGO_BLOCK, notify_lines(agenda, notify_mode)
     # --- MODOS V/H (INI) ---
-    else:
-        lines.append("```ini")
-        if mode == 'h': lines.append("[ 🌲 VISÃO HORIZONTAL ]")
-        else: lines.append("[ 🌲 VISÃO VERTICAL ]")
-        
-        tipos = sorted(dados.keys())
-        for tipo in tipos:
-            lines.append(f"\n[{tipo.upper()}]")
-            materias = sorted(dados[tipo].keys())
-            
-            for j, materia in enumerate(materias):
-                is_last_mat = (j == len(materias)-1)
-                prefix = "└──" if is_last_mat else "├──"
-                lines.append(f"{prefix} {materia}")
-                
-                docs = sorted(dados[tipo][materia], key=lambda x: parse_smart_date(x['data']) or datetime.max)
-                indent = "    " if is_last_mat else "│   "
-                items_formatted = []
-                for d in docs:
-                    prio = d.get('prioridade', 'low')
-                    obs = d.get('observacoes', '')
-                    obs_str = f"{obs} " if obs else ""
-                    tag = ""
-                    if prio == 'critical': tag = " [URG]"
-                    elif prio == 'medium': tag = " [MED]"
-                    # Mantemos a ordem padrão para o modo INI (não colorido)
-                    items_formatted.append(f"{obs_str}{d['data']}{tag}")
-
-                if mode == 'h':
-                    joined = " | ".join(items_formatted)
-                    lines.append(f"{indent}└── {joined}")
-                else:
-                    for k, item_txt in enumerate(items_formatted):
-                        conn = "└──" if k == len(items_formatted)-1 else "├──"
-                        lines.append(f"{indent}{conn} {item_txt}")
-
-        lines.append("```")
-        return None, "\n".join(lines)
+    return None, ini_lines(agenda, mode)
         
 # --- EVENTOS ---
+@bot.event
+async def on_shard_ready(shard_id):
+    print(f"🧩 Shard {shard_id}/{bot.shard_count} pronto ({sum(1 for g in bot.guilds if g.shard_id == shard_id)} servidores)", flush=True)
+
 @bot.event
 async def on_ready():
-    print(f'🎮 Discord CLI Online: {bot.user}')
+    print(f'🎮 Discord CLI Online: {bot.user} (shards {sorted(bot.shards)} de {bot.shard_count})')
     await bot.change_presence(activity=discord.Game(name="!help | !tree"))
 
 # --- COMANDO: !help ---
@@ -251,7 +136,8 @@ async def help_cmd(ctx):
         "`!tree v` ou `!tree f` (Vertical)\n"
         "`!tree notify` (Visualização de Alerta)\n"
         "`!list cat` (Ver categorias)\n"
-        "`!list event` (Lista vertical)"
+        "`!list event` (Lista vertical)\n"
+        "`!history` (Eventos vencidos arquivados)"
     )
     embed.add_field(name="🌲 Visualização", value=view_txt, inline=False)
 
@@ -278,14 +164,10 @@ async def add(ctx, *, args_str: str = ""):
              return
 
         cat = args[0].title()
-        ids = get_linked_ids(ctx.author.id)
+        ids = await repo.linked_ids(ctx.author.id)
 
         if len(args) == 1:
-            db.user_settings.update_one(
-                {"user_id": ctx.author.id}, 
-                {"$addToSet": {"custom_cats": cat}}, 
-                upsert=True
-            )
+            await repo.add_category(ctx.author.id, cat)
             await ctx.send(f"✅ Categoria **{cat}** criada/verificada.")
             return
 
@@ -318,18 +200,15 @@ async def add(ctx, *, args_str: str = ""):
             "origin": "discord"
         }
 
-        db.provas.insert_one(item)
-        db.user_settings.update_one(
-            {"user_id": ctx.author.id}, 
-            {"$addToSet": {"custom_cats": cat}}, 
-            upsert=True
-        )
+        if not await repo.add_event(item):
+            await ctx.send(f"♻️ **{mat}** em `{item['data']}` já está na agenda.")
+            return
 
         prio_icon = "🚨" if prio == "critical" else ("⚠️" if prio == "medium" else "🟢")
         await ctx.send(f"✅ **Agendado!**\n📂 {cat} | 📅 {dt_obj.strftime('%d/%m/%Y')} | {prio_icon} {mat}")
         
         # USA A NOVA FUNÇÃO DE CHUNK
-        tasks = list(db.provas.find({"user_id": {"$in": ids}}).sort("data", 1))
+        tasks = await repo.agenda(ids)
         logo, tree_str = generate_discord_tree(tasks, mode='v')
         
         if logo: await ctx.send(logo)
@@ -355,7 +234,7 @@ async def edit(ctx, *, args_str: str = ""):
         await ctx.send("⚠️ Origem vazia.")
         return
 
-    ids = get_linked_ids(ctx.author.id)
+    ids = await repo.linked_ids(ctx.author.id)
     query = {"user_id": {"$in": ids}}
     
     scope = "unknown"
@@ -382,7 +261,7 @@ async def edit(ctx, *, args_str: str = ""):
         await ctx.send("⚠️ Origem inválida.")
         return
 
-    count = db.provas.count_documents(query)
+    count = await repo.count(query)
     if count == 0:
         await ctx.send(f"🚫 Nada encontrado para: **{desc}**")
         return
@@ -392,17 +271,15 @@ async def edit(ctx, *, args_str: str = ""):
     if scope == "category":
         if len(args_rhs) >= 1:
             new_cat = args_rhs[0].title()
-            res = db.provas.update_many(query, {"$set": {"tipo": new_cat}})
-            db.user_settings.update_one({"user_id": ctx.author.id}, {"$addToSet": {"custom_cats": new_cat}}, upsert=True)
-            db.user_settings.update_one({"user_id": ctx.author.id}, {"$pull": {"custom_cats": args_lhs[0]}})
-            await ctx.send(f"✅ Categoria renomeada para **{new_cat}** ({res.modified_count} itens).")
+            modified = await repo.rename_category(ids, ctx.author.id, query, args_lhs[0], new_cat)
+            await ctx.send(f"✅ Categoria renomeada para **{new_cat}** ({modified} itens).")
             return
 
     elif scope == "event":
         if len(args_rhs) >= 1:
             new_cat = args_rhs[0].title()
             update_set["tipo"] = new_cat
-            db.user_settings.update_one({"user_id": ctx.author.id}, {"$addToSet": {"custom_cats": new_cat}}, upsert=True)
+            await repo.add_category(ctx.author.id, new_cat)
         if len(args_rhs) >= 2:
             update_set["materia"] = args_rhs[1]
 
@@ -410,7 +287,7 @@ async def edit(ctx, *, args_str: str = ""):
         if len(args_rhs) >= 1:
             new_cat = args_rhs[0].title()
             update_set["tipo"] = new_cat
-            db.user_settings.update_one({"user_id": ctx.author.id}, {"$addToSet": {"custom_cats": new_cat}}, upsert=True)
+            await repo.add_category(ctx.author.id, new_cat)
         if len(args_rhs) >= 2:
             update_set["materia"] = args_rhs[1]
         if len(args_rhs) >= 3:
@@ -424,11 +301,11 @@ async def edit(ctx, *, args_str: str = ""):
         await ctx.send("⚠️ Nenhuma alteração detectada.")
         return
 
-    res = db.provas.update_many(query, {"$set": update_set})
-    await ctx.send(f"✅ **Editado!** {res.modified_count} itens atualizados.")
+    modified = await repo.update_events(ids, query, update_set)
+    await ctx.send(f"✅ **Editado!** {modified} itens atualizados.")
     
     # USA A NOVA FUNÇÃO DE CHUNK
-    tasks = list(db.provas.find({"user_id": {"$in": ids}}).sort("data", 1))
+    tasks = await repo.agenda(ids)
     logo, tree_str = generate_discord_tree(tasks, 'v')
     if logo: await ctx.send(logo)
     await send_chunked_message(ctx, tree_str)
@@ -437,12 +314,12 @@ async def edit(ctx, *, args_str: str = ""):
 @bot.command(name="del", aliases=["rm", "delete"])
 async def delete(ctx, *, args_str: str = ""):
     try:
-        args = shlex.split(args_str)
+        args = tokenize(args_str)
         if not args:
             await ctx.send("⚠️ Diga o que apagar. Ex: `!del Provas`")
             return
 
-        ids = get_linked_ids(ctx.author.id)
+        ids = await repo.linked_ids(ctx.author.id)
         cat = args[0]
         query = {
             "user_id": {"$in": ids},
@@ -462,20 +339,15 @@ async def delete(ctx, *, args_str: str = ""):
                 query["data"] = dt_obj.strftime("%d/%m/%Y")
                 msg_alvo += f" na data {query['data']}"
 
-        total = db.provas.count_documents(query)
+        total = await repo.count(query)
         
         if total == 0:
             await ctx.send(f"🚫 **Nada encontrado para:** {msg_alvo}")
             return
 
-        if len(args) == 1:
-             db.user_settings.update_many(
-                 {"user_id": {"$in": ids}},
-                 {"$pull": {"custom_cats": cat}}
-             )
-
-        res = db.provas.delete_many(query)
-        await ctx.send(f"🗑️ **Apagado!** {res.deleted_count} itens removidos.")
+        # Só a categoria inteira sai também das categorias criadas
+        deleted = await repo.delete_events(ids, query, drop_cat=cat if len(args) == 1 else None)
+        await ctx.send(f"🗑️ **Apagado!** {deleted} itens removidos.")
 
     except Exception as e:
         await ctx.send(f"❌ Erro: {e}")
@@ -494,15 +366,15 @@ async def tree(ctx, mode: str = None):
         await ctx.send("⚠️ Opção inválida. Use: `v`, `h` ou `notify`.")
         return
 
-    ids = get_linked_ids(ctx.author.id)
+    ids = await repo.linked_ids(ctx.author.id)
     
     # 1. Busca configurações do usuário
-    user_settings = db.user_settings.find_one({"user_id": ctx.author.id}) or {}
+    user_settings = await repo.settings(ctx.author.id)
     
     # 2. Extrai apenas o modo ('smart' ou 'manual')
     current_notify_mode = user_settings.get("notify_mode", "smart")
 
-    tasks = list(db.provas.find({"user_id": {"$in": ids}}).sort("data", 1))
+    tasks = await repo.agenda(ids)
     
     # 3. CORREÇÃO AQUI: Passamos 'notify_mode' (string) em vez de 'notify_settings' (dict)
     logo, tree_str = generate_discord_tree(tasks, mode=mode, notify_mode=current_notify_mode)
@@ -512,10 +384,22 @@ async def tree(ctx, mode: str = None):
         
     await send_chunked_message(ctx, tree_str)
 
+# --- COMANDO: !history ---
+@bot.command(name="history", aliases=["historico"])
+async def history(ctx):
+    ids = await repo.linked_ids(ctx.author.id)
+    antigos = await repo.history(ids)
+    if not antigos:
+        await ctx.send("🗄️ **Histórico vazio.** Eventos vencidos aparecem aqui depois de arquivados.")
+        return
+    await ctx.send("🗄️ **Histórico (Arquivados)**")
+    logo, tree_str = generate_discord_tree(antigos, mode='v')
+    await send_chunked_message(ctx, tree_str)
+
 # --- COMANDO: !list (Atualizado) ---
 @bot.command(name="list", aliases=["ls", "agenda"])
 async def list_cmd(ctx, sub: str = None):
-    ids = get_linked_ids(ctx.author.id)
+    ids = await repo.linked_ids(ctx.author.id)
     
     if not sub:
         await ctx.send("Use: `!list cat` ou `!list event`")
@@ -524,16 +408,8 @@ async def list_cmd(ctx, sub: str = None):
     sub = sub.lower()
 
     if sub in ["cat", "cats"]:
-        settings = list(db.user_settings.find({"user_id": {"$in": ids}}))
-        all_cats = set(["Provas", "Trabalhos"])
-        for s in settings:
-            for c in s.get("custom_cats", []): all_cats.add(c)
-        used_cats = db.provas.distinct("tipo", {"user_id": {"$in": ids}})
-        for c in used_cats: all_cats.add(c)
-            
         lines = []
-        for c in sorted(list(all_cats)):
-            count = db.provas.count_documents({"user_id": {"$in": ids}, "tipo": c})
+        for c, count in await repo.category_counts(ids):
             status = f"({count} itens)" if count > 0 else "(Vazia)"
             lines.append(f"• **{c}** {status}")
             
@@ -541,7 +417,7 @@ async def list_cmd(ctx, sub: str = None):
         await ctx.send(embed=embed)
 
     elif sub in ["event", "events"]:
-        tasks = list(db.provas.find({"user_id": {"$in": ids}}).sort("data", 1))
+        tasks = await repo.agenda(ids)
         
         # O modo 'v' retorna logo=None, mas é bom manter o padrão
         logo, tree_str = generate_discord_tree(tasks, mode='v')
@@ -558,11 +434,11 @@ async def list_cmd(ctx, sub: str = None):
 async def alert(ctx, *, args_str: str = ""):
     # --- TESTE VISUAL (CORRIGIDO) ---
     if "test" in args_str.lower():
-        ids = get_linked_ids(ctx.author.id)
-        tasks = list(db.provas.find({"user_id": {"$in": ids}}).sort("data", 1))
+        ids = await repo.linked_ids(ctx.author.id)
+        tasks = await repo.agenda(ids)
         
         # Pega a configuração do banco por padrão
-        cfg = db.user_settings.find_one({"user_id": ctx.author.id}) or {}
+        cfg = await repo.settings(ctx.author.id)
         mode_atual = cfg.get("notify_mode", "smart")
         
         # SOBRESCREVE SE TIVER FLAG NO COMANDO
@@ -580,7 +456,7 @@ async def alert(ctx, *, args_str: str = ""):
     # --------------------------------
 
     if "desativar" in args_str.lower():
-        db.user_settings.update_one({"user_id": ctx.author.id}, {"$unset": {"periodic_interval": ""}})
+        await repo.update_settings(ctx.author.id, {"$unset": PERIODIC_UNSET})
         await ctx.send("🔕 Alertas desativados.")
         return
 
@@ -588,8 +464,7 @@ async def alert(ctx, *, args_str: str = ""):
         await ctx.send("🔔 **Alertas:**\nUse `-f TEMPO` (Ex: `!alert -f 12h`).\nUse `-mode smart` ou `-mode manual`.")
         return
 
-    try: args = shlex.split(args_str)
-    except: args = args_str.split()
+    args = tokenize(args_str)
     update_data = {}
     msg_log = []
 
@@ -606,8 +481,7 @@ async def alert(ctx, *, args_str: str = ""):
                     if not bypass and (secs < 3600 or secs > 604800):
                         await ctx.send("⚠️ Tempo deve ser entre 1h e 7 dias.")
                         return
-                    update_data["periodic_interval"] = secs
-                    update_data["last_periodic_run"] = get_brt_now()
+                    update_data.update(periodic_fields(secs, get_brt_now()))
                     msg_log.append(f"Freq: {format_seconds(secs)}")
         except: pass
 
@@ -622,10 +496,10 @@ async def alert(ctx, *, args_str: str = ""):
         except: pass
 
     if update_data:
-        db.user_settings.update_one({"user_id": ctx.author.id}, {"$set": update_data}, upsert=True)
+        await repo.update_settings(ctx.author.id, {"$set": update_data})
         await ctx.send(f"✅ Configurado! " + " | ".join(msg_log))
     else:
-        cfg = db.user_settings.find_one({"user_id": ctx.author.id}) or {}
+        cfg = await repo.settings(ctx.author.id)
         inter = cfg.get("periodic_interval", 0)
         mode = cfg.get("notify_mode", "smart")
         status = format_seconds(inter) if inter > 0 else "Off"
@@ -634,8 +508,8 @@ async def alert(ctx, *, args_str: str = ""):
 # --- COMANDO: !export ---
 @bot.command(name="export")
 async def export_cmd(ctx):
-    ids = get_linked_ids(ctx.author.id)
-    data = list(db.provas.find({"user_id": {"$in": ids}}, {"_id": 0, "user_id": 0, "sent_24h": 0}))
+    ids = await repo.linked_ids(ctx.author.id)
+    data = await repo.export(ids)
 
     if not data:
         await ctx.send("📭 Agenda vazia.")
@@ -648,7 +522,7 @@ async def export_cmd(ctx):
 # --- COMANDO: !link ---
 @bot.command(name="link")
 async def link(ctx, arg1: str = None, arg2: str = None):
-    partners = get_partners(ctx.author.id)
+    partners = await repo.partners(ctx.author.id)
 
     if not arg1:
         embed = discord.Embed(title="🔗 Gerenciar Vínculo", color=0x3498db)
@@ -673,11 +547,11 @@ async def link(ctx, arg1: str = None, arg2: str = None):
 
     if arg1.lower() == "desvincular":
         if arg2 and arg2.isdigit():
-            success, msg = unlink_specific(ctx.author.id, arg2)
+            success, msg = await repo.unlink_specific(ctx.author.id, arg2)
             await ctx.send(msg)
             return
         if arg2 and arg2.lower() in ["sim", "confirmar", "yes"]:
-            success, msg = unlink_account(ctx.author.id)
+            success, msg = await repo.unlink(ctx.author.id)
             await ctx.send(msg)
         else:
             await ctx.send("⚠️ Use: `!link desvincular ID` ou `!link desvincular confirmar`")
@@ -689,7 +563,7 @@ async def link(ctx, arg1: str = None, arg2: str = None):
         
         # Note: Do NOT change "discord" inside generate_link_code. 
         # This parameter identifies WHERE the code was created, not where it goes.
-        token = generate_link_code("discord", ctx.author.id) 
+        token = await repo.link_code("discord", ctx.author.id)
         
         embed = discord.Embed(title="🔐 Código de Vínculo", color=0xffff00)
         embed.description = f"Seu código: **`{token}`**\n1. Vá no Telegram.\n2. `/link {token}`\n{warning}"
@@ -697,7 +571,7 @@ async def link(ctx, arg1: str = None, arg2: str = None):
         await ctx.send("📩 Código enviado na DM!")
     else:
         token = arg1.strip()
-        success, resp = validate_link_code(token, "discord", ctx.author.id)
+        success, resp = await repo.validate_link(token, "discord", ctx.author.id)
         await ctx.send(resp)
 
 # --- COMANDO: !import ---
@@ -720,14 +594,7 @@ async def import_cmd(ctx):
              await ctx.send("🚫 JSON inválido.")
              return
 
-        valid_items = []
-        for item in data_import:
-            if "materia" not in item or "data" not in item: continue
-            new_item = item.copy()
-            if "_id" in new_item: del new_item["_id"]
-            new_item["user_id"] = ctx.author.id
-            new_item["origin"] = "discord_import"
-            valid_items.append(new_item)
+        valid_items = await repo.prepare_import(data_import, ctx.author.id, "discord_import")
 
         if not valid_items:
             await ctx.send("🚫 Nenhum evento válido.")
@@ -748,24 +615,46 @@ class ImportView(discord.ui.View):
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
         return interaction.user.id == self.author_id
 
+    async def run_import(self, interaction, mode):
+        """Roda o import no pool do repositório e vai editando a mensagem com o progresso."""
+        loop = asyncio.get_running_loop()
+        await interaction.response.edit_message(content=f"⏳ Importando {len(self.items)} itens...", view=None)
+
+        # Uma edição de progresso por vez, sempre a mais recente; as intermediárias são descartadas
+        latest, sender = [None], [None]
+        async def send_progress():
+            while latest[0]:
+                content, latest[0] = latest[0], None
+                try: await interaction.edit_original_response(content=content)
+                except discord.HTTPException: pass
+        def push(content):
+            latest[0] = content
+            if sender[0] is None or sender[0].done(): sender[0] = loop.create_task(send_progress())
+
+        last_pct = [0]
+        def report(done, total):
+            pct = done * 100 // total
+            if pct - last_pct[0] < 20 or done == total: return
+            last_pct[0] = pct
+            loop.call_soon_threadsafe(push, f"⏳ Importando... {done}/{total} ({pct}%)")
+
+        try: return await repo.import_items(self.author_id, self.items, mode, progress=report)
+        finally:
+            # A edição final dos botões só sai depois da última de progresso
+            latest[0] = None
+            if sender[0]: await sender[0]
+
     @discord.ui.button(label="🔥 SUBSTITUIR TUDO", style=discord.ButtonStyle.danger)
     async def replace_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.finished = True
-        db.provas.delete_many({"user_id": self.author_id})
-        if self.items:
-            db.provas.insert_many(self.items)
-            db.user_settings.update_one({"user_id": self.author_id}, {"$set": {"custom_cats": []}})
-            for item in self.items:
-                db.user_settings.update_one({"user_id": self.author_id}, {"$addToSet": {"custom_cats": item.get("tipo", "Geral")}}, upsert=True)
-        await interaction.response.edit_message(content="✅ Substituído com sucesso!", view=None)
+        inserted, _ = await self.run_import(interaction, "replace")
+        await interaction.edit_original_response(content=f"✅ Substituído com sucesso! ({inserted} itens)")
 
     @discord.ui.button(label="➕ MESCLAR", style=discord.ButtonStyle.primary)
     async def merge_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
         self.finished = True
-        if self.items: db.provas.insert_many(self.items)
-        for item in self.items:
-             db.user_settings.update_one({"user_id": self.author_id}, {"$addToSet": {"custom_cats": item.get("tipo", "Geral")}}, upsert=True)
-        await interaction.response.edit_message(content=f"✅ {len(self.items)} itens adicionados.", view=None)
+        inserted, duplicates = await self.run_import(interaction, "merge")
+        await interaction.edit_original_response(content=f"✅ {inserted} itens adicionados. ♻️ {duplicates} já existiam.")
 
     @discord.ui.button(label="❌ Cancelar", style=discord.ButtonStyle.secondary)
     async def cancel_btn(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -774,4 +663,6 @@ class ImportView(discord.ui.View):
 
 if __name__ == "__main__":
     if Config.DISCORD_TOKEN:
+        start_http_server(Config.DISCORD_METRICS_PORT)
+        start_listener()
         bot.run(Config.DISCORD_TOKEN)
\ No newline at end of file
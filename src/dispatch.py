@@ -0,0 +1,329 @@
+# --- START OF FILE src/dispatch.py ---
+"""
+Estágio de envio do notifier: cada plataforma tem seu pool de threads (limite de
+concorrência próprio) e cada thread reutiliza uma requests.Session (keep-alive).
+
+Discord: o canal de DM de cada usuário fica em cache (memória + db.discord_channels)
+e é invalidado em 404/403; os envios respeitam os headers de rate limit e o 429.
+
+Limites: token bucket global por plataforma e por chat. 429 (retry_after) e erros
+transitórios são repetidos com backoff limitado; o que não sair vai para a fila
+durável db.notify_outbox, drenada pelo notifier.
+
+O notifier só monta as mensagens (Mongo + render) e chama dispatcher.send();
+as mensagens de um mesmo destino saem em ordem, na mesma tarefa.
+"""
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from prometheus_client import Counter, Histogram
+from src.config import Config
+from src.database import db
+from src.leases import claim, LEASE_UNSET
+from src.chunker import chunk_messages, DISCORD_LIMIT, TELEGRAM_LIMIT
+
+# =========================================
+#       MÉTRICAS
+# =========================================
+SENT = Counter('notifier_messages_sent_total', 'Mensagens entregues', ['platform'])
+SEND_FAILS = Counter('notifier_send_failures_total', 'Mensagens não entregues', ['platform', 'reason'])
+HTTP_LATENCY = Histogram('notifier_http_seconds', 'Latência das chamadas às APIs de chat', ['platform', 'endpoint'],
+                         buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+SCHEDULE_LAG = Histogram('notifier_schedule_lag_seconds', 'Atraso entre o horário previsto e a entrega', ['kind'],
+                         buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600))
+
+def platform_of(target_id):
+    return "discord" if len(str(target_id)) > 15 else "telegram"
+
+# Falha de envio: transient=True vai para a outbox; remaining = parte do texto não entregue
+Failure = namedtuple("Failure", ["reason", "transient", "retry_after", "remaining"])
+
+def backoff(attempt, cap):
+    # Exponencial com jitter, limitado a cap segundos
+    return min(cap, Config.SEND_BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+# =========================================
+#       RATE LIMIT (TOKEN BUCKET)
+# =========================================
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def reserve(self, now):
+        """Consome um token (pode ficar negativo) e devolve quanto esperar até ele valer."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class RateLimiter:
+    """Bucket global por plataforma + bucket por chat (limites documentados das APIs)."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.platforms = {
+            "telegram": TokenBucket(Config.TELEGRAM_RATE, Config.TELEGRAM_RATE),
+            "discord": TokenBucket(Config.DISCORD_RATE, Config.DISCORD_RATE),
+        }
+        self.chat_rates = {"telegram": Config.TELEGRAM_CHAT_RATE, "discord": Config.DISCORD_CHAT_RATE}
+        self.chats = {}
+
+    def acquire(self, platform, chat_id):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.chats.get((platform, chat_id))
+            if bucket is None:
+                if len(self.chats) > 50000: self._prune(now)
+                bucket = self.chats[(platform, chat_id)] = TokenBucket(self.chat_rates[platform], Config.CHAT_BURST)
+            delay = max(self.platforms[platform].reserve(now), bucket.reserve(now))
+        if delay > 0: time.sleep(delay)
+
+    def _prune(self, now):
+        # Chats parados há mais de 1 min já estariam com o bucket cheio
+        self.chats = {k: b for k, b in self.chats.items() if now - b.stamp < 60}
+
+# =========================================
+#       FILA DURÁVEL (OUTBOX)
+# =========================================
+
+class Outbox:
+    """Envios adiados por erro transitório. collection=None: só registra e descarta."""
+    def __init__(self, collection):
+        self.collection = collection
+
+    def defer(self, target_id, texts, kind, failure, entry=None):
+        attempts = (entry or {}).get("attempts", 0) + 1
+        if self.collection is None or attempts > Config.OUTBOX_MAX_ATTEMPTS:
+            print(f"❌ Envio descartado para {target_id} ({failure.reason}, {attempts - 1} tentativas)", flush=True)
+            if entry: self.done(entry)
+            return
+        delay = failure.retry_after if failure.retry_after is not None else backoff(attempts, Config.OUTBOX_MAX_DELAY)
+        doc = {"target_id": target_id, "texts": texts, "kind": kind, "attempts": attempts,
+               "last_error": failure.reason, "next_try_at": datetime.utcnow() + timedelta(seconds=delay)}
+        if entry: self.collection.update_one({"_id": entry["_id"]}, {"$set": doc, "$unset": LEASE_UNSET})
+        else: self.collection.insert_one(dict(doc, created_at=datetime.utcnow()))
+
+    def done(self, entry):
+        if self.collection is not None: self.collection.delete_one({"_id": entry["_id"]})
+
+    def claim_due(self, limit=500):
+        if self.collection is None: return []
+        now = datetime.utcnow()
+        query = {"next_try_at": {"$lte": now}, "lease_until": {"$not": {"$gt": now}}}
+        ids = [d["_id"] for d in self.collection.find(query, {"_id": 1}).limit(limit)]
+        return claim(self.collection, ids, {"next_try_at": {"$lte": now}})[1]
+
+class DmChannelCache:
+    """user_id -> channel_id da DM. collection=None mantém só em memória."""
+    def __init__(self, collection):
+        self.collection = collection
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock: cid = self.data.get(user_id)
+        if cid or self.collection is None: return cid
+        doc = self.collection.find_one({"user_id": user_id}, {"channel_id": 1})
+        if doc:
+            with self.lock: self.data[user_id] = doc["channel_id"]
+            return doc["channel_id"]
+        return None
+
+    def put(self, user_id, channel_id):
+        with self.lock: self.data[user_id] = channel_id
+        if self.collection is not None:
+            self.collection.update_one({"user_id": user_id}, {"$set": {"channel_id": channel_id, "updated_at": datetime.utcnow()}}, upsert=True)
+
+    def invalidate(self, user_id):
+        with self.lock: self.data.pop(user_id, None)
+        if self.collection is not None: self.collection.delete_one({"user_id": user_id})
+
+class Dispatcher:
+    def __init__(self, telegram_workers=None, discord_workers=None, dm_channels=None, outbox=None, clock=None):
+        self.limits = {
+            "telegram": telegram_workers or Config.DISPATCH_TELEGRAM_WORKERS,
+            "discord": discord_workers or Config.DISPATCH_DISCORD_WORKERS,
+        }
+        self.pools = {
+            name: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"send-{name}")
+            for name, n in self.limits.items()
+        }
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.dm_channels = dm_channels or DmChannelCache(db.discord_channels)
+        self.outbox = outbox or Outbox(db.notify_outbox)
+        self.limiter = RateLimiter()
+        self.discord_global_until = 0  # rate limit global (429 com X-RateLimit-Global)
+        self.clock = clock  # mesma base de tempo dos horários agendados (métrica de atraso)
+
+    def session(self):
+        s = getattr(self.local, "session", None)
+        if s is None:
+            s = requests.Session()
+            s.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+            s.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+            self.local.session = s
+        return s
+
+    # =========================================
+    #       PLATAFORMAS
+    # =========================================
+
+    def post(self, platform, endpoint, url, **kwargs):
+        t0 = time.perf_counter()
+        try: return self.session().post(url, timeout=Config.DISPATCH_TIMEOUT, **kwargs)
+        finally: HTTP_LATENCY.labels(platform, endpoint).observe(time.perf_counter() - t0)
+
+    # Os envios devolvem None em sucesso ou um Failure
+
+    def send_telegram(self, chat_id, text):
+        # Acima de 4096 o Telegram recusa: vai em pedaços, e o que faltar volta no Failure
+        chunks = list(chunk_messages(text, TELEGRAM_LIMIT))
+        for i, chunk in enumerate(chunks):
+            fail = self._send_telegram_one(chat_id, chunk)
+            if fail: return fail._replace(remaining="\n".join(chunks[i:]))
+        return None
+
+    def _send_telegram_one(self, chat_id, text):
+        url = f"{Config.TELEGRAM_API_URL}/bot{Config.TELEGRAM_TOKEN}/sendMessage"
+        for attempt in range(Config.SEND_MAX_RETRIES + 1):
+            self.limiter.acquire("telegram", chat_id)
+            try:
+                resp = self.post("telegram", "sendMessage", url, json={"chat_id": chat_id, "text": text, "parse_mode": "Markdown"})
+            except requests.RequestException as e:
+                print(f"Err Telegram: {e}", flush=True)
+                fail = Failure(type(e).__name__, True, None, text)
+            else:
+                if resp.status_code == 200: return None
+                if resp.status_code == 429:
+                    try: retry_after = float(resp.json().get("parameters", {}).get("retry_after", 1))
+                    except ValueError: retry_after = 1.0
+                    fail = Failure("429", True, retry_after, text)
+                elif resp.status_code >= 500: fail = Failure(str(resp.status_code), True, None, text)
+                else: return Failure(str(resp.status_code), False, None, text)  # 400/403: repetir não adianta
+            wait_s = fail.retry_after if fail.retry_after is not None else backoff(attempt, Config.SEND_MAX_WAIT)
+            if attempt == Config.SEND_MAX_RETRIES or wait_s > Config.SEND_MAX_WAIT: return fail
+            time.sleep(wait_s)
+        return fail
+
+    def discord_request(self, endpoint, url, payload, chat_id):
+        """POST no Discord respeitando rate limit: espera o reset quando o bucket zera e refaz em 429."""
+        headers = {"Authorization": f"Bot {Config.DISCORD_TOKEN}", "Content-Type": "application/json"}
+        for _ in range(Config.SEND_MAX_RETRIES + 1):
+            self.limiter.acquire("discord", chat_id)
+            wait_global = self.discord_global_until - time.time()
+            if wait_global > 0: time.sleep(wait_global)
+            resp = self.post("discord", endpoint, url, json=payload, headers=headers)
+            if resp.status_code == 429:
+                try: retry_after = float(resp.json().get("retry_after", 1))
+                except ValueError: retry_after = float(resp.headers.get("Retry-After", 1))
+                if retry_after > Config.SEND_MAX_WAIT: return resp  # longo demais: vai para a outbox
+                if resp.headers.get("X-RateLimit-Global"): self.discord_global_until = time.time() + retry_after
+                else: time.sleep(retry_after)
+                continue
+            # Bucket esgotado: a próxima requisição da mesma rota só depois do reset
+            if resp.headers.get("X-RateLimit-Remaining") == "0":
+                time.sleep(float(resp.headers.get("X-RateLimit-Reset-After", 0)))
+            return resp
+        return resp
+
+    def open_dm(self, user_id):
+        """(channel_id, None) ou (None, resposta de erro)."""
+        cid = self.dm_channels.get(user_id)
+        if cid: return cid, None
+        resp = self.discord_request("dm_open", f"{Config.DISCORD_API_URL}/users/@me/channels", {"recipient_id": user_id}, user_id)
+        if resp.status_code not in [200,201]: return None, resp
+        cid = resp.json()["id"]
+        self.dm_channels.put(user_id, cid)
+        return cid, None
+
+    def _discord_failure(self, resp, chunks):
+        transient = resp.status_code == 429 or resp.status_code >= 500
+        retry_after = None
+        if resp.status_code == 429:
+            try: retry_after = float(resp.json().get("retry_after", 1))
+            except ValueError: retry_after = float(resp.headers.get("Retry-After", 1))
+        return Failure(str(resp.status_code), transient, retry_after, "\n".join(chunks))
+
+    def send_discord(self, user_id, text):
+        if not Config.DISCORD_TOKEN: return Failure("no_token", False, None, text)
+        chunks = list(chunk_messages(text, DISCORD_LIMIT))
+        try:
+            for attempt in range(2):
+                cid, err = self.open_dm(user_id)
+                if not cid: return self._discord_failure(err, chunks)
+                url_msg = f"{Config.DISCORD_API_URL}/channels/{cid}/messages"
+                while chunks:
+                    resp = self.discord_request("messages", url_msg, {"content": chunks[0]}, user_id)
+                    if resp.status_code in (403, 404): break
+                    if resp.status_code >= 300: return self._discord_failure(resp, chunks)
+                    chunks.pop(0)
+                if not chunks: return None
+                # Canal sumiu (404) ou DM bloqueada (403): esquece o cache; 404 tenta reabrir uma vez
+                self.dm_channels.invalidate(user_id)
+                if resp.status_code == 403: break
+            return Failure(str(resp.status_code), False, None, "\n".join(chunks))
+        except requests.RequestException as e:
+            print(f"Err Discord: {e}", flush=True)
+            return Failure(type(e).__name__, True, None, "\n".join(chunks))
+
+    # =========================================
+    #       FILA
+    # =========================================
+
+    def _deliver(self, target_id, texts, kind, scheduled_at, outbox_entry):
+        target_id = str(target_id)
+        platform = platform_of(target_id)
+        fn = self.send_discord if platform == "discord" else self.send_telegram
+        texts = [t for t in texts if t]
+        for i, text in enumerate(texts):
+            fail = fn(target_id, text)
+            if fail is None:
+                SENT.labels(platform).inc()
+                continue
+            SEND_FAILS.labels(platform, fail.reason).inc()
+            if fail.transient:
+                # O resto (inclusive a parte não entregue desta mensagem) vai para a fila durável
+                self.outbox.defer(target_id, [fail.remaining] + texts[i + 1:], kind, fail, outbox_entry)
+                return
+        if outbox_entry: self.outbox.done(outbox_entry)
+        if scheduled_at is not None and self.clock:
+            SCHEDULE_LAG.labels(kind).observe(max(0.0, (self.clock() - scheduled_at).total_seconds()))
+
+    def send(self, target_id, *texts, kind="other", scheduled_at=None, outbox_entry=None):
+        """Agenda o envio (não bloqueia). As mensagens do mesmo destino mantêm a ordem.
+        scheduled_at (na base de tempo de clock) alimenta a métrica de atraso."""
+        fut = self.pools[platform_of(target_id)].submit(self._deliver, target_id, texts, kind, scheduled_at, outbox_entry)
+        with self.lock: self.pending.add(fut)
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _done(self, fut):
+        with self.lock: self.pending.discard(fut)
+        if fut.exception(): print(f"⚠️ Erro no envio: {fut.exception()}", flush=True)
+
+    def drain_outbox(self):
+        """Reenvia o que está vencido na outbox (com lease, seguro entre réplicas)."""
+        entries = self.outbox.claim_due()
+        for e in entries: self.send(e["target_id"], *e["texts"], kind=e["kind"], outbox_entry=e)
+        self.flush()
+        return len(entries)
+
+    def flush(self, timeout=None):
+        """Espera os envios em andamento (limita a memória entre lotes)."""
+        with self.lock: pending = list(self.pending)
+        if pending: wait(pending, timeout=timeout)
+
+    def shutdown(self):
+        for pool in self.pools.values(): pool.shutdown(wait=True)
@@ -0,0 +1,88 @@
+# --- START OF FILE src/importer.py ---
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+from src.database import db
+from src.utils import stamp_event
+from src.read_model import refresh_agenda
+
+# =========================================
+#       IMPORTAÇÃO EM LOTE (JSON)
+# =========================================
+
+IMPORT_CHUNK_SIZE = 1000  # Documentos por bulk_write
+# Campos do JSON que viram o evento; o resto (chaves livres do arquivo) é descartado
+IMPORT_FIELDS = ("tipo", "materia", "data", "prioridade", "observacoes")
+
+def prepare_import_items(data_import, user_id, origin):
+    """Valida os itens do JSON e aplica os campos padrão antes de gravar."""
+    valid_items = []
+    for item in data_import:
+        if not isinstance(item, dict): continue
+        if "materia" not in item or "data" not in item: continue
+
+        new_item = {k: item[k] for k in IMPORT_FIELDS if k in item}
+        new_item["user_id"] = user_id
+        new_item["origin"] = origin
+        new_item.setdefault("tipo", "Geral")
+        new_item.setdefault("prioridade", "low")
+        new_item.setdefault("observacoes", "")
+        valid_items.append(new_item)
+    return valid_items
+
+def _bulk_insert(items, chunk_size, progress=None):
+    """Retorna (inseridos, duplicados). Duplicados = violação do índice único (user_id, sig)."""
+    total = len(items)
+    inserted = duplicates = 0
+    for start in range(0, total, chunk_size):
+        chunk = items[start:start + chunk_size]
+        try:
+            res = db.provas.bulk_write([InsertOne(it) for it in chunk], ordered=False)
+            inserted += res.inserted_count
+        except BulkWriteError as e:
+            # ordered=False: o restante do chunk continua sendo gravado
+            inserted += e.details.get("nInserted", 0)
+            errors = e.details.get("writeErrors", [])
+            dups = sum(1 for err in errors if err.get("code") == 11000)
+            duplicates += dups
+            if len(errors) > dups:
+                print(f"⚠️ Import: {len(errors) - dups} falhas no chunk {start}", flush=True)
+        if progress: progress(min(start + chunk_size, total), total)
+    return inserted, duplicates
+
+def import_items(user_id, items, mode="merge", chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    mode: 'replace' (apaga a agenda atual) ou 'merge' (ignora duplicados).
+    progress(feitos, total) é chamado após cada chunk gravado.
+    Retorna (inseridos, duplicados).
+
+    A deduplicação contra a agenda existente fica com o Mongo (índice único
+    user_id+sig), então o custo não depende do tamanho da agenda atual.
+    """
+    if mode == "replace":
+        db.provas.delete_many({"user_id": user_id})
+
+    # Só deduplica o próprio JSON em memória (limitado ao tamanho do import)
+    seen = set()
+    final_list = []
+    duplicates = 0
+    for item in items:
+        sig = stamp_event(item)["sig"]
+        if sig in seen:
+            duplicates += 1
+        else:
+            seen.add(sig)
+            final_list.append(item)
+
+    inserted, dup_conflicts = _bulk_insert(final_list, chunk_size, progress)
+    duplicates += dup_conflicts
+
+    refresh_agenda(user_id)
+
+    # Categorias em uma única operação
+    cats = list(dict.fromkeys(it.get("tipo", "Geral") for it in final_list))
+    if mode == "replace":
+        db.user_settings.update_one({"user_id": user_id}, {"$set": {"custom_cats": cats}}, upsert=True)
+    elif cats:
+        db.user_settings.update_one({"user_id": user_id}, {"$addToSet": {"custom_cats": {"$each": cats}}}, upsert=True)
+
+    return inserted, duplicates
@@ -0,0 +1,54 @@
+# --- START OF FILE src/leases.py ---
+"""
+Leases para rodar várias réplicas do notifier sem envio duplicado.
+
+Cada réplica reivindica o trabalho vencido com um update atômico (lease_token +
+lease_until) antes de enviar e libera ao gravar o resultado. Se a réplica morrer
+no meio, o lease expira e outra réplica pega os mesmos documentos.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from src.config import Config
+from src.database import db
+
+REPLICA_ID = f"{socket.gethostname()}-{os.getpid()}"
+LEASE_UNSET = {"lease_token": "", "lease_until": ""}
+
+def _lease(seconds):
+    now = datetime.utcnow()
+    return now, now + timedelta(seconds=seconds or Config.LEASE_SECONDS)
+
+def claim(collection, ids, query, projection=None, seconds=None):
+    """Reivindica os documentos (_id em ids) que casam com query e estão sem lease ativo.
+    Retorna (token, docs reivindicados por esta réplica)."""
+    if not ids: return None, []
+    now, until = _lease(seconds)
+    token = f"{REPLICA_ID}:{uuid.uuid4().hex[:8]}"
+    q = dict(query, _id={"$in": ids}, lease_until={"$not": {"$gt": now}})
+    collection.update_many(q, {"$set": {"lease_token": token, "lease_until": until}})
+    return token, list(collection.find({"_id": {"$in": ids}, "lease_token": token}, projection))
+
+def release_op(doc_id, token, update, query=None):
+    """UpdateOne que grava o resultado e libera o lease (só se ainda for nosso e casar com query).
+    update pode ser um pipeline (lista de estágios) para calcular a partir do documento atual."""
+    if isinstance(update, list): update = update + [{"$unset": list(LEASE_UNSET)}]
+    else:
+        update = dict(update)
+        update["$unset"] = dict(update.get("$unset", {}), **LEASE_UNSET)
+    return UpdateOne(dict(query or {}, _id=doc_id, lease_token=token), update)
+
+def acquire_lock(name, seconds=None):
+    """Lock nomeado para jobs de uma réplica só (ex.: arquivamento)."""
+    now, until = _lease(seconds)
+    try:
+        db.notifier_locks.find_one_and_update(
+            {"_id": name, "$or": [{"until": {"$lte": now}}, {"owner": REPLICA_ID}]},
+            {"$set": {"owner": REPLICA_ID, "until": until}}, upsert=True
+        )
+    except DuplicateKeyError:
+        return False  # outra réplica tem o lock (o upsert colidiu com o _id existente)
+    return True
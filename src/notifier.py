@@ -1,133 +1,248 @@
 # --- START OF FILE src/notifier.py ---
+"""
+Notifier orientado a eventos: cada alerta de 24h (por evento) tem um horário na
+fila do Scheduler, e os resumos periódicos têm um único timer no menor
+next_periodic_run. O loop dorme até o próximo prazo; mudanças de
+agenda/configuração chegam pelo bus e remarcam só o necessário.
+
+Várias réplicas podem rodar juntas: alertas e resumos vencidos são reivindicados
+com lease (src/leases.py) antes do envio, e o arquivamento usa um lock nomeado.
+"""
 import time
-import requests
-import json
 from datetime import datetime, timedelta
+from prometheus_client import start_http_server, Gauge, Histogram
 from src.database import db
 from src.config import Config
-from src.utils import parse_smart_date, generate_ascii_tree, get_linked_ids, singularize
-
-print("🔔 Notification Worker (Clean Output) Iniciado...", flush=True)
+from src.utils import resolve_clusters, singularize
+from src.digest import get_digest, get_digests
+from src.archive import archive_past_events
+from src.bus import start_listener, on_change, on_settings_change
+from src.scheduler import Scheduler
+from src.dispatch import Dispatcher
+from src.leases import claim, release_op, acquire_lock, LEASE_UNSET, REPLICA_ID
 
 def get_brt_now():
     utc_now = datetime.utcnow()
     return utc_now - timedelta(hours=3)
 
-def send_telegram_msg(chat_id, text):
-    try:
-        requests.post(f"https://api.telegram.org/bot{Config.TELEGRAM_TOKEN}/sendMessage", json={"chat_id": chat_id, "text": text, "parse_mode": "Markdown"})
-    except: pass
-
-def send_discord_msg(user_id, text):
-    if not Config.DISCORD_TOKEN: return
-    headers = {"Authorization": f"Bot {Config.DISCORD_TOKEN}", "Content-Type": "application/json"}
-    try:
-        url_dm = "https://discord.com/api/v10/users/@me/channels"
-        resp = requests.post(url_dm, json={"recipient_id": str(user_id)}, headers=headers)
-        if resp.status_code in [200,201]:
-            cid = resp.json()["id"]
-            url_msg = f"https://discord.com/api/v10/channels/{cid}/messages"
-            chunks = [text[i:i+1900] for i in range(0, len(text), 1900)]
-            for c in chunks:
-                requests.post(url_msg, json={"content": c}, headers=headers)
-                time.sleep(0.5)
-    except Exception as e: print(f"Err Discord: {e}")
-
-def send_msg(target_id, text):
-    target_id = str(target_id)
-    if len(target_id) > 15: send_discord_msg(target_id, text)
-    else: send_telegram_msg(target_id, text)
-
-def check_fixed_24h_warning():
-    pending = db.provas.find({"sent_24h": {"$ne": True}})
-    now = get_brt_now() 
-    today = now.date()
-    for task in pending:
-        dt = parse_smart_date(task.get('data', ''))
-        if not dt: continue
-        delta = (dt.date() - today).days
-        if delta in [0, 1]:
-            tit = "🚨 *É HOJE!*" if delta == 0 else "🚨 *É AMANHÃ!*"
-            cat_sing = singularize(task.get('tipo', 'Geral'))
-            msg = f"{tit}\n*{task['materia']}*\n📂 {cat_sing}\n📅 `{task['data']}`"
-            print(f"🚀 24h Alert: {task['user_id']}", flush=True)
-            send_msg(task['user_id'], msg)
-            db.provas.update_one({"_id": task["_id"]}, {"$set": {"sent_24h": True}})
-
-def check_periodic_reminders():
-    users_settings = db.user_settings.find({"periodic_interval": {"$exists": True}})
+scheduler = Scheduler(get_brt_now)
+
+# Métricas (porta Config.NOTIFIER_METRICS_PORT)
+TICK = Histogram('notifier_tick_seconds', 'Duração de uma passada (itens vencidos até o envio)',
+                 buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300))
+DUE_ITEMS = Histogram('notifier_due_items', 'Itens vencidos reivindicados por passada', ['kind'],
+                      buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000))
+TIMERS = Gauge('notifier_scheduled_timers', 'Timers pendentes na agenda em memória')
+
+# Envio concorrente (estágio separado da montagem das mensagens)
+dispatcher = Dispatcher(clock=get_brt_now)
+
+# =========================================
+#       ALERTA DE 24H (um disparo por evento)
+# =========================================
+
+# Pendente = sent_24h falso ou ausente; $in usa o índice (sent_24h, due_at), $ne não
+PENDING_ALERT = {"$in": [False, None]}
+ALERT_PROJECTION = {"user_id": 1, "materia": 1, "tipo": 1, "data": 1, "due_at": 1}
+ALERT_BATCH = 1000
+
+def alert_fire_at(due_at):
+    # Dispara à 00:00 da véspera (delta de 1 dia), como o antigo poll fazia
+    return datetime.combine(due_at.date() - timedelta(days=1), datetime.min.time())
+
+def load_alerts(user_id=None):
+    """Agenda os alertas pendentes até o horizonte: hoje + intervalo do resync + 2 dias
+    (janela do alerta). O que vence depois entra no próximo resync ou no reload do bus."""
+    today = datetime.combine(get_brt_now().date(), datetime.min.time())
+    horizon = today + timedelta(seconds=Config.SCHEDULER_RESYNC, days=2)
+    query = {"sent_24h": PENDING_ALERT, "due_at": {"$gte": today, "$lt": horizon}}
+    if user_id is not None: query["user_id"] = user_id
+    n = 0
+    for task in db.provas.find(query, {"due_at": 1}):
+        scheduler.schedule(("alert", task["_id"]), alert_fire_at(task["due_at"]))
+        n += 1
+    return n
+
+def format_alert(task, today):
+    tit = "🚨 *É HOJE!*" if task["due_at"].date() == today else "🚨 *É AMANHÃ!*"
+    cat_sing = singularize(task.get('tipo', 'Geral'))
+    return f"{tit}\n*{task['materia']}*\n📂 {cat_sing}\n📅 `{task['data']}`"
+
+def fire_alerts(prova_ids):
+    """Envia os alertas vencidos: lease no lote, uma mensagem por usuário e um update_many."""
+    today = get_brt_now().date()
+    start = datetime.combine(today, datetime.min.time())
+    window = {"$gte": start, "$lt": start + timedelta(days=2)}  # hoje e amanhã
+
+    for i in range(0, len(prova_ids), ALERT_BATCH):
+        # Fora da janela = apagado, já enviado ou data alterada (o bus já remarcou)
+        token, claimed = claim(db.provas, prova_ids[i:i + ALERT_BATCH], {"sent_24h": PENDING_ALERT, "due_at": window}, ALERT_PROJECTION)
+        DUE_ITEMS.labels("alert").observe(len(claimed))
+        por_usuario = {}
+        for task in claimed:
+            por_usuario.setdefault(task["user_id"], []).append(task)
+
+        sent = []
+        for user_id, tasks in por_usuario.items():
+            tasks.sort(key=lambda t: t["due_at"])
+            print(f"🚀 24h Alert: {user_id} ({len(tasks)})", flush=True)
+            dispatcher.send(user_id, "\n\n".join(format_alert(t, today) for t in tasks),
+                            kind="alert", scheduled_at=alert_fire_at(tasks[0]["due_at"]))
+            sent.extend(t["_id"] for t in tasks)
+        dispatcher.flush()
+        if sent: db.provas.update_many({"_id": {"$in": sent}, "lease_token": token}, {"$set": {"sent_24h": True}, "$unset": LEASE_UNSET})
+
+# =========================================
+#       RESUMO PERIÓDICO (um disparo por usuário)
+# =========================================
+
+DIGEST_PROJECTION = {"user_id": 1, "periodic_interval": 1, "notify_mode": 1, "next_periodic_run": 1}
+DIGEST_BATCH = 500
+
+def backfill_next_runs():
+    # Assinaturas anteriores ao campo next_periodic_run
     now = get_brt_now()
+    res = db.user_settings.update_many(
+        {"periodic_interval": {"$exists": True}, "next_periodic_run": {"$exists": False}},
+        [{"$set": {"next_periodic_run": {"$add": [{"$ifNull": ["$last_periodic_run", now]}, {"$multiply": ["$periodic_interval", 1000]}]}}}]
+    )
+    return res.modified_count
+
+def schedule_next_digest(after_run=False):
+    # Um único timer: o próximo next_periodic_run (índice esparso, 1 documento)
+    doc = db.user_settings.find_one({"next_periodic_run": {"$exists": True}}, {"next_periodic_run": 1}, sort=[("next_periodic_run", 1)])
+    if not doc:
+        scheduler.cancel(("digest", None))
+        return None
+    fire_at = doc["next_periodic_run"]
+    # Ainda vencido logo após uma passada = lease de outra réplica; confere de novo mais tarde
+    if after_run and fire_at <= get_brt_now(): fire_at = get_brt_now() + timedelta(seconds=Config.LEASE_RETRY)
+    scheduler.schedule(("digest", None), fire_at)
+    return doc
+
+def run_digests():
+    """Reivindica os resumos vencidos (next_periodic_run <= agora), envia e remarca com um bulk_write por lote."""
+    while True:
+        now = get_brt_now()
+        due_q = {"next_periodic_run": {"$lte": now}, "periodic_interval": {"$exists": True}}
+        query = dict(due_q, lease_until={"$not": {"$gt": datetime.utcnow()}})
+        ids = [d["_id"] for d in db.user_settings.find(query, {"_id": 1}).limit(DIGEST_BATCH)]
+        if not ids: break
+        token, due = claim(db.user_settings, ids, due_q, DIGEST_PROJECTION)
+        DUE_ITEMS.labels("digest").observe(len(due))
+        digests = DigestPass(due, now)
+        ops = []
+        for setting in due:
+            # Monta aqui (Mongo + render); a rede fica com o dispatcher
+            try:
+                texts = digests.messages(setting)
+                if texts: dispatcher.send(setting['user_id'], *texts, kind="digest", scheduled_at=setting.get("next_periodic_run"))
+            except Exception as e: print(f"⚠️ Erro resumo {setting['user_id']}: {e}", flush=True)
+            # Intervalo lido na hora de gravar: desligado ou alterado durante a passada prevalece
+            ops.append(release_op(setting["_id"], token, [{"$set": {
+                "last_periodic_run": now, "next_periodic_run": {"$add": [now, {"$multiply": ["$periodic_interval", 1000]}]}
+            }}], {"periodic_interval": {"$exists": True}}))
+        # Só marca como enviado depois do envio: réplica que morrer aqui perde o lease e outra reenvia
+        dispatcher.flush()
+        if ops: db.user_settings.bulk_write(ops, ordered=False)
+        if len(ids) < DIGEST_BATCH: break
+    schedule_next_digest(after_run=True)
+
+class DigestPass:
+    """Uma passada de resumos: contas vinculadas são resolvidas uma vez e os digests de
+    todos os devidos saem de um lote só (get_digests); só a árvore depende do estilo
+    (ansi no Discord, diff no Telegram)."""
+    def __init__(self, settings, now):
+        self.today = now.date()
+        self.clusters = resolve_clusters([s['user_id'] for s in settings])
+        try: self.digests = get_digests([self.request(s) for s in settings], self.today)
+        except Exception as e:
+            # Lote falhou: cada usuário tenta o seu digest sozinho em messages()
+            print(f"⚠️ Erro no lote de resumos: {e}", flush=True)
+            self.digests = {}
+
+    def request(self, setting):
+        user_id = setting['user_id']
+        style = 'ansi' if len(str(user_id)) > 15 else 'diff'
+        return (tuple(self.clusters.get(user_id) or (user_id,)), setting.get('notify_mode', 'smart'), style)
 
-    for setting in users_settings:
+    def messages(self, setting):
+        """Mensagens do resumo (texto + árvore), ou None se não há nada a enviar."""
         user_id = setting['user_id']
-        interval = setting['periodic_interval']
-        last_run = setting.get('last_periodic_run')
-        mode = setting.get('notify_mode', 'smart')
-
-        if not last_run:
-            db.user_settings.update_one({"user_id": user_id}, {"$set": {"last_periodic_run": now}})
-            continue
-
-        if now >= last_run + timedelta(seconds=interval):
-            print(f"⏰ Notificando {user_id} ({mode})...", flush=True)
-            
-            is_discord = len(str(user_id)) > 15
-            style = 'ansi' if is_discord else 'diff'
-
-            linked_ids = get_linked_ids(user_id)
-            all_tasks = list(db.provas.find({"user_id": {"$in": linked_ids}}))
-            
-            if not all_tasks:
-                db.user_settings.update_one({"user_id": user_id}, {"$set": {"last_periodic_run": now}})
-                continue
-
-            grouped_tasks = {}
-            total_items = 0
-            for t in all_tasks:
-                d = parse_smart_date(t.get('data', ''))
-                if not d: continue
-                delta_days = (d.date() - now.date()).days
-                if delta_days < 0: continue 
-                prio = t.get('prioridade', 'low')
-                include = (mode == 'manual') or (prio in ['critical', 'medium'] or delta_days <= 30)
-                if include:
-                    cat = t.get('tipo', 'Geral')
-                    if cat not in grouped_tasks: grouped_tasks[cat] = []
-                    grouped_tasks[cat].append((d, t, delta_days))
-                    total_items += 1
-            
-            if total_items == 0:
-                print(f"🔇 {user_id}: Vazio.", flush=True)
-                db.user_settings.update_one({"user_id": user_id}, {"$set": {"last_periodic_run": now}})
-                continue
-            
-            # --- PARTE 1: RESUMO DE TEXTO ---
-            lines = [f"⏰ **Resumo ({mode.title()})**", ""]
-            for cat in sorted(grouped_tasks.keys()):
-                lines.append(f"📂 **{cat}**")
-                items = sorted(grouped_tasks[cat], key=lambda x: x[0])
-                for d, t, dias in items:
-                    prio_raw = t.get('prioridade', 'low')
-                    if prio_raw == 'critical' or dias <= 7: ico = "🚨"
-                    elif prio_raw == 'medium' or dias <= 30: ico = "⚠️"
-                    else: ico = "🔹"
-                    t_str = "HOJE 🔥" if dias == 0 else ("AMANHÃ" if dias == 1 else f"em {dias}d")
-                    lines.append(f"{ico} {t['materia']}: {t['data']} ({t_str})")
-                lines.append("")
-
-            # Envia o Resumo primeiro
-            send_msg(user_id, "\n".join(lines))
-
-            # --- PARTE 2: ÁRVORE VISUAL (Separada para não quebrar o código) ---
-            tree = generate_ascii_tree(all_tasks, mode=mode, style=style)
-            send_msg(user_id, tree)
-
-            db.user_settings.update_one({"user_id": user_id}, {"$set": {"last_periodic_run": now}})
-
-while True:
-    try:
-        check_fixed_24h_warning()
-        check_periodic_reminders()
-    except Exception as e:
-        print(f"⚠️ Erro: {e}", flush=True)
-    time.sleep(1)
\ No newline at end of file
+        req = self.request(setting)
+        mode = req[1]
+        print(f"⏰ Notificando {user_id} ({mode})...", flush=True)
+
+        digest = self.digests.get(req) or get_digest(*req, self.today)
+        if not digest.has_tasks: return None
+        if not digest.sections:
+            print(f"🔇 {user_id}: Vazio.", flush=True)
+            return None
+        # Árvore em mensagem separada para não quebrar o bloco de código
+        return [digest.summary(f"⏰ **Resumo ({mode.title()})**"), digest.tree]
+
+# =========================================
+#       LOOP PRINCIPAL
+# =========================================
+
+def resync():
+    scheduler.clear("alert")
+    a = load_alerts()
+    schedule_next_digest()
+    scheduler.schedule(("resync", None), get_brt_now() + timedelta(seconds=Config.SCHEDULER_RESYNC))
+    print(f"🗓️ Agenda carregada: {a} alertas.", flush=True)
+
+@on_change
+def _agenda_changed(user_id, version):
+    if user_id is None: scheduler.schedule(("resync", None), get_brt_now())
+    else: load_alerts(user_id)
+
+@on_settings_change
+def _settings_changed(user_id):
+    # Reavalia no loop principal; rajadas de eventos colapsam numa única chave
+    if user_id is None: scheduler.schedule(("resync", None), get_brt_now())
+    else: scheduler.schedule(("digest", None), get_brt_now())
+
+def run_archive():
+    # Uma réplica por intervalo
+    if acquire_lock("archive", Config.ARCHIVE_INTERVAL):
+        moved = archive_past_events()
+        if moved: print(f"🗄️ {moved} eventos arquivados.", flush=True)
+    scheduler.schedule(("archive", None), get_brt_now() + timedelta(seconds=Config.ARCHIVE_INTERVAL))
+
+def run_outbox():
+    # Reenvios adiados (429/erros transitórios); cada réplica drena o que conseguir reivindicar
+    n = dispatcher.drain_outbox()
+    if n: print(f"📮 {n} envios retomados da outbox.", flush=True)
+    scheduler.schedule(("outbox", None), get_brt_now() + timedelta(seconds=Config.OUTBOX_INTERVAL))
+
+JOBS = {"digest": lambda _: run_digests(), "resync": lambda _: resync(), "archive": lambda _: run_archive(),
+        "outbox": lambda _: run_outbox()}
+
+def main():
+    print(f"🔔 Notification Worker (Clean Output) Iniciado... [{REPLICA_ID}]", flush=True)
+    start_http_server(Config.NOTIFIER_METRICS_PORT)
+    start_listener()
+    backfill_next_runs()
+    resync()
+    scheduler.schedule(("archive", None), get_brt_now())
+    scheduler.schedule(("outbox", None), get_brt_now())
+    while True:
+        due = scheduler.pop_due()
+        t0 = time.perf_counter()
+        alerts = [key for kind, key in due if kind == "alert"]
+        if alerts:
+            try: fire_alerts(alerts)
+            except Exception as e: print(f"⚠️ Erro (alert): {e}", flush=True)
+        for kind, key in due:
+            if kind == "alert": continue
+            try: JOBS[kind](key)
+            except Exception as e:
+                print(f"⚠️ Erro ({kind}): {e}", flush=True)
+                if kind in ("resync", "archive", "outbox"): scheduler.schedule((kind, None), get_brt_now() + timedelta(seconds=60))
+        if due: TICK.observe(time.perf_counter() - t0)
+        TIMERS.set(len(scheduler))
+        scheduler.wait()
+
+if __name__ == "__main__":
+    main()
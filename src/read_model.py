@@ -0,0 +1,195 @@
+# --- START OF FILE src/read_model.py ---
+"""
+Read model da agenda: um documento compacto por usuário em db.agenda_views,
+já agrupado (tipo -> materia) e ordenado por data.
+
+Todo caminho de escrita em db.provas chama refresh_agenda(user_id); os caminhos
+de leitura (painel, árvore, export, notifier) fazem um único find indexado.
+
+    python -m src.read_model check [--fix]
+    python -m src.read_model rebuild
+"""
+import sys
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from src.database import db
+from src.utils import parse_smart_date
+from src.bus import VersionedCache, on_change, is_listening, publish_change
+
+VIEW_PROJECTION = {"tipo": 1, "materia": 1, "data": 1, "prioridade": 1, "observacoes": 1}
+# Leitura do read model: só o que os renderers usam (sem _id/count/updated_at)
+VIEW_FIELDS = {"_id": 0, "user_id": 1, "version": 1, "groups": 1}
+
+# Cache local dos read models: só é usado com o bus escutando (invalidação segura)
+_view_cache = VersionedCache()
+
+@on_change
+def _invalidate_view(user_id, version):
+    _view_cache.invalidate(user_id, version)
+
+# =========================================
+#       CONSTRUÇÃO
+# =========================================
+
+def build_groups(docs):
+    dados = {}
+    for p in docs:
+        dados.setdefault(p.get('tipo', 'Geral'), {}).setdefault(p['materia'], []).append(p)
+
+    groups = []
+    for tipo in sorted(dados.keys()):
+        materias = []
+        for materia in sorted(dados[tipo].keys()):
+            docs_sorted = sorted(dados[tipo][materia], key=lambda x: parse_smart_date(x['data']) or datetime.max)
+            materias.append({
+                "materia": materia,
+                "items": [
+                    {"_id": d["_id"], "data": d["data"],
+                     "prioridade": d.get("prioridade", "low"), "observacoes": d.get("observacoes", "")}
+                    for d in docs_sorted
+                ]
+            })
+        groups.append({"tipo": tipo, "materias": materias})
+    return groups
+
+REFRESH_RETRIES = 10
+
+def _rebuild_view(uid):
+    """Reconstrói um read model com escrita condicional na versão lida: se outro processo
+    gravou no meio (e pode ter lido db.provas depois de nós), relê e tenta de novo."""
+    for _ in range(REFRESH_RETRIES):
+        cur = db.agenda_views.find_one({"user_id": uid}, {"version": 1})
+        docs = list(db.provas.find({"user_id": uid}, VIEW_PROJECTION))
+        version = (cur.get("version") or 0) if cur else 0
+        try:
+            view = db.agenda_views.find_one_and_update(
+                {"user_id": uid, "version": cur.get("version") if cur else {"$exists": False}},
+                {"$set": {"groups": build_groups(docs), "count": len(docs), "updated_at": datetime.utcnow(),
+                          "version": version + 1}},
+                upsert=cur is None, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError: view = None  # outro processo criou o documento primeiro
+        if view is not None: return view
+    print(f"⚠️ Read model de {uid}: {REFRESH_RETRIES} conflitos seguidos, fica para o check", flush=True)
+    return db.agenda_views.find_one({"user_id": uid})
+
+def refresh_agenda(*user_ids):
+    """Reconstrói o read model dos usuários informados. Retorna o último documento gravado."""
+    view = None
+    for uid in dict.fromkeys(user_ids):
+        view = _rebuild_view(uid)
+        if is_listening(): _view_cache.put(uid, view["version"], view)
+        publish_change(uid, view["version"])
+    return view
+
+# =========================================
+#       LEITURA
+# =========================================
+
+def load_views(user_ids):
+    if not isinstance(user_ids, (list, tuple, set)): user_ids = [user_ids]
+    user_ids = list(user_ids)
+    views = {}
+    if is_listening():
+        for uid in user_ids:
+            cached = _view_cache.get(uid)
+            if cached is not None: views[uid] = cached
+    missing = [uid for uid in user_ids if uid not in views]
+    if missing:
+        for v in db.agenda_views.find({"user_id": {"$in": missing}}, VIEW_FIELDS):
+            views[v["user_id"]] = v
+            # Sem o bus escutando nada invalida o cache: não guarda
+            if is_listening(): _view_cache.put(v["user_id"], v.get("version"), v)
+    # Usuário ainda sem read model (dados anteriores ao deploy): constrói uma vez
+    for uid in user_ids:
+        if uid not in views: views[uid] = refresh_agenda(uid)
+    return [views[uid] for uid in user_ids]
+
+class Event:
+    """Evento lido do read model. Registro compacto (slots) em vez de um dict por evento,
+    mas aceita ev['campo'] e ev.get('campo') como os documentos de db.provas."""
+    __slots__ = ("_id", "user_id", "tipo", "materia", "data", "prioridade", "observacoes")
+
+    def __init__(self, _id, user_id, tipo, materia, data, prioridade, observacoes):
+        self._id = _id
+        self.user_id = user_id
+        self.tipo = tipo
+        self.materia = materia
+        self.data = data
+        self.prioridade = prioridade
+        self.observacoes = observacoes
+
+    def __getitem__(self, key):
+        if key not in _EVENT_FIELDS: raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in _EVENT_FIELDS else default
+
+    def __repr__(self):
+        return f"Event({self.tipo!r}, {self.materia!r}, {self.data!r})"
+
+_EVENT_FIELDS = frozenset(Event.__slots__)
+
+def flatten_view(view):
+    uid = view["user_id"]
+    for g in view.get("groups", []):
+        tipo = g["tipo"]
+        for m in g["materias"]:
+            materia = m["materia"]
+            for it in m["items"]:
+                yield Event(it["_id"], uid, tipo, materia, it["data"], it["prioridade"], it["observacoes"])
+
+def load_agenda(user_ids):
+    """Lista de eventos (Event, acessados como os dicts de db.provas) já agrupada e ordenada."""
+    tasks = []
+    for view in load_views(user_ids):
+        tasks.extend(flatten_view(view))
+    return tasks
+
+def export_agenda(user_ids):
+    """Dados do export (JSON/API), sem campos internos."""
+    return [
+        {"materia": t.materia, "data": t.data, "tipo": t.tipo,
+         "prioridade": t.prioridade, "observacoes": t.observacoes}
+        for t in load_agenda(user_ids)
+    ]
+
+# =========================================
+#       CONSISTÊNCIA / REBUILD
+# =========================================
+
+def all_user_ids():
+    return set(db.provas.distinct("user_id")) | set(db.agenda_views.distinct("user_id"))
+
+def check_consistency(user_ids=None, fix=False):
+    """Compara o read model com db.provas. Retorna os user_ids divergentes."""
+    bad = []
+    for uid in (user_ids or all_user_ids()):
+        docs = list(db.provas.find({"user_id": uid}, VIEW_PROJECTION))
+        view = db.agenda_views.find_one({"user_id": uid}) or {}
+        if view.get("groups") != build_groups(docs) or view.get("count") != len(docs):
+            bad.append(uid)
+            if fix: refresh_agenda(uid)
+    return bad
+
+def rebuild_all():
+    ids = all_user_ids()
+    for uid in ids: refresh_agenda(uid)
+    return len(ids)
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ""
+    if cmd == "check":
+        fix = "--fix" in sys.argv
+        bad = check_consistency(fix=fix)
+        if bad:
+            print(f"⚠️ {len(bad)} read models divergentes{' (corrigidos)' if fix else ''}: {bad}")
+            sys.exit(0 if fix else 1)
+        print("✅ Read model consistente.")
+    elif cmd == "rebuild":
+        print(f"🔄 {rebuild_all()} read models reconstruídos.")
+    else:
+        print("Uso: python -m src.read_model check [--fix] | rebuild")
+        sys.exit(2)
@@ -0,0 +1,135 @@
+# --- START OF FILE src/repository.py ---
+"""
+Acesso ao Mongo para o bot do Discord sem travar o event loop.
+
+O pymongo é síncrono: cada operação abaixo roda num pool de threads próprio
+(Config.DISCORD_DB_WORKERS, no máximo o maxPoolSize do perfil discord_bot) e o
+handler só faz `await`. Operações com vários passos (editar, apagar...) vão
+inteiras numa ida ao pool, na mesma ordem de antes.
+
+    repo = Repository()
+    ids = await repo.linked_ids(ctx.author.id)
+    tasks = await repo.agenda(ids)
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import Gauge, Histogram
+from pymongo.errors import DuplicateKeyError
+from src.database import db
+from src.config import Config
+from src.utils import (
+    get_linked_ids, get_partners, unlink_account, unlink_specific,
+    generate_link_code, validate_link_code, stamp_event, restamp_events
+)
+from src.importer import prepare_import_items, import_items
+from src.read_model import load_agenda, export_agenda, refresh_agenda
+from src.archive import load_history
+from src.bus import publish_settings_change
+
+REPO_SECONDS = Histogram('discord_db_seconds', 'Tempo de cada operação do repositório (fila + Mongo)', ['op'],
+                         buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+REPO_PENDING = Gauge('discord_db_pending', 'Operações aguardando ou rodando no pool de threads')
+
+# =========================================
+#       OPERAÇÕES SÍNCRONAS (rodam no pool)
+# =========================================
+
+def add_category(user_id, cat):
+    db.user_settings.update_one({"user_id": user_id}, {"$addToSet": {"custom_cats": cat}}, upsert=True)
+
+def add_event(item):
+    """Grava o evento e atualiza o read model. False se já existia (mesma assinatura)."""
+    try: db.provas.insert_one(stamp_event(item))
+    except DuplicateKeyError: return False
+    refresh_agenda(item["user_id"])
+    add_category(item["user_id"], item["tipo"])
+    return True
+
+def rename_category(ids, user_id, query, old_cat, new_cat):
+    ids_afetados = [d["_id"] for d in db.provas.find(query, {"_id": 1})]
+    res = db.provas.update_many({"_id": {"$in": ids_afetados}}, {"$set": {"tipo": new_cat}})
+    restamp_events({"_id": {"$in": ids_afetados}})
+    refresh_agenda(*ids)
+    add_category(user_id, new_cat)
+    db.user_settings.update_one({"user_id": user_id}, {"$pull": {"custom_cats": old_cat}})
+    return res.modified_count
+
+def update_events(ids, query, update_set):
+    ids_afetados = [d["_id"] for d in db.provas.find(query, {"_id": 1})]
+    res = db.provas.update_many({"_id": {"$in": ids_afetados}}, {"$set": update_set})
+    restamp_events({"_id": {"$in": ids_afetados}})
+    refresh_agenda(*ids)
+    return res.modified_count
+
+def delete_events(ids, query, drop_cat=None):
+    """Apaga os eventos do filtro; com drop_cat também tira a categoria das contas vinculadas."""
+    if drop_cat: db.user_settings.update_many({"user_id": {"$in": ids}}, {"$pull": {"custom_cats": drop_cat}})
+    res = db.provas.delete_many(query)
+    refresh_agenda(*ids)
+    return res.deleted_count
+
+def category_counts(ids):
+    """[(categoria, nº de eventos)] com as categorias fixas, as criadas e as usadas."""
+    all_cats = {"Provas", "Trabalhos"}
+    for s in db.user_settings.find({"user_id": {"$in": ids}}, {"custom_cats": 1}):
+        all_cats.update(s.get("custom_cats", []))
+    all_cats.update(db.provas.distinct("tipo", {"user_id": {"$in": ids}}))
+    return [(c, db.provas.count_documents({"user_id": {"$in": ids}, "tipo": c})) for c in sorted(all_cats)]
+
+def get_settings(user_id):
+    return db.user_settings.find_one({"user_id": user_id}) or {}
+
+def update_settings(user_id, update):
+    db.user_settings.update_one({"user_id": user_id}, update, upsert=True)
+    publish_settings_change(user_id)
+
+# =========================================
+#       REPOSITÓRIO ASSÍNCRONO
+# =========================================
+
+class Repository:
+    def __init__(self, workers=None):
+        self.executor = ThreadPoolExecutor(max_workers=workers or Config.DISCORD_DB_WORKERS, thread_name_prefix="discord-db")
+
+    async def run(self, fn, *args, **kwargs):
+        """Roda fn(*args, **kwargs) no pool e devolve o resultado sem bloquear o loop."""
+        loop = asyncio.get_running_loop()
+        REPO_PENDING.inc()
+        t0 = time.perf_counter()
+        try: return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            REPO_PENDING.dec()
+            REPO_SECONDS.labels(fn.__name__).observe(time.perf_counter() - t0)
+
+    # --- Leitura ---
+    async def linked_ids(self, user_id): return await self.run(get_linked_ids, user_id)
+    async def partners(self, user_id): return await self.run(get_partners, user_id)
+    async def settings(self, user_id): return await self.run(get_settings, user_id)
+    async def agenda(self, ids): return await self.run(load_agenda, ids)
+    async def export(self, ids): return await self.run(export_agenda, ids)
+    async def history(self, ids): return await self.run(load_history, ids)
+    async def count(self, query): return await self.run(db.provas.count_documents, query)
+    async def category_counts(self, ids): return await self.run(category_counts, ids)
+
+    # --- Escrita ---
+    async def add_category(self, user_id, cat): return await self.run(add_category, user_id, cat)
+    async def add_event(self, item): return await self.run(add_event, item)
+    async def rename_category(self, ids, user_id, query, old_cat, new_cat):
+        return await self.run(rename_category, ids, user_id, query, old_cat, new_cat)
+    async def update_events(self, ids, query, update_set): return await self.run(update_events, ids, query, update_set)
+    async def delete_events(self, ids, query, drop_cat=None): return await self.run(delete_events, ids, query, drop_cat)
+    async def update_settings(self, user_id, update): return await self.run(update_settings, user_id, update)
+
+    # --- Vínculo de contas ---
+    async def link_code(self, platform, user_id): return await self.run(generate_link_code, platform, user_id)
+    async def validate_link(self, token, platform, user_id): return await self.run(validate_link_code, token, platform, user_id)
+    async def unlink(self, user_id): return await self.run(unlink_account, user_id)
+    async def unlink_specific(self, user_id, target): return await self.run(unlink_specific, user_id, target)
+
+    # --- Import (JSON grande: validação e bulk_write fora do loop) ---
+    async def prepare_import(self, data_import, user_id, origin):
+        return await self.run(prepare_import_items, data_import, user_id, origin)
+    async def import_items(self, user_id, items, mode, progress=None):
+        return await self.run(import_items, user_id, items, mode=mode, progress=progress)
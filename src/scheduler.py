@@ -0,0 +1,78 @@
+# --- START OF FILE src/scheduler.py ---
+"""
+Agenda de disparos do notifier: fila de prioridade (heapq) de próximos horários,
+uma entrada por chave (ex.: ("digest", user_id), ("alert", prova_id)).
+
+Remarcar uma chave só empilha a nova entrada; a antiga vira "fantasma" e é
+descartada quando chega ao topo. wait() dorme até o próximo prazo ou até alguém
+chamar schedule()/wake() de outra thread (ex.: handler do bus).
+"""
+import heapq
+import itertools
+import threading
+
+class Scheduler:
+    def __init__(self, clock):
+        self.clock = clock          # função que devolve o "agora" (mesma base dos horários)
+        self.heap = []              # (fire_at, seq, key)
+        self.entries = {}           # key -> seq válido
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def schedule(self, key, fire_at):
+        with self.lock:
+            seq = next(self.seq)
+            self.entries[key] = seq
+            heapq.heappush(self.heap, (fire_at, seq, key))
+        self.wakeup.set()
+
+    def cancel(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self, kind=None):
+        with self.lock:
+            if kind is None: self.entries.clear()
+            else: self.entries = {k: s for k, s in self.entries.items() if k[0] != kind}
+            # Compacta a heap para não acumular fantasmas
+            self.heap = [e for e in self.heap if self.entries.get(e[2]) == e[1]]
+            heapq.heapify(self.heap)
+
+    def wake(self):
+        self.wakeup.set()
+
+    def _prune(self):
+        while self.heap and self.entries.get(self.heap[0][2]) != self.heap[0][1]:
+            heapq.heappop(self.heap)
+
+    def next_deadline(self):
+        with self.lock:
+            self._prune()
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self):
+        """Remove e devolve as chaves vencidas, em ordem de horário."""
+        now = self.clock()
+        due = []
+        with self.lock:
+            self._prune()
+            while self.heap and self.heap[0][0] <= now:
+                fire_at, seq, key = heapq.heappop(self.heap)
+                if self.entries.get(key) != seq: continue
+                del self.entries[key]
+                due.append(key)
+        return due
+
+    def wait(self, max_wait=None):
+        """Dorme até o próximo prazo (no máximo max_wait segundos) ou até ser acordado."""
+        self.wakeup.clear()
+        deadline = self.next_deadline()
+        timeout = max_wait
+        if deadline is not None:
+            secs = max(0.0, (deadline - self.clock()).total_seconds())
+            timeout = secs if timeout is None else min(secs, timeout)
+        if timeout is None or timeout > 0: self.wakeup.wait(timeout)
@@ -1,4 +1,38 @@
 from src.database import db
+from src.utils import restamp_events
 # Cria índice que apaga documentos após 300 segundos (5 min) baseado no campo created_at
 db.pending_links.create_index("created_at", expireAfterSeconds=300)
-print("Índice TTL criado!")
\ No newline at end of file
+print("Índice TTL criado!")
+
+# Assinatura de dedup (user_id + sig). O índice vem antes do backfill para que
+# duplicados já existentes colidam e fiquem sem assinatura em vez de quebrar o índice.
+db.provas.create_index(
+    [("user_id", 1), ("sig", 1)], unique=True,
+    partialFilterExpression={"sig": {"$exists": True}}
+)
+restamp_events({"$or": [{"sig": {"$exists": False}}, {"due_at": {"$exists": False}}]})
+print("Índice de assinatura criado!")
+
+# Prazo (due_at) para o arquivamento e consultas por janela de data
+db.provas.create_index("due_at")
+db.provas.create_index([("sent_24h", 1), ("due_at", 1)])
+db.provas_archive.create_index([("user_id", 1), ("due_at", -1)])
+print("Índices de prazo/arquivo criados!")
+
+# Read model da agenda (um documento por usuário)
+db.agenda_views.create_index("user_id", unique=True)
+print("Índice do read model criado!")
+
+# Agenda do notifier: carga inicial e remarcação por usuário
+db.user_settings.create_index("user_id")
+db.user_settings.create_index("periodic_interval", sparse=True)
+db.user_settings.create_index("next_periodic_run", sparse=True)
+print("Índices do agendador criados!")
+
+# Cache de canais de DM do Discord (notifier)
+db.discord_channels.create_index("user_id", unique=True)
+print("Índice de canais do Discord criado!")
+
+# Outbox de envios adiados (notifier)
+db.notify_outbox.create_index("next_try_at")
+print("Índice da outbox criado!")
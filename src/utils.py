@@ -3,7 +3,11 @@ import re
 import shlex
 import secrets
 import string
-from datetime import datetime, timedelta
+import hashlib
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from src.database import db
 
 # =========================================
@@ -45,6 +49,23 @@ def get_linked_ids(user_id):
         if "aliases" in config: ids.update(config["aliases"])
     return list(ids)
 
+def resolve_clusters(user_ids):
+    """get_linked_ids em lote: {user_id: tupla ordenada dos ids vinculados}, com uma única query."""
+    user_ids = list(user_ids)
+    by_owner, by_alias = {}, {}
+    for cfg in db.user_settings.find({"$or": [{"user_id": {"$in": user_ids}}, {"aliases": {"$in": user_ids}}]}, {"user_id": 1, "aliases": 1}):
+        by_owner.setdefault(cfg.get("user_id"), cfg)
+        for a in cfg.get("aliases", []): by_alias.setdefault(a, cfg)
+    clusters = {}
+    for uid in user_ids:
+        config = by_owner.get(uid) or by_alias.get(uid)
+        ids = {uid}
+        if config:
+            if "user_id" in config: ids.add(config["user_id"])
+            ids.update(config.get("aliases", []))
+        clusters[uid] = tuple(sorted(ids, key=str))
+    return clusters
+
 def unlink_account(requester_id):
     linked_ids = get_linked_ids(requester_id)
     if len(linked_ids) <= 1: return False, "⚠️ Nenhuma conta vinculada."
@@ -71,6 +92,51 @@ def singularize(text):
     if text.endswith("s"): return text[:-1]
     return text
 
+# =========================================
+#       ASSINATURA DE EVENTOS (DEDUP)
+# =========================================
+
+def task_signature(doc):
+    """Hash normalizado de Tipo + Materia + Data + OBS (índice único user_id+sig)."""
+    norm = (
+        str(doc.get("tipo", "")).strip().lower(),
+        str(doc.get("materia", "")).strip().lower(),
+        str(doc.get("data", "")).strip(),
+        str(doc.get("observacoes", "")).strip().lower()
+    )
+    return hashlib.blake2b("\x1f".join(norm).encode("utf-8"), digest_size=12).hexdigest()
+
+def derived_fields(doc):
+    """Campos derivados gravados junto do evento: sig (dedup) e due_at (índice de prazo)."""
+    return {"sig": task_signature(doc), "due_at": parse_smart_date(str(doc.get("data", "")))}
+
+def stamp_event(doc):
+    doc.update(derived_fields(doc))
+    return doc
+
+def restamp_events(query, batch_size=1000):
+    """Recalcula os campos derivados depois de uma edição (ou backfill)."""
+    cursor = db.provas.find(query, {"tipo": 1, "materia": 1, "data": 1, "observacoes": 1})
+    batch = []
+    for doc in cursor:
+        batch.append((doc["_id"], derived_fields(doc)))
+        if len(batch) >= batch_size:
+            _flush_restamp(batch)
+            batch = []
+    if batch: _flush_restamp(batch)
+
+def _flush_restamp(batch):
+    try:
+        db.provas.bulk_write([UpdateOne({"_id": _id}, {"$set": fields}) for _id, fields in batch], ordered=False)
+    except BulkWriteError as e:
+        # Edição deixou o evento idêntico a outro: mantém o doc, só sem assinatura
+        dups = [batch[err["index"]] for err in e.details.get("writeErrors", []) if err.get("code") == 11000]
+        if dups:
+            db.provas.bulk_write([
+                UpdateOne({"_id": _id}, {"$set": {"due_at": fields["due_at"]}, "$unset": {"sig": ""}})
+                for _id, fields in dups
+            ], ordered=False)
+
 # =========================================
 #       PARSERS DE DATA E TEMPO
 # =========================================
@@ -93,7 +159,43 @@ def format_seconds(seconds):
     if seconds < 86400: return f"{seconds//3600}h"
     return f"{seconds//86400}d"
 
+# Ciclo do resumo periódico: o notifier só consulta next_periodic_run <= agora
+PERIODIC_UNSET = {"periodic_interval": "", "next_periodic_run": ""}
+
+def periodic_fields(secs, now):
+    return {"periodic_interval": secs, "last_periodic_run": now, "next_periodic_run": now + timedelta(seconds=secs)}
+
+# Caminho rápido: formatos canônicos já normalizados (dd/mm/aaaa, aaaa/mm/dd, dd/mm)
+_DATE_SEPS = str.maketrans("-.", "//")
+_DATE_JUNK = re.compile(r'[^\d/]')
+_DMY = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})')
+_YMD = re.compile(r'(\d{4})/(\d{1,2})/(\d{1,2})')
+_DM = re.compile(r'(\d{1,2})/(\d{1,2})')
+
 def parse_smart_date(date_str):
+    if not date_str: return None
+    if not isinstance(date_str, str): return _parse_smart_date_legacy(date_str)
+    # O ano inferido (dd/mm) depende do dia de hoje: entra na chave do cache
+    return _parse_smart_date_cached(date_str, date.today())
+
+@lru_cache(maxsize=8192)
+def _parse_smart_date_cached(date_str, today):
+    clean_str = _DATE_JUNK.sub('', date_str.translate(_DATE_SEPS))
+    try:
+        m = _DMY.fullmatch(clean_str)
+        if m: return datetime(int(m[3]), int(m[2]), int(m[1]), 8, 0, 0)
+        m = _YMD.fullmatch(clean_str)
+        if m: return datetime(int(m[1]), int(m[2]), int(m[3]), 8, 0, 0)
+        m = _DM.fullmatch(clean_str)
+        if m:
+            d = datetime(today.year, int(m[2]), int(m[1]), 8, 0, 0)
+            return d.replace(year=today.year + 1) if d.date() < today else d
+    except ValueError: pass
+    # Datas inválidas e formatos incomuns: mesmo resultado do parser original
+    return _parse_smart_date_legacy(date_str)
+
+def _parse_smart_date_legacy(date_str):
+    # Parser original: referência para os casos fora do caminho rápido
     if not date_str: return None
     date_str = date_str.replace('-', '/').replace('.', '/')
     clean_str = re.sub(r'[^\d/]', '', date_str)
@@ -118,18 +220,33 @@ def parse_smart_date(date_str):
         return d_obj
     except: return None
 
+# Gramática da CLI: tokens sem aspas/barra invertida não precisam do shlex
+_CLI_WORD = re.compile(r"[^ \t\r\n]+")
+_CLI_QUOTING = re.compile(r"[\"'\\]")
+_CLI_PRIO = {
+    "-alta": "critical", "-high": "critical", "-urgente": "critical", "-critical": "critical",
+    "-media": "medium", "-medium": "medium",
+    "-baixa": "low", "-low": "low",
+}
+
+def tokenize(text):
+    """Mesmo resultado do shlex.split (com fallback para split em aspas abertas), sem o lexer no caso comum."""
+    if not text: return []
+    if _CLI_QUOTING.search(text):
+        try: return shlex.split(text)
+        except ValueError: return text.split()
+    return _CLI_WORD.findall(text)
+
 def parse_cli_args(text):
-    try: tokens = shlex.split(text)
-    except: tokens = text.split()
+    tokens = tokenize(text)
     args = []
     flags = {"prio": None, "obs": ""}
     i = 0
     while i < len(tokens):
         token = tokens[i]
         lower_t = token.lower()
-        if lower_t in ["-alta", "-high", "-urgente", "-critical"]: flags["prio"] = "critical"
-        elif lower_t in ["-media", "-medium"]: flags["prio"] = "medium"
-        elif lower_t in ["-baixa", "-low"]: flags["prio"] = "low"
+        prio = _CLI_PRIO.get(lower_t)
+        if prio: flags["prio"] = prio
         elif lower_t == "-obs":
             if i + 1 < len(tokens):
                 flags["obs"] = tokens[i+1]
@@ -138,129 +255,3 @@ def parse_cli_args(text):
         else: args.append(token)
         i += 1
     return args, flags
-
-# =========================================
-#       GERADOR DE ÁRVORE (DUAL STYLE)
-# =========================================
-
-# --- Em src/utils.py ---
-
-def generate_ascii_tree(tasks, mode='smart', style='diff'):
-    if not tasks: return "📭 *Lista vazia!*"
-    
-    now = datetime.now()
-    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    dados = {}
-    for p in tasks:
-        tipo = p.get('tipo', 'Geral')
-        if tipo not in dados: dados[tipo] = {}
-        if p['materia'] not in dados[tipo]: dados[tipo][p['materia']] = []
-        dados[tipo][p['materia']].append(p)
-
-    lines = []
-    
-    # --- CONFIGURAÇÃO DE ESTILO ---
-    if style == 'ansi':
-        ESC = "\u001b["
-        RESET = f"{ESC}0m"
-        
-        # CORES ATUALIZADAS
-        COR_TITULO    = f"{ESC}1;37m" # BRANCO (Categorias)
-        COR_TAG_TEXT  = f"{ESC}1;37m" # BRANCO (Flags [URG])
-        
-        COR_ESTRUTURA = f"{ESC}0;34m" # Azul Escuro (Árvore)
-        COR_MATERIA   = f"{ESC}1;35m" # Roxo (Eventos)
-        
-        COR_URGENTE   = f"{ESC}1;31m" # Vermelho (Para a DATA)
-        COR_MEDIO     = f"{ESC}1;33m" # Amarelo (Para a DATA)
-        COR_BAIXO     = f"{ESC}0;34m" # Azul (Para a DATA e Obs)
-        
-        lines.append("```ansi")
-    else:
-        # Telegram (Diff)
-        lines.append("🌲 *Visão Geral*")
-        lines.append("```diff")
-    
-    tipos = sorted(dados.keys())
-    priority = ["Provas", "Trabalhos"]
-    tipos = priority + [x for x in tipos if x not in priority]
-    tipos = [t for t in tipos if t in dados]
-
-    for tipo in tipos:
-        if style == 'ansi':
-            lines.append(f"\n{COR_TITULO}: : {tipo.upper()} : :{RESET}")
-        else:
-            lines.append(f"+ : : {tipo.upper()} : :")
-        
-        materias = sorted(dados[tipo].keys())
-        for j, materia in enumerate(materias):
-            is_last_mat = (j == len(materias)-1)
-            prefix = "└──" if is_last_mat else "├──"
-            
-            if style == 'ansi':
-                # Estrutura Azul, Matéria Roxa
-                lines.append(f"{COR_ESTRUTURA}{prefix} {RESET}{COR_MATERIA}{materia}{RESET}")
-            else:
-                lines.append(f"#  {prefix} {materia}")
-            
-            docs = sorted(dados[tipo][materia], key=lambda x: parse_smart_date(x['data']) or datetime.max)
-            indent = "    " if is_last_mat else "│   "
-            
-            for k, d in enumerate(docs):
-                conn = "└──" if k == len(docs)-1 else "├──"
-                dt_obj = parse_smart_date(d['data'])
-                delta_days = (dt_obj - today).days if dt_obj else 999
-                prio = d.get('prioridade', 'low')
-                
-                tag = "[LOW]"
-                if prio == 'critical': tag = "[URG]"
-                elif prio == 'medium': tag = "[MED]"
-                
-                obs = d.get('observacoes', '')
-                obs_str = f"({obs}) " if obs else ""
-                
-                if style == 'ansi':
-                    # Lógica de Cor para a DATA (Smart)
-                    date_color = COR_BAIXO # Padrão Azul
-                    
-                    if delta_days < 0 or prio == 'critical': 
-                        date_color = COR_URGENTE
-                    elif mode == 'smart' and delta_days <= 7:
-                        date_color = COR_URGENTE
-                    elif prio == 'medium' or (mode == 'smart' and delta_days <= 30):
-                        date_color = COR_MEDIO
-                    
-                    # MONTAGEM DA LINHA (Obs -> Data -> Tag)
-                    # Obs: Azul
-                    # Data: Colorida (Vermelho/Amarelo/Azul)
-                    # Tag: Branca
-                    
-                    str_line = (
-                        f"{COR_ESTRUTURA}{indent}{conn} {RESET}"
-                        f"{COR_BAIXO}{obs_str}{RESET}"
-                        f"{date_color}{d['data']}{RESET} "
-                        f"{COR_TAG_TEXT}{tag}{RESET}"
-                    )
-                    lines.append(str_line)
-                
-                else:
-                    # Lógica Diff (Telegram) - Mantém estrutura padrão pois Diff não suporta cores livres
-                    content = f"{conn} {obs_str}{d['data']} {tag}"
-                    color_type = "none"
-                    if delta_days < 0: color_type = "gray"
-                    else:
-                        if mode == 'manual':
-                            if prio == 'critical': color_type = "red"
-                            elif prio == 'medium': color_type = "orange"
-                        else:
-                            if prio == 'critical' or delta_days <= 7: color_type = "red"
-                            elif prio == 'medium' or delta_days <= 30: color_type = "orange"
-
-                    if color_type == "orange": lines.append(f"'  {indent}{content}'")
-                    elif color_type == "red": lines.append(f"-  {indent}{content}")
-                    elif color_type == "gray": lines.append(f"-  {indent}{content}")
-                    else: lines.append(f"   {indent}{content}")
-
-    lines.append("```")
-    return "\n".join(lines)
\ No newline at end of file
@@ -6,25 +6,34 @@ import pika
 import requests
 import os
 import re
-import shlex 
 import uuid
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 from prometheus_client import start_http_server, Counter, Histogram
 from src.config import Config
 from src.database import db
 from src.utils import (
     parse_time_string, format_seconds, parse_smart_date, 
-    parse_cli_args, generate_ascii_tree, singularize, 
+    parse_cli_args, singularize, 
     generate_link_code, validate_link_code, get_linked_ids, 
-    unlink_account, get_partners, unlink_specific
+    unlink_account, get_partners, unlink_specific,
+    stamp_event, restamp_events, periodic_fields, PERIODIC_UNSET
 )
+from src.importer import prepare_import_items, import_items, IMPORT_CHUNK_SIZE
+from src.read_model import load_agenda, export_agenda, refresh_agenda
+from src.archive import load_history
+from src.digest import get_digest
+from src.agenda import build_agenda, painel_lines, generate_ascii_tree
+from src.chunker import chunk_messages, with_last, TELEGRAM_LIMIT
+from src.bus import start_listener, publish_settings_change
+from src.commands import Registry
 # --- MÉTRICAS ---
 TASKS = Counter('academic_tasks_total', 'Total Tarefas', ['action'])
 LATENCY = Histogram('task_processing_seconds', 'Tempo Processamento')
 
-print("👷 Worker (CLI V21 - Secure Alerts) Iniciado...", flush=True)
-start_http_server(8001)
+# Comandos de texto e botões (handlers registrados nas seções 4 e 5)
+registry = Registry("telegram")
 
 # =========================================
 #       1. UTILITÁRIOS
@@ -36,6 +45,14 @@ def regex_ci(value):
     return {"$regex": f"^{re.escape(str(value).strip())}$", "$options": "i"}
 
 def send_tg(chat_id, text, buttons=None, msg_id=None, silent=False):
+    # Texto (ou linhas de um renderer) em mensagens de até 4096; só a primeira edita, os botões vão na última
+    result = None
+    for is_last, chunk in with_last(chunk_messages(text, TELEGRAM_LIMIT)):
+        result = _send_tg_one(chat_id, chunk, buttons if is_last else None, msg_id, silent)
+        msg_id = None
+    return result
+
+def _send_tg_one(chat_id, text, buttons, msg_id, silent):
     url_base = f"https://api.telegram.org/bot{Config.TELEGRAM_TOKEN}"
     payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown", "disable_notification": silent}
     if buttons: payload["reply_markup"] = json.dumps(buttons)
@@ -94,63 +111,17 @@ def toggle_user_layout(user_id):
     db.user_settings.update_one({"user_id": user_id}, {"$set": {"layout": new_layout}}, upsert=True)
     return new_layout
 
-def format_doc_line(doc):
-    prio = doc.get('prioridade', 'low')
-    icon = "🚨" if prio == 'critical' else ("⚠️" if prio == 'medium' else "")
-    obs = doc.get('observacoes', '')
-    
-    # --- MUDANÇA AQUI ---
-    # Antes estava algo como: obs_str = f"({obs})" if obs else ""
-    # Agora basta passar a variável 'obs' direto para a lista.
-    # O " ".join já cuida de separar com espaço se tiver conteúdo.
-    
-    parts = [obs, doc['data'], icon]
-    
-    # Filtra partes vazias (if p) e junta com espaço
-    return " ".join([p for p in parts if p])
-
-def gerar_painel(user_id, provas, layout_override=None):
+def gerar_painel(user_id, provas, layout_override=None, titulo="🎓 *Painel Acadêmico*"):
     if not provas: return "📭 *Sua agenda está vazia!*"
-    dados = {}
-    for p in provas:
-        tipo = p.get('tipo', 'Geral')
-        if tipo not in dados: dados[tipo] = {}
-        if p['materia'] not in dados[tipo]: dados[tipo][p['materia']] = []
-        dados[tipo][p['materia']].append(p)
-
-    lines = ["🎓 *Painel Acadêmico*"]
-    tipos = sorted(dados.keys())
     layout_final = layout_override if layout_override else get_user_layout(user_id)
-
-    for tipo in tipos:
-        lines.append(f"\n: : *{tipo}* : :")
-        materias = sorted(dados[tipo].keys())
-        for j, materia in enumerate(materias):
-            prefix = "└──" if j == len(materias)-1 else "├──"
-            lines.append(f"`{prefix} {materia}`")
-            docs = sorted(dados[tipo][materia], key=lambda x: parse_smart_date(x['data']) or datetime.max)
-            indent = "    " if prefix == "└──" else "│   "
-            
-            if layout_final == "horizontal":
-                formatted = [format_doc_line(d) for d in docs]
-                for k in range(0, len(formatted), 2):
-                    chunk = formatted[k:k+2]
-                    conn = "└──" if k+2 >= len(formatted) else "├──"
-                    content = " - ".join(chunk)
-                    lines.append(f"`{indent}{conn} {content}`")
-            else:
-                for k, d in enumerate(docs):
-                    conn = "└──" if k == len(docs)-1 else "├──"
-                    content = format_doc_line(d)
-                    lines.append(f"`{indent}{conn} {content}`")
-    return "\n".join(lines)
+    return painel_lines(build_agenda(provas, get_brt_now().date()), layout_final, titulo)
 
 def listar_agenda(chat_id, msg_id=None):
     # Busca provas para gerar o TEXTO visual (Arvore/Painel)
     # Pega lista de IDs vinculados
     ids = get_linked_ids(chat_id)
     # Busca provas de todos eles
-    provas = list(db.provas.find({"user_id": {"$in": ids}}).sort("data", 1))
+    provas = load_agenda(ids)
     texto = gerar_painel(chat_id, provas)
     
     kb = {"inline_keyboard": []}
@@ -177,13 +148,13 @@ def listar_agenda(chat_id, msg_id=None):
     ]
     kb["inline_keyboard"].append(row_utils)
     
-    send_tg(chat_id, f"{texto}", kb, msg_id)
+    send_tg(chat_id, texto, kb, msg_id)
 
 def menu_gerenciar(chat_id, mode="edit", msg_id=None):
     """
     mode: 'edit' (Lapis) ou 'del' (Lixeira)
     """
-    provas = list(db.provas.find({"user_id": chat_id}).sort("data", 1))
+    provas = load_agenda(chat_id)
     
     if not provas:
         return listar_agenda(chat_id, msg_id)
@@ -290,6 +261,7 @@ def enviar_ajuda(chat_id, eh_erro=False, msg_id=None):
         "`tree h` _(mostra arvore horizontal)_\n"
         "`tree v` ou `tree f` _(mostra arvore vertical)_\n"
         "`tree notify` _(mostra arvore formatada pra notificao colorida)_\n"
+        "`history` _(mostra eventos vencidos já arquivados)_\n"
         "`alert -help` _(notificações comandos)_\n"
         "`export` _(faz backup em arquivo JSON e disponibiliza p/ download e libera API p/ uso)_\n"
         "`import` _(importar arquivo .json, valida, e atualiza o banco de dados)_\n"
@@ -370,7 +342,10 @@ def process_complex_edit(chat_id, body):
     if not update_set:
         send_tg(chat_id, "⚠️ Nenhuma alteração detectada.")
         return
-    res = db.provas.update_many(query, {"$set": update_set})
+    ids = [d["_id"] for d in db.provas.find(query, {"_id": 1})]
+    res = db.provas.update_many({"_id": {"$in": ids}}, {"$set": update_set})
+    restamp_events({"_id": {"$in": ids}})
+    refresh_agenda(chat_id)
     send_tg(chat_id, f"✅ *Editado!* {res.modified_count} itens atualizados.")
     listar_agenda(chat_id)
 
@@ -389,10 +364,7 @@ def clear_state(user_id): db.edit_states.delete_many({"user_id": user_id})
 def processar_texto(chat_id, text, msg_id):
     if not text: return
     text = text.strip()
-    parts = text.split(maxsplit=1)
-    cmd_raw = parts[0].lower()
-    cmd = cmd_raw[1:] if cmd_raw.startswith("/") else cmd_raw
-    body = parts[1].strip() if len(parts) > 1 else ""
+    cmd, body = registry.split(text)
 
     state = get_state(chat_id)
     
@@ -439,6 +411,8 @@ def processar_texto(chat_id, text, msg_id):
                         return
                     val = dt_obj.strftime("%d/%m/%Y")
                 db.provas.update_one({"_id": ObjectId(doc_id)}, {"$set": {field: val}})
+                restamp_events({"_id": ObjectId(doc_id)})
+                refresh_agenda(chat_id)
                 delete_msg(chat_id, msg_id)
                 if state.get('prompt_msg_id'): delete_msg(chat_id, state.get('prompt_msg_id'))
                 clear_state(chat_id)
@@ -489,9 +463,10 @@ def processar_texto(chat_id, text, msg_id):
             # Salva
             db.user_settings.update_one(
                 {"user_id": chat_id}, 
-                {"$set": {"periodic_interval": secs, "last_periodic_run": get_brt_now()}}, 
+                {"$set": periodic_fields(secs, get_brt_now())}, 
                 upsert=True
             )
+            publish_settings_change(chat_id)
             
             if state.get('prompt_msg_id'): delete_msg(chat_id, state.get('prompt_msg_id'))
             delete_msg(chat_id, msg_id)
@@ -501,398 +476,416 @@ def processar_texto(chat_id, text, msg_id):
             menu_notificacao(chat_id)
             return
 
-    # --- COMANDOS CLI ---
-    if cmd == "add":
-        args, flags = parse_cli_args(body)
-        if not args: return enviar_ajuda(chat_id, eh_erro=True)
-        cat = args[0].title()
-        if len(args) == 1:
-            all_cats = get_all_cats(chat_id)
-            if cat in all_cats: send_tg(chat_id, f"⚠️ A categoria *{cat}* já existe.")
-            else:
-                db.user_settings.update_one({"user_id": chat_id}, {"$addToSet": {"custom_cats": cat}}, upsert=True)
-                send_tg(chat_id, f"✅ Categoria *{cat}* criada.")
-            listar_agenda(chat_id)
-            return
-        if len(args) < 3: return send_tg(chat_id, "⚠️ Use: `add Categoria Evento Data`")
-        mat = args[1]
-        dt_obj = parse_smart_date(args[2])
-        now = get_brt_now()
-        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        if not dt_obj or dt_obj < today: return send_tg(chat_id, "🚫 Data inválida ou passada.")
-        obs = flags["obs"] or (" ".join(args[3:]) if len(args) >= 4 else "")
-        delta_days = (dt_obj.date() - today.date()).days
-        is_imminent = delta_days <= 1
-        db.provas.insert_one({"user_id": chat_id, "tipo": cat, "materia": mat, "data": dt_obj.strftime("%d/%m/%Y"), "prioridade": flags["prio"] or "low", "observacoes": obs, "sent_24h": is_imminent})
-        db.user_settings.update_one({"user_id": chat_id}, {"$addToSet": {"custom_cats": cat}}, upsert=True)
-        send_tg(chat_id, f"✅ Agendado: *{mat}*")
+    registry.dispatch(chat_id, cmd, body, msg_id)
+
+# =========================================
+#       4.1 COMANDOS DE TEXTO
+# =========================================
+
+def ajuda_erro(chat_id, inv):
+    enviar_ajuda(chat_id, eh_erro=True)
+
+@registry.command("add", parse="cli", min_args=1, usage=ajuda_erro)
+def cmd_add(chat_id, inv):
+    args, flags = inv.args, inv.flags
+    cat = args[0].title()
+    if len(args) == 1:
+        all_cats = get_all_cats(chat_id)
+        if cat in all_cats: send_tg(chat_id, f"⚠️ A categoria *{cat}* já existe.")
+        else:
+            db.user_settings.update_one({"user_id": chat_id}, {"$addToSet": {"custom_cats": cat}}, upsert=True)
+            send_tg(chat_id, f"✅ Categoria *{cat}* criada.")
         listar_agenda(chat_id)
-        if is_imminent:
-            titulo = "🚨 *ATENÇÃO: É HOJE!* 🚨" if delta_days == 0 else "🚨 *ATENÇÃO: É AMANHÃ!* 🚨"
-            cat_sing = singularize(cat)
-            send_tg(chat_id, f"{titulo}\nO evento: *{mat}*\n📂 Categoria: {cat_sing}\n📅 Data: `{dt_obj.strftime('%d/%m/%Y')}`\nPrepare-se!")
-
-    elif cmd == "edit": process_complex_edit(chat_id, body)
-    elif cmd == "del":
-        args, _ = parse_cli_args(body)
-        if not args: return enviar_ajuda(chat_id, eh_erro=True)
-        query = {"user_id": chat_id, "tipo": regex_ci(args[0])}
-        desc = f"Categoria *{args[0]}*"
-        if len(args) >= 2:
-            query["materia"] = regex_ci(args[1])
-            desc = f"Evento *{args[1]}*"
-        if len(args) >= 3:
-            d = parse_smart_date(args[2])
-            if d: query["data"] = d.strftime("%d/%m/%Y")
-        count = db.provas.count_documents(query)
-        if count == 0: return send_tg(chat_id, "🚫 Nada encontrado.")
-        set_state(chat_id, "confirm_del", "wait", temp_data={"query": query})
-        kb = {"inline_keyboard": [[{"text": f"🔥 SIM, Apagar ({count})", "callback_data": "do_delete_cli"}], [{"text": "❌ Cancelar", "callback_data": "cancel_del"}]]}
-        send_tg(chat_id, f"⚠️ Apagar {desc}? (Itens: {count})", kb)
-
-    elif cmd == "tree":
-        # Divide para pegar o argumento (notify, f, v, h)
-        subcmd = body.split()[0].lower() if body else ""
-        
-        # Se não tiver argumento, retorna aviso
-        if not subcmd:
-            send_tg(chat_id, "⚠️ *Comando incompleto!*\nUse:\n`tree h` (Horizontal)\n`tree v` (Vertical)\n`tree notify` (Visualização de Alerta)")
-            return
+        return
+    if len(args) < 3: return send_tg(chat_id, "⚠️ Use: `add Categoria Evento Data`")
+    mat = args[1]
+    dt_obj = parse_smart_date(args[2])
+    now = get_brt_now()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if not dt_obj or dt_obj < today: return send_tg(chat_id, "🚫 Data inválida ou passada.")
+    obs = flags["obs"] or (" ".join(args[3:]) if len(args) >= 4 else "")
+    delta_days = (dt_obj.date() - today.date()).days
+    is_imminent = delta_days <= 1
+    try:
+        db.provas.insert_one(stamp_event({"user_id": chat_id, "tipo": cat, "materia": mat, "data": dt_obj.strftime("%d/%m/%Y"), "prioridade": flags["prio"] or "low", "observacoes": obs, "sent_24h": is_imminent}))
+    except DuplicateKeyError:
+        return send_tg(chat_id, f"♻️ *{mat}* em `{dt_obj.strftime('%d/%m/%Y')}` já está na agenda.")
+    refresh_agenda(chat_id)
+    db.user_settings.update_one({"user_id": chat_id}, {"$addToSet": {"custom_cats": cat}}, upsert=True)
+    send_tg(chat_id, f"✅ Agendado: *{mat}*")
+    listar_agenda(chat_id)
+    if is_imminent:
+        titulo = "🚨 *ATENÇÃO: É HOJE!* 🚨" if delta_days == 0 else "🚨 *ATENÇÃO: É AMANHÃ!* 🚨"
+        cat_sing = singularize(cat)
+        send_tg(chat_id, f"{titulo}\nO evento: *{mat}*\n📂 Categoria: {cat_sing}\n📅 Data: `{dt_obj.strftime('%d/%m/%Y')}`\nPrepare-se!")
+
+@registry.command("edit")
+def cmd_edit(chat_id, inv):
+    process_complex_edit(chat_id, inv.body)
+
+@registry.command("del", parse="cli", min_args=1, usage=ajuda_erro)
+def cmd_del(chat_id, inv):
+    args = inv.args
+    query = {"user_id": chat_id, "tipo": regex_ci(args[0])}
+    desc = f"Categoria *{args[0]}*"
+    if len(args) >= 2:
+        query["materia"] = regex_ci(args[1])
+        desc = f"Evento *{args[1]}*"
+    if len(args) >= 3:
+        d = parse_smart_date(args[2])
+        if d: query["data"] = d.strftime("%d/%m/%Y")
+    count = db.provas.count_documents(query)
+    if count == 0: return send_tg(chat_id, "🚫 Nada encontrado.")
+    set_state(chat_id, "confirm_del", "wait", temp_data={"query": query})
+    kb = {"inline_keyboard": [[{"text": f"🔥 SIM, Apagar ({count})", "callback_data": "do_delete_cli"}], [{"text": "❌ Cancelar", "callback_data": "cancel_del"}]]}
+    send_tg(chat_id, f"⚠️ Apagar {desc}? (Itens: {count})", kb)
+
+@registry.command("tree")
+def cmd_tree(chat_id, inv):
+    # Divide para pegar o argumento (notify, f, v, h)
+    subcmd = inv.body.split()[0].lower() if inv.body else ""
+
+    # Se não tiver argumento, retorna aviso
+    if not subcmd:
+        send_tg(chat_id, "⚠️ *Comando incompleto!*\nUse:\n`tree h` (Horizontal)\n`tree v` (Vertical)\n`tree notify` (Visualização de Alerta)")
+        return
 
-        provas = list(db.provas.find({"user_id": chat_id}).sort("data", 1))
+    provas = load_agenda(chat_id)
 
-        if subcmd == 'notify': 
-            send_tg(chat_id, generate_ascii_tree(provas, 'smart'))
-        elif subcmd in ['f', 'v']: # v de vertical, f de fixed (legado)
-            send_tg(chat_id, gerar_painel(chat_id, provas, "vertical"))
-        elif subcmd == 'h': # h de horizontal
-            send_tg(chat_id, gerar_painel(chat_id, provas, "horizontal"))
+    if subcmd == 'notify': 
+        send_tg(chat_id, generate_ascii_tree(provas, 'smart', today=get_brt_now().date()))
+    elif subcmd in ['f', 'v']: # v de vertical, f de fixed (legado)
+        send_tg(chat_id, gerar_painel(chat_id, provas, "vertical"))
+    elif subcmd == 'h': # h de horizontal
+        send_tg(chat_id, gerar_painel(chat_id, provas, "horizontal"))
+    else:
+        send_tg(chat_id, "⚠️ Opção inválida para tree. Use: `h`, `v` ou `notify`.")
+
+@registry.command("history", "historico")
+def cmd_history(chat_id, inv):
+    # Eventos vencidos que já foram para o arquivo (db.provas_archive)
+    antigos = load_history(get_linked_ids(chat_id))
+    if not antigos:
+        send_tg(chat_id, "🗄️ *Histórico vazio.* Eventos vencidos aparecem aqui depois de arquivados.")
+        return
+    send_tg(chat_id, gerar_painel(chat_id, antigos, "vertical", titulo="🗄️ *Histórico (Arquivados)*"))
+
+@registry.command("list")
+def cmd_list(chat_id, inv):
+    sub = inv.body.lower().strip()
+
+    # Se digitar apenas /list ou list, manda aviso
+    if not sub:
+        send_tg(chat_id, "⚠️ *Comando incompleto!*\nUse:\n`list cat` (Ver categorias)\n`list event` (Ver todos eventos)")
+        return
+
+    if sub in ["cat", "cats", "categoria", "categorias"]:
+        cats = get_all_cats(chat_id)
+        if not cats: 
+            send_tg(chat_id, "📂 *Nenhuma categoria encontrada.*")
         else:
-            send_tg(chat_id, "⚠️ Opção inválida para tree. Use: `h`, `v` ou `notify`.")
-
-    elif cmd == "list":
-         sub = body.lower().strip()
-         
-         # Se digitar apenas /list ou list, manda aviso
-         if not sub:
-             send_tg(chat_id, "⚠️ *Comando incompleto!*\nUse:\n`list cat` (Ver categorias)\n`list event` (Ver todos eventos)")
-             return
-
-         if sub in ["cat", "cats", "categoria", "categorias"]:
-             cats = get_all_cats(chat_id)
-             if not cats: 
-                 send_tg(chat_id, "📂 *Nenhuma categoria encontrada.*")
-             else:
-                 lines = ["📂 *Categorias Disponíveis:*"]
-                 for c in cats:
-                     # Conta quantos eventos existem nessa categoria
-                     count = db.provas.count_documents({"user_id": chat_id, "tipo": c})
-                     status_msg = f"{count} eventos" if count > 0 else "Vazia"
-                     lines.append(f"• {c} _({status_msg})_")
-                 
-                 kb = {"inline_keyboard": [[{"text": "⚙️ Gerenciar", "callback_data": "manage_cats"}]]}
-                 send_tg(chat_id, "\n".join(lines), kb)
-         
-         elif sub in ["event", "events", "evento", "eventos"]:
-             # Chama a função que gera o painel com os eventos listados
-             listar_agenda(chat_id)
-         
-         else:
-             send_tg(chat_id, "⚠️ Opção desconhecida. Use `list cat` ou `list event`.")
-
-    elif cmd == "list":
-         sub = body.lower().strip()
-         if sub in ["cat", "cats", "categoria", "categorias"]:
-             cats = get_all_cats(chat_id)
-             if not cats: send_tg(chat_id, "📂 *Nenhuma categoria encontrada.*")
-             else:
-                 lines = ["📂 *Categorias Disponíveis:*"]
-                 for c in cats:
-                     count = db.provas.count_documents({"user_id": chat_id, "tipo": c})
-                     lines.append(f"• {c} _({count} itens)_")
-                 kb = {"inline_keyboard": [[{"text": "⚙️ Gerenciar", "callback_data": "manage_cats"}]]}
-                 send_tg(chat_id, "\n".join(lines), kb)
-         else: listar_agenda(chat_id)
-
-    # --- COMANDO ALERT REFINADO ---
-    elif cmd == "alert":
-        # --- ADICIONE ESTE BLOCO NO INÍCIO DO IF ALERT ---
-        if "test" in body.lower():
-            # 1. Pega configurações
-            cfg = db.user_settings.find_one({"user_id": chat_id}) or {}
-            mode = cfg.get("notify_mode", "smart")
-            
-            # 2. Busca tarefas
-            all_tasks = list(db.provas.find({"user_id": chat_id}).sort("data", 1))
-            
-            if not all_tasks:
-                send_tg(chat_id, "📭 Sem eventos para testar.")
-                return
+            lines = ["📂 *Categorias Disponíveis:*"]
+            for c in cats:
+                # Conta quantos eventos existem nessa categoria
+                count = db.provas.count_documents({"user_id": chat_id, "tipo": c})
+                status_msg = f"{count} eventos" if count > 0 else "Vazia"
+                lines.append(f"• {c} _({status_msg})_")
+
+            kb = {"inline_keyboard": [[{"text": "⚙️ Gerenciar", "callback_data": "manage_cats"}]]}
+            send_tg(chat_id, "\n".join(lines), kb)
+
+    elif sub in ["event", "events", "evento", "eventos"]:
+        # Chama a função que gera o painel com os eventos listados
+        listar_agenda(chat_id)
 
-            # 3. Gera mensagem simulando o Worker
-            lines = [f"🔔 *Teste de Notificação ({mode.title()})*", ""]
-            
-            # (Opcional) Aqui você poderia repetir a lógica de filtro do notifier.py
-            # Mas para simplificar o teste visual, vamos mandar a Árvore Colorida direto
-            
-            lines.append("_Visualização da Árvore de Alerta:_")
-            lines.append(generate_ascii_tree(all_tasks, mode=mode))
-            
-            send_tg(chat_id, "\n".join(lines))
-            return
-        # -------------------------------------------------
+    else:
+        send_tg(chat_id, "⚠️ Opção desconhecida. Use `list cat` ou `list event`.")
+
+# --- COMANDO ALERT REFINADO ---
+@registry.command("alert", parse="tokens")
+def cmd_alert(chat_id, inv):
+    # --- ADICIONE ESTE BLOCO NO INÍCIO DO IF ALERT ---
+    if "test" in inv.body.lower():
+        # 1. Pega configurações
+        cfg = db.user_settings.find_one({"user_id": chat_id}) or {}
+        mode = cfg.get("notify_mode", "smart")
 
-        if "desativar" in body.lower():
-            db.user_settings.update_one({"user_id": chat_id}, {"$unset": {"periodic_interval": ""}})
-            send_tg(chat_id, "🔕 Alertas desativados.")
+        # 2. Busca tarefas
+        all_tasks = load_agenda(chat_id)
+
+        if not all_tasks:
+            send_tg(chat_id, "📭 Sem eventos para testar.")
             return
-        
-        # Help
-        if "-help" in body or not body:
-            if not body:
-                # Se vazio mostra o menu, mas se user digitou -help mostra texto detalhado
-                menu_notificacao(chat_id)
-                return
-            else:
-                help_txt = (
-                    "🔔 *CONFIGURAÇÃO DE ALERTAS*\n\n"
-                    "⚙️ *Parâmetros Principais:*\n"
-                    "`-f TEMPO`: Define a frequência.\n"
-                    "   _Formatos: h (horas), m (min), d (dias)_\n"
-                    "   _Limites: Min 1h | Max 7 dias_\n\n"
-                    "`-mode MODO`: Define o que será notificado.\n"
-                    "   `manual`: Resumo completo + Árvore completa.\n"
-                    "   `smart`: Apenas Urgentes/Próximos + Árvore filtrada.\n\n"
-                    "📝 *Exemplos de Tempo:*\n"
-                    "• `/alert -f 12h` (A cada 12 horas)\n"
-                    "• `/alert -f 1h30m` (Hora + Minuto)\n"
-                    "• `/alert -f 1d` (Diário)\n\n"
-                    "🔓 *Modo Desenvolvedor (Segundos):*\n"
-                    "Para ignorar o limite de 1h, use `-K CHAVE`:\n"
-                    "`/alert -f 3s -K a1b2c3...`\n\n"
-                    "📌 *Exemplo Completo:*\n"
-                    "`/alert -f 1h30m -mode smart`\n\n"
-                    "*Ativar & Desativar:*\n"
-                    "O alerta ativa automaticamente ao usar `/alert -f ...`\n"
-                    "`/alert desativar`"
-                )
-                send_tg(chat_id, help_txt)
-                return
 
-        try:
-            args = shlex.split(body)
-        except:
-            args = body.split()
+        # 3. Gera mensagem simulando o Worker
+        lines = [f"🔔 *Teste de Notificação ({mode.title()})*", ""]
 
-        update_data = {}
-        msg_log = []
-        
-        # Processamento de Frequência (-f)
-        if "-f" in args:
-            try:
-                idx = args.index("-f") + 1
-                if idx < len(args):
-                    val = args[idx]
-                    secs = parse_time_string(val)
-                    
-                    if secs:
-                        # Lógica de Validação e Bypass
-                        bypass_key = None
-                        if "-K" in args:
-                            k_idx = args.index("-K") + 1
-                            if k_idx < len(args):
-                                bypass_key = args[k_idx]
-                        
-                        is_admin = (bypass_key == Config.ADMIN_KEY) and Config.ADMIN_KEY
-                        
-                        # Limites
-                        MIN_SEC = 3600 # 1h
-                        MAX_SEC = 604800 # 7d
-                        
-                        if not is_admin:
-                            if secs < MIN_SEC:
-                                send_tg(chat_id, "⚠️ Mínimo de frequência: 1 hora.\nPara testes em segundos, contate o admin.")
-                                return
-                            if secs > MAX_SEC:
-                                send_tg(chat_id, "⚠️ Máximo de frequência: 7 dias.")
-                                return
-                        
-                        update_data["periodic_interval"] = secs
-                        update_data["last_periodic_run"] = get_brt_now()
-                        msg_log.append(f"Freq: {format_seconds(secs)}")
-                    else:
-                        send_tg(chat_id, "🚫 Formato de tempo inválido.")
-                        return
-            except Exception as e:
-                print(e)
-                pass
-
-        # Processamento de Modo (-mode)
-        if "-mode" in args:
-            try:
-                idx = args.index("-mode") + 1
-                if idx < len(args):
-                    m = args[idx].lower()
-                    if m in ["smart", "inteligente"]:
-                        update_data["notify_mode"] = "smart"
-                        msg_log.append("Modo: Smart 🧠")
-                    elif m in ["manual", "padrao", "all"]:
-                        update_data["notify_mode"] = "manual"
-                        msg_log.append("Modo: Manual 📋")
-                    else:
-                        send_tg(chat_id, "⚠️ Modo inválido. Use: `manual` ou `smart`.")
-                        return
-            except: pass
+        # (Opcional) Aqui você poderia repetir a lógica de filtro do notifier.py
+        # Mas para simplificar o teste visual, vamos mandar a Árvore Colorida direto
 
-        if update_data:
-            db.user_settings.update_one({"user_id": chat_id}, {"$set": update_data}, upsert=True)
-            send_tg(chat_id, f"✅ Configurado! " + " | ".join(msg_log))
-        else:
-            # Se digitou flags mas nao setou nada util
-            send_tg(chat_id, "⚠️ Nenhum parâmetro válido identificado.")
+        lines.append("_Visualização da Árvore de Alerta:_")
+        lines.append(generate_ascii_tree(all_tasks, mode=mode, today=get_brt_now().date()))
 
-    elif cmd == "export":
-        # 1. Recupera ou cria um token para o usuário
-        user_cfg = db.user_settings.find_one({"user_id": chat_id})
-        token = user_cfg.get("export_token")
-        
-        # Se não tiver token, cria um novo
-        if not token:
-            token = str(uuid.uuid4())
-            db.user_settings.update_one({"user_id": chat_id}, {"$set": {"export_token": token}}, upsert=True)
-        
-        # 2. Monta o Link usando a URL Pública do Config
-        link = f"{Config.API_PUBLIC_URL}/export/{token}"
-        
-        # 3. Busca os dados para o arquivo físico
-        data = list(db.provas.find({"user_id": chat_id}, {"_id": 0, "user_id": 0, "sent_24h": 0}))
-        
-        if not data:
-            send_tg(chat_id, "📭 *Sua agenda está vazia!*")
+        send_tg(chat_id, "\n".join(lines))
+        return
+    # -------------------------------------------------
+
+    if "desativar" in inv.body.lower():
+        db.user_settings.update_one({"user_id": chat_id}, {"$unset": PERIODIC_UNSET})
+        publish_settings_change(chat_id)
+        send_tg(chat_id, "🔕 Alertas desativados.")
+        return
+
+    # Help
+    if "-help" in inv.body or not inv.body:
+        if not inv.body:
+            # Se vazio mostra o menu, mas se user digitou -help mostra texto detalhado
+            menu_notificacao(chat_id)
+            return
+        else:
+            help_txt = (
+                "🔔 *CONFIGURAÇÃO DE ALERTAS*\n\n"
+                "⚙️ *Parâmetros Principais:*\n"
+                "`-f TEMPO`: Define a frequência.\n"
+                "   _Formatos: h (horas), m (min), d (dias)_\n"
+                "   _Limites: Min 1h | Max 7 dias_\n\n"
+                "`-mode MODO`: Define o que será notificado.\n"
+                "   `manual`: Resumo completo + Árvore completa.\n"
+                "   `smart`: Apenas Urgentes/Próximos + Árvore filtrada.\n\n"
+                "📝 *Exemplos de Tempo:*\n"
+                "• `/alert -f 12h` (A cada 12 horas)\n"
+                "• `/alert -f 1h30m` (Hora + Minuto)\n"
+                "• `/alert -f 1d` (Diário)\n\n"
+                "🔓 *Modo Desenvolvedor (Segundos):*\n"
+                "Para ignorar o limite de 1h, use `-K CHAVE`:\n"
+                "`/alert -f 3s -K a1b2c3...`\n\n"
+                "📌 *Exemplo Completo:*\n"
+                "`/alert -f 1h30m -mode smart`\n\n"
+                "*Ativar & Desativar:*\n"
+                "O alerta ativa automaticamente ao usar `/alert -f ...`\n"
+                "`/alert desativar`"
+            )
+            send_tg(chat_id, help_txt)
             return
-        
-        # 4. Mensagem com o Link
-        msg_text = (
-            "📦 *Backup & Integração API*\n\n"
-            "📄 *Arquivo:* Seu backup em JSON está logo abaixo.\n"
-            "🔗 *Link Dinâmico:* Use este link para integrar com Notion, Scriptable ou Apps de terceiros:\n\n"
-            f"`{link}`\n\n"
-            "⚠️ _Este link contém seus dados. Se vazar, clique em 'Revogar'._"
-        )
-        
-        kb = {"inline_keyboard": [[{"text": "🔄 Revogar/Gerar Novo Token", "callback_data": "revoke_token"}]]}
 
-        # Envia texto + link
-        send_tg(chat_id, msg_text, kb)
+    args = inv.tokens
 
-        # Envia arquivo físico
-        json_bytes = json.dumps(data, indent=4, ensure_ascii=False).encode('utf-8')
+    update_data = {}
+    msg_log = []
+
+    # Processamento de Frequência (-f)
+    if "-f" in args:
         try:
-            requests.post(
-                f"https://api.telegram.org/bot{Config.TELEGRAM_TOKEN}/sendDocument", 
-                data={"chat_id": chat_id}, 
-                files={"document": ("backup_agenda.json", json_bytes)}
-            )
+            idx = args.index("-f") + 1
+            if idx < len(args):
+                val = args[idx]
+                secs = parse_time_string(val)
+
+                if secs:
+                    # Lógica de Validação e Bypass
+                    bypass_key = None
+                    if "-K" in args:
+                        k_idx = args.index("-K") + 1
+                        if k_idx < len(args):
+                            bypass_key = args[k_idx]
+
+                    is_admin = (bypass_key == Config.ADMIN_KEY) and Config.ADMIN_KEY
+
+                    # Limites
+                    MIN_SEC = 3600 # 1h
+                    MAX_SEC = 604800 # 7d
+
+                    if not is_admin:
+                        if secs < MIN_SEC:
+                            send_tg(chat_id, "⚠️ Mínimo de frequência: 1 hora.\nPara testes em segundos, contate o admin.")
+                            return
+                        if secs > MAX_SEC:
+                            send_tg(chat_id, "⚠️ Máximo de frequência: 7 dias.")
+                            return
+
+                    update_data.update(periodic_fields(secs, get_brt_now()))
+                    msg_log.append(f"Freq: {format_seconds(secs)}")
+                else:
+                    send_tg(chat_id, "🚫 Formato de tempo inválido.")
+                    return
         except Exception as e:
-            send_tg(chat_id, "❌ Erro ao enviar arquivo.")
-            print(f"Erro export: {e}")
+            print(e)
+            pass
 
-    elif cmd == "import":
-        set_state(chat_id, "import_wait", "wait_file")
-        msg = (
-            "📥 *Importar Backup (.json)*\n\n"
-            "Envie agora o arquivo `.json` gerado anteriormente pelo comando `/export`.\n"
-            "⚠️ _Isso irá adicionar os eventos do arquivo à sua agenda atual._"
+    # Processamento de Modo (-mode)
+    if "-mode" in args:
+        try:
+            idx = args.index("-mode") + 1
+            if idx < len(args):
+                m = args[idx].lower()
+                if m in ["smart", "inteligente"]:
+                    update_data["notify_mode"] = "smart"
+                    msg_log.append("Modo: Smart 🧠")
+                elif m in ["manual", "padrao", "all"]:
+                    update_data["notify_mode"] = "manual"
+                    msg_log.append("Modo: Manual 📋")
+                else:
+                    send_tg(chat_id, "⚠️ Modo inválido. Use: `manual` ou `smart`.")
+                    return
+        except: pass
+
+    if update_data:
+        db.user_settings.update_one({"user_id": chat_id}, {"$set": update_data}, upsert=True)
+        publish_settings_change(chat_id)
+        send_tg(chat_id, f"✅ Configurado! " + " | ".join(msg_log))
+    else:
+        # Se digitou flags mas nao setou nada util
+        send_tg(chat_id, "⚠️ Nenhum parâmetro válido identificado.")
+
+@registry.command("export")
+def cmd_export(chat_id, inv):
+    # 1. Recupera ou cria um token para o usuário
+    user_cfg = db.user_settings.find_one({"user_id": chat_id})
+    token = user_cfg.get("export_token")
+
+    # Se não tiver token, cria um novo
+    if not token:
+        token = str(uuid.uuid4())
+        db.user_settings.update_one({"user_id": chat_id}, {"$set": {"export_token": token}}, upsert=True)
+
+    # 2. Monta o Link usando a URL Pública do Config
+    link = f"{Config.API_PUBLIC_URL}/export/{token}"
+
+    # 3. Busca os dados para o arquivo físico
+    data = export_agenda(chat_id)
+
+    if not data:
+        send_tg(chat_id, "📭 *Sua agenda está vazia!*")
+        return
+
+    # 4. Mensagem com o Link
+    msg_text = (
+        "📦 *Backup & Integração API*\n\n"
+        "📄 *Arquivo:* Seu backup em JSON está logo abaixo.\n"
+        "🔗 *Link Dinâmico:* Use este link para integrar com Notion, Scriptable ou Apps de terceiros:\n\n"
+        f"`{link}`\n\n"
+        "⚠️ _Este link contém seus dados. Se vazar, clique em 'Revogar'._"
+    )
+
+    kb = {"inline_keyboard": [[{"text": "🔄 Revogar/Gerar Novo Token", "callback_data": "revoke_token"}]]}
+
+    # Envia texto + link
+    send_tg(chat_id, msg_text, kb)
+
+    # Envia arquivo físico
+    json_bytes = json.dumps(data, indent=4, ensure_ascii=False).encode('utf-8')
+    try:
+        requests.post(
+            f"https://api.telegram.org/bot{Config.TELEGRAM_TOKEN}/sendDocument", 
+            data={"chat_id": chat_id}, 
+            files={"document": ("backup_agenda.json", json_bytes)}
         )
-        kb = {"inline_keyboard": [[{"text": "❌ Cancelar", "callback_data": "menu"}]]}
-        send_tg(chat_id, msg, kb)
-            
-    elif cmd == "link":
-        partners = get_partners(chat_id) # Pega lista de parceiros
-        
-        # A. STATUS (NOVO)
-        if body.lower() == "status":
-            if not partners:
-                send_tg(chat_id, "🔓 **Status:** Conta Isolada (Sem vínculos).")
-            else:
-                lines = ["🔗 **Contas Vinculadas:**"]
-                for p in partners:
-                    lines.append(f"• ID: `{p}`")
-                lines.append("\nPara remover uma específica, use:\n`/link desvincular ID`")
-                send_tg(chat_id, "\n".join(lines))
-            return
+    except Exception as e:
+        send_tg(chat_id, "❌ Erro ao enviar arquivo.")
+        print(f"Erro export: {e}")
+
+@registry.command("import")
+def cmd_import(chat_id, inv):
+    set_state(chat_id, "import_wait", "wait_file")
+    msg = (
+        "📥 *Importar Backup (.json)*\n\n"
+        "Envie agora o arquivo `.json` gerado anteriormente pelo comando `/export`.\n"
+        "⚠️ _Isso irá adicionar os eventos do arquivo à sua agenda atual._"
+    )
+    kb = {"inline_keyboard": [[{"text": "❌ Cancelar", "callback_data": "menu"}]]}
+    send_tg(chat_id, msg, kb)
 
-        # B. DESVINCULAR (ATUALIZADO)
-        if "desvincular" in body.lower():
-            parts = body.split()
-            # Se o usuário digitou: /link desvincular 123456
-            if len(parts) > 1 and parts[1].isdigit():
-                target_id = parts[1]
-                success, msg = unlink_specific(chat_id, target_id)
-                send_tg(chat_id, msg)
-            else:
-                # Desvincular TUDO (Sair do grupo)
-                msg = (
-                    "⚠️ *Gerenciar Vínculos*\n\n"
-                    f"Você possui {len(partners)} conexões.\n\n"
-                    "1️⃣ Para remover **apenas uma conta**, digite:\n"
-                    "`/link desvincular ID_DA_CONTA`\n"
-                    "(Veja o ID usando `/link status`)\n\n"
-                    "2️⃣ Para **sair de tudo** (desvincular-se totalmente):"
-                )
-                kb = {"inline_keyboard": [
-                    [{"text": "🚫 Sair de TODAS as contas", "callback_data": "do_unlink_confirm"}],
-                    [{"text": "🔙 Cancelar", "callback_data": "menu"}]
-                ]}
-                send_tg(chat_id, msg, kb)
-            return
+@registry.command("link")
+def cmd_link(chat_id, inv):
+    partners = get_partners(chat_id) # Pega lista de parceiros
 
-        # C. GERAR CÓDIGO (DISCORD)
-        if body.lower() == "discord":
-            # Verifica se já tem contas (aviso amigável)
-            aviso_extra = ""
-            if len(partners) > 0:
-                aviso_extra = f"\n⚠️ _Nota: Você já tem {len(partners)} conta(s) vinculada(s). Este novo vínculo será adicionado ao grupo existente._"
+    # A. STATUS (NOVO)
+    if inv.body.lower() == "status":
+        if not partners:
+            send_tg(chat_id, "🔓 **Status:** Conta Isolada (Sem vínculos).")
+        else:
+            lines = ["🔗 **Contas Vinculadas:**"]
+            for p in partners:
+                lines.append(f"• ID: `{p}`")
+            lines.append("\nPara remover uma específica, use:\n`/link desvincular ID`")
+            send_tg(chat_id, "\n".join(lines))
+        return
 
-            token = generate_link_code("telegram", chat_id)
-            msg = (
-                f"🔐 *Código de Vínculo Gerado*\n"
-                f"`{token}`\n\n"
-                f"1. Copie este código.\n"
-                f"2. Vá no seu Bot do **Discord**.\n"
-                f"3. Digite: `!link {token}`\n"
-                f"_Válido por 5 minutos._"
-                f"{aviso_extra}"
-            )
+    # B. DESVINCULAR (ATUALIZADO)
+    if "desvincular" in inv.body.lower():
+        parts = inv.body.split()
+        # Se o usuário digitou: /link desvincular 123456
+        if len(parts) > 1 and parts[1].isdigit():
+            target_id = parts[1]
+            success, msg = unlink_specific(chat_id, target_id)
             send_tg(chat_id, msg)
-        
-        # D. ENTRAR COM CÓDIGO (VALIDAÇÃO)
-        elif body and body.lower() not in ["discord", "status", "desvincular"]:
-            # Verifica se já tem contas antes (opcional, só info visual)
-            token = body.strip()
-            success, resp = validate_link_code(token, "telegram", chat_id)
-            send_tg(chat_id, resp)
-            
-        # E. MENU AJUDA DO LINK
         else:
+            # Desvincular TUDO (Sair do grupo)
             msg = (
-                "🔗 *Central de Vínculos*\n\n"
-                "`/link discord` - Gerar código p/ conectar no Discord\n"
-                "`/link status` - Ver contas conectadas\n"
-                "`/link CÓDIGO` - Colar código vindo do Discord\n"
-                "`/link desvincular` - Opções de remoção"
+                "⚠️ *Gerenciar Vínculos*\n\n"
+                f"Você possui {len(partners)} conexões.\n\n"
+                "1️⃣ Para remover **apenas uma conta**, digite:\n"
+                "`/link desvincular ID_DA_CONTA`\n"
+                "(Veja o ID usando `/link status`)\n\n"
+                "2️⃣ Para **sair de tudo** (desvincular-se totalmente):"
             )
-            send_tg(chat_id, msg)
+            kb = {"inline_keyboard": [
+                [{"text": "🚫 Sair de TODAS as contas", "callback_data": "do_unlink_confirm"}],
+                [{"text": "🔙 Cancelar", "callback_data": "menu"}]
+            ]}
+            send_tg(chat_id, msg, kb)
+        return
 
-    elif cmd in ["start", "menu", "cancel"]:
-        clear_state(chat_id)
-        listar_agenda(chat_id)
-    elif cmd in ["ajuda", "help"]: 
-        enviar_ajuda(chat_id)
-    else: 
-        # Nova resposta curta para comandos errados
-        send_tg(chat_id, "⚠️ *Comando ou sintaxe inválida!*\nUse o menu \"❓ Ajuda\" ou digite `/ajuda` / `/help`")
+    # C. GERAR CÓDIGO (DISCORD)
+    if inv.body.lower() == "discord":
+        # Verifica se já tem contas (aviso amigável)
+        aviso_extra = ""
+        if len(partners) > 0:
+            aviso_extra = f"\n⚠️ _Nota: Você já tem {len(partners)} conta(s) vinculada(s). Este novo vínculo será adicionado ao grupo existente._"
+
+        token = generate_link_code("telegram", chat_id)
+        msg = (
+            f"🔐 *Código de Vínculo Gerado*\n"
+            f"`{token}`\n\n"
+            f"1. Copie este código.\n"
+            f"2. Vá no seu Bot do **Discord**.\n"
+            f"3. Digite: `!link {token}`\n"
+            f"_Válido por 5 minutos._"
+            f"{aviso_extra}"
+        )
+        send_tg(chat_id, msg)
+
+    # D. ENTRAR COM CÓDIGO (VALIDAÇÃO)
+    elif inv.body and inv.body.lower() not in ["discord", "status", "desvincular"]:
+        # Verifica se já tem contas antes (opcional, só info visual)
+        token = inv.body.strip()
+        success, resp = validate_link_code(token, "telegram", chat_id)
+        send_tg(chat_id, resp)
+
+    # E. MENU AJUDA DO LINK
+    else:
+        msg = (
+            "🔗 *Central de Vínculos*\n\n"
+            "`/link discord` - Gerar código p/ conectar no Discord\n"
+            "`/link status` - Ver contas conectadas\n"
+            "`/link CÓDIGO` - Colar código vindo do Discord\n"
+            "`/link desvincular` - Opções de remoção"
+        )
+        send_tg(chat_id, msg)
+
+@registry.command("start", "menu", "cancel")
+def cmd_start(chat_id, inv):
+    clear_state(chat_id)
+    listar_agenda(chat_id)
+
+@registry.command("ajuda", "help")
+def cmd_ajuda(chat_id, inv):
+    enviar_ajuda(chat_id)
 
+@registry.unknown
+def cmd_unknown(chat_id, inv):
+    # Nova resposta curta para comandos errados
+    send_tg(chat_id, "⚠️ *Comando ou sintaxe inválida!*\nUse o menu \"❓ Ajuda\" ou digite `/ajuda` / `/help`")
 
 def processar_documento(chat_id, document, caption, msg_id):
     # Verifica se estava aguardando importação
@@ -920,21 +913,8 @@ def processar_documento(chat_id, document, caption, msg_id):
             send_tg(chat_id, "🚫 Erro: O JSON deve ser uma lista.")
             return
 
-        # 2. Validar Itens
-        valid_items = []
-        for item in data_import:
-            if "materia" not in item or "data" not in item: continue
-            
-            # Sanitiza o item para inserção futura
-            new_item = item.copy()
-            if "_id" in new_item: del new_item["_id"]
-            new_item["user_id"] = chat_id
-            new_item["origin"] = "import_json"
-            if "tipo" not in new_item: new_item["tipo"] = "Geral"
-            if "prioridade" not in new_item: new_item["prioridade"] = "low"
-            if "observacoes" not in new_item: new_item["observacoes"] = "" # Garante campo vazio se não tiver
-            
-            valid_items.append(new_item)
+        # 2. Validar Itens (Sanitiza para inserção futura)
+        valid_items = prepare_import_items(data_import, chat_id, "import_json")
 
         if not valid_items:
             send_tg(chat_id, "🚫 Nenhum item válido encontrado.")
@@ -1020,388 +1000,352 @@ def menu_notificacao(chat_id, msg_id=None):
     send_tg(chat_id, texto, kb, msg_id)
 
 def processar_botao(chat_id, data, msg_id):
-    if data == "menu":
-        clear_state(chat_id)
-        # Chama o listar_agenda simplificado (sem delete_mode)
-        listar_agenda(chat_id, msg_id)
-    elif data == "menu_del_mode":
-        clear_state(chat_id)
-        listar_agenda(chat_id, msg_id, delete_mode=True)
-    
-    # 1. Entrar no menu gerenciar (Padrão: Edit)
-    elif data == "manage_init":
-        menu_gerenciar(chat_id, mode="edit", msg_id=msg_id)
-
-    # 2. Alternar o modo (Edit <-> Del)
-    elif data.startswith("manage_mode:"):
-        new_mode = data.split(":")[1]
-        menu_gerenciar(chat_id, mode=new_mode, msg_id=msg_id)
-
-    # 3. Ajuste no retorno da deleção (opcional, para não voltar pro menu principal direto)
-    elif data.startswith("quick_del_do:"):
-        doc_id = data.split(":")[1]
-        db.provas.delete_one({"_id": ObjectId(doc_id)})
-        menu_gerenciar(chat_id, mode="del", msg_id=msg_id)
-
-    elif data.startswith("manage_del_ask:"):
-        doc_id = data.split(":")[1]
-        doc = db.provas.find_one({"_id": ObjectId(doc_id)})
-        if not doc: return menu_gerenciar(chat_id, mode="del", msg_id=msg_id)
-        
-        txt = f"🗑️ *Confirmar Exclusão?*\n{doc['materia']} ({doc['data']})"
-        
-        # Botão SIM vai para um novo 'do'
-        # Botão NÃO volta para 'manage_mode:del' (o segredo está aqui)
-        kb = {"inline_keyboard": [
-            [{"text": "🔥 SIM, APAGAR", "callback_data": f"manage_del_do:{doc_id}"}],
-            [{"text": "🔙 Não (Voltar)", "callback_data": "manage_mode:del"}] 
-        ]}
-        send_tg(chat_id, txt, kb, msg_id)
+    registry.press(chat_id, data, msg_id)
+
+@registry.callback("menu")
+def cb_menu(chat_id, data, msg_id):
+    clear_state(chat_id)
+    # Chama o listar_agenda simplificado (sem delete_mode)
+    listar_agenda(chat_id, msg_id)
+
+@registry.callback("menu_del_mode")
+def cb_menu_del_mode(chat_id, data, msg_id):
+    clear_state(chat_id)
+    listar_agenda(chat_id, msg_id, delete_mode=True)
+
+# 1. Entrar no menu gerenciar (Padrão: Edit)
+@registry.callback("manage_init")
+def cb_manage_init(chat_id, data, msg_id):
+    menu_gerenciar(chat_id, mode="edit", msg_id=msg_id)
+
+# 2. Alternar o modo (Edit <-> Del)
+@registry.callback("manage_mode:")
+def cb_manage_mode(chat_id, data, msg_id):
+    new_mode = data.split(":")[1]
+    menu_gerenciar(chat_id, mode=new_mode, msg_id=msg_id)
+
+# 3. Ajuste no retorno da deleção (opcional, para não voltar pro menu principal direto)
+@registry.callback("quick_del_do:")
+def cb_quick_del_do(chat_id, data, msg_id):
+    doc_id = data.split(":")[1]
+    db.provas.delete_one({"_id": ObjectId(doc_id)})
+    refresh_agenda(chat_id)
+    menu_gerenciar(chat_id, mode="del", msg_id=msg_id)
+
+@registry.callback("manage_del_ask:")
+def cb_manage_del_ask(chat_id, data, msg_id):
+    doc_id = data.split(":")[1]
+    doc = db.provas.find_one({"_id": ObjectId(doc_id)})
+    if not doc: return menu_gerenciar(chat_id, mode="del", msg_id=msg_id)
 
-    elif data.startswith("manage_del_do:"):
-        doc_id = data.split(":")[1]
-        db.provas.delete_one({"_id": ObjectId(doc_id)})
-        # Força o retorno para o modo delete
-        menu_gerenciar(chat_id, mode="del", msg_id=msg_id)
+    txt = f"🗑️ *Confirmar Exclusão?*\n{doc['materia']} ({doc['data']})"
 
-    elif data == "wiz_init":
-        all_cats = get_all_cats(chat_id)
-        buttons = [{"text": f"📂 {c}", "callback_data": f"wiz_cat:{c}"} for c in all_cats]
-        rows = create_grid(buttons, cols=3)
-        kb = {"inline_keyboard": rows}
-        kb["inline_keyboard"].append([{"text": "✨ Nova Categoria...", "callback_data": "wiz_cat:NEW"}])
-        kb["inline_keyboard"].append([{"text": "⚙️ Gerenciar Categorias", "callback_data": "manage_cats"}])
-        kb["inline_keyboard"].append([{"text": "❌ Cancelar", "callback_data": "menu"}])
-        send_tg(chat_id, "🆕 *Adicionar Evento*\nEscolha a Categoria:", kb, msg_id)
-    
-    elif data.startswith("wiz_cat:"):
-        escolha = data.split(":")[1]
-        if escolha == "NEW":
-            kb = {"inline_keyboard": [[{"text": "❌ Cancelar", "callback_data": "menu"}]]}
-            p = send_tg(chat_id, "✨ Digite o nome da *Nova Categoria*:", kb)
-            set_state(chat_id, "create", "cat_input", temp_data={}, prompt_msg_id=p)
-        else:
-            set_state(chat_id, "create", "materia", temp_data={"tipo": escolha})
-            kb = {"inline_keyboard": [[{"text": "❌ Cancelar", "callback_data": "menu"}]]}
-            send_tg(chat_id, f"📂 Categoria: *{escolha}*\n⌨️ Digite o nome da **Matéria**:", kb, msg_id)
-    
-    elif data.startswith("wiz_prio:"):
-        prio = data.split(":")[1]
-        st = get_state(chat_id)
-        if st:
-            temp = st['temp_data']
-            dt_obj = parse_smart_date(temp['data'])
-            now = get_brt_now()
-            delta_days = (dt_obj.date() - now.date()).days
-            is_imminent = delta_days <= 1
-
-            db.provas.insert_one({
+    # Botão SIM vai para um novo 'do'
+    # Botão NÃO volta para 'manage_mode:del' (o segredo está aqui)
+    kb = {"inline_keyboard": [
+        [{"text": "🔥 SIM, APAGAR", "callback_data": f"manage_del_do:{doc_id}"}],
+        [{"text": "🔙 Não (Voltar)", "callback_data": "manage_mode:del"}] 
+    ]}
+    send_tg(chat_id, txt, kb, msg_id)
+
+@registry.callback("manage_del_do:")
+def cb_manage_del_do(chat_id, data, msg_id):
+    doc_id = data.split(":")[1]
+    db.provas.delete_one({"_id": ObjectId(doc_id)})
+    refresh_agenda(chat_id)
+    # Força o retorno para o modo delete
+    menu_gerenciar(chat_id, mode="del", msg_id=msg_id)
+
+@registry.callback("wiz_init")
+def cb_wiz_init(chat_id, data, msg_id):
+    all_cats = get_all_cats(chat_id)
+    buttons = [{"text": f"📂 {c}", "callback_data": f"wiz_cat:{c}"} for c in all_cats]
+    rows = create_grid(buttons, cols=3)
+    kb = {"inline_keyboard": rows}
+    kb["inline_keyboard"].append([{"text": "✨ Nova Categoria...", "callback_data": "wiz_cat:NEW"}])
+    kb["inline_keyboard"].append([{"text": "⚙️ Gerenciar Categorias", "callback_data": "manage_cats"}])
+    kb["inline_keyboard"].append([{"text": "❌ Cancelar", "callback_data": "menu"}])
+    send_tg(chat_id, "🆕 *Adicionar Evento*\nEscolha a Categoria:", kb, msg_id)
+
+@registry.callback("wiz_cat:")
+def cb_wiz_cat(chat_id, data, msg_id):
+    escolha = data.split(":")[1]
+    if escolha == "NEW":
+        kb = {"inline_keyboard": [[{"text": "❌ Cancelar", "callback_data": "menu"}]]}
+        p = send_tg(chat_id, "✨ Digite o nome da *Nova Categoria*:", kb)
+        set_state(chat_id, "create", "cat_input", temp_data={}, prompt_msg_id=p)
+    else:
+        set_state(chat_id, "create", "materia", temp_data={"tipo": escolha})
+        kb = {"inline_keyboard": [[{"text": "❌ Cancelar", "callback_data": "menu"}]]}
+        send_tg(chat_id, f"📂 Categoria: *{escolha}*\n⌨️ Digite o nome da **Matéria**:", kb, msg_id)
+
+@registry.callback("wiz_prio:")
+def cb_wiz_prio(chat_id, data, msg_id):
+    prio = data.split(":")[1]
+    st = get_state(chat_id)
+    if st:
+        temp = st['temp_data']
+        dt_obj = parse_smart_date(temp['data'])
+        now = get_brt_now()
+        delta_days = (dt_obj.date() - now.date()).days
+        is_imminent = delta_days <= 1
+
+        clear_state(chat_id)
+        try:
+            db.provas.insert_one(stamp_event({
                 "user_id": chat_id, "materia": temp['materia'], 
                 "data": temp['data'], "prioridade": prio, 
                 "observacoes": "", "tipo": temp.get('tipo', 'Geral'),
                 "sent_24h": is_imminent
-            })
-            clear_state(chat_id)
-            delete_msg(chat_id, msg_id)
-            send_tg(chat_id, f"✅ Agendado: *{temp['materia']}*")
-            listar_agenda(chat_id, None)
+            }))
+        except DuplicateKeyError:
+            return send_tg(chat_id, f"♻️ *{temp['materia']}* em `{temp['data']}` já está na agenda.", msg_id=msg_id)
+        refresh_agenda(chat_id)
+        delete_msg(chat_id, msg_id)
+        send_tg(chat_id, f"✅ Agendado: *{temp['materia']}*")
+        listar_agenda(chat_id, None)
 
-            if is_imminent:
-                titulo = "🚨 *ATENÇÃO: É HOJE!* 🚨" if delta_days == 0 else "🚨 *ATENÇÃO: É AMANHÃ!* 🚨"
-                cat_sing = singularize(temp.get('tipo', 'Geral'))
-                send_tg(chat_id, f"{titulo}\nO evento: *{temp['materia']}*\n📂 Categoria: {cat_sing}\n📅 Data: `{temp['data']}`\nPrepare-se!")
+        if is_imminent:
+            titulo = "🚨 *ATENÇÃO: É HOJE!* 🚨" if delta_days == 0 else "🚨 *ATENÇÃO: É AMANHÃ!* 🚨"
+            cat_sing = singularize(temp.get('tipo', 'Geral'))
+            send_tg(chat_id, f"{titulo}\nO evento: *{temp['materia']}*\n📂 Categoria: {cat_sing}\n📅 Data: `{temp['data']}`\nPrepare-se!")
 
-    elif data == "manage_cats":
-        all_cats = get_all_cats(chat_id)
-        kb = {"inline_keyboard": []}
-        if not all_cats:
-            answer_callback(data, "Nenhuma categoria.")
-        else:
-            for c in all_cats:
-                kb["inline_keyboard"].append([{"text": f"🗑️ {c}", "callback_data": f"del_cat_ask:{c}"}])
-        kb["inline_keyboard"].append([{"text": "🔙 Voltar", "callback_data": "wiz_init"}])
-        send_tg(chat_id, "⚙️ *Apagar Categorias*\n(Remove da lista e apaga eventos associados!)", kb, msg_id)
-
-    elif data.startswith("del_cat_ask:"):
-        cat = data.split(":")[1]
-        count = db.provas.count_documents({"user_id": chat_id, "tipo": cat})
-        msg = f"⚠️ *Apagar Categoria '{cat}'?*\nItens vinculados: {count}"
-        if count == 0: msg += "\n(Categoria vazia, será removida da lista)"
-        kb = {"inline_keyboard": [
-            [{"text": "🔥 CONFIRMAR EXCLUSÃO", "callback_data": f"del_cat_do:{cat}"}],
-            [{"text": "🔙 Cancelar", "callback_data": "manage_cats"}]
-        ]}
-        send_tg(chat_id, msg, kb, msg_id)
-
-    elif data.startswith("del_cat_do:"):
-        cat = data.split(":")[1]
-        res = db.provas.delete_many({"user_id": chat_id, "tipo": cat})
-        db.user_settings.update_one({"user_id": chat_id}, {"$pull": {"custom_cats": cat}})
-        send_tg(chat_id, f"🗑️ Categoria *{cat}* removida ({res.deleted_count} eventos apagados).")
-        processar_botao(chat_id, "manage_cats", None)
-
-    elif data.startswith("open:"): menu_item(chat_id, data.split(":")[1], msg_id)
-
-    elif data.startswith("quick_del_ask:"):
-        doc_id = data.split(":")[1]
-        doc = db.provas.find_one({"_id": ObjectId(doc_id)})
-        if not doc: return listar_agenda(chat_id, msg_id)
-        txt = f"🗑️ *Tem certeza?*\nApagar: {doc['materia']} ({doc['data']})"
-        kb = {"inline_keyboard": [[{"text": "🔥 SIM, APAGAR", "callback_data": f"quick_del_do:{doc_id}"}], [{"text": "🔙 Não", "callback_data": f"open:{doc_id}"}]]}
-        send_tg(chat_id, txt, kb, msg_id)
-
-    elif data.startswith("edit_type_init:"):
-        doc_id = data.split(":")[1]
-        cats = get_all_cats(chat_id)
-        btns = [{"text": c, "callback_data": f"set_edit_cat:{doc_id}:{c}"} for c in cats]
-        kb = {"inline_keyboard": create_grid(btns, 2)}
-        kb["inline_keyboard"].append([{"text": "🔙 Voltar", "callback_data": f"open:{doc_id}"}])
-        send_tg(chat_id, "📂 Escolha a nova Categoria:", kb, msg_id)
-
-    elif data.startswith("set_edit_cat:"):
-        _, doc_id, new_cat = data.split(":")
-        db.provas.update_one({"_id": ObjectId(doc_id)}, {"$set": {"tipo": new_cat}})
-        menu_item(chat_id, doc_id, msg_id)
-
-    elif data.startswith("edit_prio_menu:"):
-        doc_id = data.split(":")[1]
-        kb = {"inline_keyboard": [
-            [{"text": "🚨 Alta", "callback_data": f"set_edit_prio:{doc_id}:critical"},
-             {"text": "⚠️ Média", "callback_data": f"set_edit_prio:{doc_id}:medium"},
-             {"text": "🟢 Baixa", "callback_data": f"set_edit_prio:{doc_id}:low"}],
-            [{"text": "🔙 Voltar", "callback_data": f"open:{doc_id}"}]
-        ]}
-        send_tg(chat_id, "📊 Escolha a Prioridade:", kb, msg_id)
-
-    elif data.startswith("set_edit_prio:"):
-        _, doc_id, prio = data.split(":")
-        db.provas.update_one({"_id": ObjectId(doc_id)}, {"$set": {"prioridade": prio}})
-        menu_item(chat_id, doc_id, msg_id)
-
-    elif data.startswith("editf:"):
-        _, field, doc_id = data.split(":")
-        p = send_tg(chat_id, f"✍️ Digite o novo valor para *{field}*:", {"inline_keyboard":[[{"text":"❌ Cancelar", "callback_data":f"open:{doc_id}"}]]})
-        set_state(chat_id, "create", "edit_val", temp_data={"field": field}, doc_id=doc_id, prompt_msg_id=p)
-
-    elif data == "do_delete_cli":
-        st = get_state(chat_id)
-        if st and st['mode'] == 'confirm_del':
-            db.provas.delete_many(st['temp_data']['query'])
-            clear_state(chat_id)
-            delete_msg(chat_id, msg_id)
-            send_tg(chat_id, "🗑️ Itens apagados.")
-            listar_agenda(chat_id)
-            
-    elif data == "cancel_del":
+@registry.callback("manage_cats")
+def cb_manage_cats(chat_id, data, msg_id):
+    all_cats = get_all_cats(chat_id)
+    kb = {"inline_keyboard": []}
+    if not all_cats:
+        answer_callback(data, "Nenhuma categoria.")
+    else:
+        for c in all_cats:
+            kb["inline_keyboard"].append([{"text": f"🗑️ {c}", "callback_data": f"del_cat_ask:{c}"}])
+    kb["inline_keyboard"].append([{"text": "🔙 Voltar", "callback_data": "wiz_init"}])
+    send_tg(chat_id, "⚙️ *Apagar Categorias*\n(Remove da lista e apaga eventos associados!)", kb, msg_id)
+
+@registry.callback("del_cat_ask:")
+def cb_del_cat_ask(chat_id, data, msg_id):
+    cat = data.split(":")[1]
+    count = db.provas.count_documents({"user_id": chat_id, "tipo": cat})
+    msg = f"⚠️ *Apagar Categoria '{cat}'?*\nItens vinculados: {count}"
+    if count == 0: msg += "\n(Categoria vazia, será removida da lista)"
+    kb = {"inline_keyboard": [
+        [{"text": "🔥 CONFIRMAR EXCLUSÃO", "callback_data": f"del_cat_do:{cat}"}],
+        [{"text": "🔙 Cancelar", "callback_data": "manage_cats"}]
+    ]}
+    send_tg(chat_id, msg, kb, msg_id)
+
+@registry.callback("del_cat_do:")
+def cb_del_cat_do(chat_id, data, msg_id):
+    cat = data.split(":")[1]
+    res = db.provas.delete_many({"user_id": chat_id, "tipo": cat})
+    refresh_agenda(chat_id)
+    db.user_settings.update_one({"user_id": chat_id}, {"$pull": {"custom_cats": cat}})
+    send_tg(chat_id, f"🗑️ Categoria *{cat}* removida ({res.deleted_count} eventos apagados).")
+    cb_manage_cats(chat_id, "manage_cats", None)
+
+@registry.callback("open:")
+def cb_open(chat_id, data, msg_id):
+    menu_item(chat_id, data.split(":")[1], msg_id)
+
+@registry.callback("quick_del_ask:")
+def cb_quick_del_ask(chat_id, data, msg_id):
+    doc_id = data.split(":")[1]
+    doc = db.provas.find_one({"_id": ObjectId(doc_id)})
+    if not doc: return listar_agenda(chat_id, msg_id)
+    txt = f"🗑️ *Tem certeza?*\nApagar: {doc['materia']} ({doc['data']})"
+    kb = {"inline_keyboard": [[{"text": "🔥 SIM, APAGAR", "callback_data": f"quick_del_do:{doc_id}"}], [{"text": "🔙 Não", "callback_data": f"open:{doc_id}"}]]}
+    send_tg(chat_id, txt, kb, msg_id)
+
+@registry.callback("edit_type_init:")
+def cb_edit_type_init(chat_id, data, msg_id):
+    doc_id = data.split(":")[1]
+    cats = get_all_cats(chat_id)
+    btns = [{"text": c, "callback_data": f"set_edit_cat:{doc_id}:{c}"} for c in cats]
+    kb = {"inline_keyboard": create_grid(btns, 2)}
+    kb["inline_keyboard"].append([{"text": "🔙 Voltar", "callback_data": f"open:{doc_id}"}])
+    send_tg(chat_id, "📂 Escolha a nova Categoria:", kb, msg_id)
+
+@registry.callback("set_edit_cat:")
+def cb_set_edit_cat(chat_id, data, msg_id):
+    _, doc_id, new_cat = data.split(":")
+    db.provas.update_one({"_id": ObjectId(doc_id)}, {"$set": {"tipo": new_cat}})
+    restamp_events({"_id": ObjectId(doc_id)})
+    refresh_agenda(chat_id)
+    menu_item(chat_id, doc_id, msg_id)
+
+@registry.callback("edit_prio_menu:")
+def cb_edit_prio_menu(chat_id, data, msg_id):
+    doc_id = data.split(":")[1]
+    kb = {"inline_keyboard": [
+        [{"text": "🚨 Alta", "callback_data": f"set_edit_prio:{doc_id}:critical"},
+         {"text": "⚠️ Média", "callback_data": f"set_edit_prio:{doc_id}:medium"},
+         {"text": "🟢 Baixa", "callback_data": f"set_edit_prio:{doc_id}:low"}],
+        [{"text": "🔙 Voltar", "callback_data": f"open:{doc_id}"}]
+    ]}
+    send_tg(chat_id, "📊 Escolha a Prioridade:", kb, msg_id)
+
+@registry.callback("set_edit_prio:")
+def cb_set_edit_prio(chat_id, data, msg_id):
+    _, doc_id, prio = data.split(":")
+    db.provas.update_one({"_id": ObjectId(doc_id)}, {"$set": {"prioridade": prio}})
+    refresh_agenda(chat_id)
+    menu_item(chat_id, doc_id, msg_id)
+
+@registry.callback("editf:")
+def cb_editf(chat_id, data, msg_id):
+    _, field, doc_id = data.split(":")
+    p = send_tg(chat_id, f"✍️ Digite o novo valor para *{field}*:", {"inline_keyboard":[[{"text":"❌ Cancelar", "callback_data":f"open:{doc_id}"}]]})
+    set_state(chat_id, "create", "edit_val", temp_data={"field": field}, doc_id=doc_id, prompt_msg_id=p)
+
+@registry.callback("do_delete_cli")
+def cb_do_delete_cli(chat_id, data, msg_id):
+    st = get_state(chat_id)
+    if st and st['mode'] == 'confirm_del':
+        db.provas.delete_many(st['temp_data']['query'])
+        refresh_agenda(chat_id)
         clear_state(chat_id)
         delete_msg(chat_id, msg_id)
-        send_tg(chat_id, "Cancelado.")
-        
-    elif data == "toggle_layout":
-        toggle_user_layout(chat_id)
-        listar_agenda(chat_id, msg_id)
+        send_tg(chat_id, "🗑️ Itens apagados.")
+        listar_agenda(chat_id)
 
-    elif data == "notify_menu": menu_notificacao(chat_id, msg_id)
-    
-    elif data.startswith("set_cycle:"):
-        s = int(data.split(":")[1])
-        if s==0: db.user_settings.update_one({"user_id": chat_id}, {"$unset": {"periodic_interval": ""}})
-        else: db.user_settings.update_one({"user_id": chat_id}, {"$set": {"periodic_interval": s, "last_periodic_run": get_brt_now()}}, upsert=True)
-        menu_notificacao(chat_id, msg_id)
-
-    elif data == "toggle_notify_mode":
-        cfg = db.user_settings.find_one({"user_id": chat_id})
-        current_mode = cfg.get("notify_mode", "smart")
-        
-        # Inverte o modo
-        new_mode = "manual" if current_mode == "smart" else "smart"
-        
-        db.user_settings.update_one(
-            {"user_id": chat_id}, 
-            {"$set": {"notify_mode": new_mode}}, 
-            upsert=True
-        )
-        # Recarrega o menu com o texto atualizado
-        menu_notificacao(chat_id, msg_id)
+@registry.callback("cancel_del")
+def cb_cancel_del(chat_id, data, msg_id):
+    clear_state(chat_id)
+    delete_msg(chat_id, msg_id)
+    send_tg(chat_id, "Cancelado.")
+
+@registry.callback("toggle_layout")
+def cb_toggle_layout(chat_id, data, msg_id):
+    toggle_user_layout(chat_id)
+    listar_agenda(chat_id, msg_id)
+
+@registry.callback("notify_menu")
+def cb_notify_menu(chat_id, data, msg_id):
+    menu_notificacao(chat_id, msg_id)
+
+@registry.callback("set_cycle:")
+def cb_set_cycle(chat_id, data, msg_id):
+    s = int(data.split(":")[1])
+    if s==0: db.user_settings.update_one({"user_id": chat_id}, {"$unset": PERIODIC_UNSET})
+    else: db.user_settings.update_one({"user_id": chat_id}, {"$set": periodic_fields(s, get_brt_now())}, upsert=True)
+    publish_settings_change(chat_id)
+    menu_notificacao(chat_id, msg_id)
+
+@registry.callback("toggle_notify_mode")
+def cb_toggle_notify_mode(chat_id, data, msg_id):
+    cfg = db.user_settings.find_one({"user_id": chat_id})
+    current_mode = cfg.get("notify_mode", "smart")
 
-    elif data == "manual_freq_ask":
-        msg = (
-            "✍️ *Definir Frequência Personalizada*\n\n"
-            "Digite o tempo desejado:\n"
-            "_Minimo 1h | Máximo 7 dias_\n\n"
-            "• `1h`\n"
-            "• `1h 30m`\n"
-            "• `2d`\n\n"
-            "🔐 *Admin (Segundos liberado):*\n"
-            "Use: `TEMPO -K CHAVE_SIMETRICA`\n"
-            "Ex: `10s -K a1b2c3...`"
-        )
-        kb = {"inline_keyboard": [[{"text": "🔙 Cancelar", "callback_data": "notify_menu"}]]}
-        p = send_tg(chat_id, msg, kb)
-        set_state(chat_id, "config_alert", "wait_input", prompt_msg_id=p)
+    # Inverte o modo
+    new_mode = "manual" if current_mode == "smart" else "smart"
 
-    # --- LÓGICA DO TESTE DE NOTIFICAÇÃO ---
-    elif data == "test_notify":
-        cfg = db.user_settings.find_one({"user_id": chat_id})
-        mode = cfg.get("notify_mode", "smart")
-        
-        all_tasks = list(db.provas.find({"user_id": chat_id}))
-        now = get_brt_now()
-        
-        if not all_tasks:
-            answer_callback(chat_id, "Sem eventos para notificar.")
-            return
+    db.user_settings.update_one(
+        {"user_id": chat_id}, 
+        {"$set": {"notify_mode": new_mode}}, 
+        upsert=True
+    )
+    publish_settings_change(chat_id)
+    # Recarrega o menu com o texto atualizado
+    menu_notificacao(chat_id, msg_id)
+
+@registry.callback("manual_freq_ask")
+def cb_manual_freq_ask(chat_id, data, msg_id):
+    msg = (
+        "✍️ *Definir Frequência Personalizada*\n\n"
+        "Digite o tempo desejado:\n"
+        "_Minimo 1h | Máximo 7 dias_\n\n"
+        "• `1h`\n"
+        "• `1h 30m`\n"
+        "• `2d`\n\n"
+        "🔐 *Admin (Segundos liberado):*\n"
+        "Use: `TEMPO -K CHAVE_SIMETRICA`\n"
+        "Ex: `10s -K a1b2c3...`"
+    )
+    kb = {"inline_keyboard": [[{"text": "🔙 Cancelar", "callback_data": "notify_menu"}]]}
+    p = send_tg(chat_id, msg, kb)
+    set_state(chat_id, "config_alert", "wait_input", prompt_msg_id=p)
 
-        grouped_tasks = {}
-        total_items = 0
+# --- LÓGICA DO TESTE DE NOTIFICAÇÃO ---
+@registry.callback("test_notify")
+def cb_test_notify(chat_id, data, msg_id):
+    cfg = db.user_settings.find_one({"user_id": chat_id})
+    mode = cfg.get("notify_mode", "smart")
 
-        for t in all_tasks:
-            d = parse_smart_date(t.get('data', ''))
-            if not d: continue
-            
-            delta_days = (d.date() - now.date()).days
-            if delta_days < 0: continue 
+    # Mesmo motor (memoizado) do resumo periódico do notifier
+    digest = get_digest((chat_id,), mode, 'diff', get_brt_now().date())
 
-            prio = t.get('prioridade', 'low')
-            
-            include = False
-            if mode == 'manual':
-                include = True
-            else:
-                # --- MUDANÇA 1: Lógica Smart Expandida ---
-                # Inclui se for Crítico/Médio OU se faltar 30 dias ou menos
-                if prio in ['critical', 'medium'] or delta_days <= 30:
-                    include = True
-            
-            if include:
-                cat = t.get('tipo', 'Geral')
-                if cat not in grouped_tasks: grouped_tasks[cat] = []
-                grouped_tasks[cat].append((d, t, delta_days))
-                total_items += 1
-
-        if total_items == 0:
-            send_tg(chat_id, f"🔕 *Teste ({mode.title()}):* Nenhum evento nos critérios (30 dias/Urgente).")
-            return
+    if not digest.has_tasks:
+        answer_callback(chat_id, "Sem eventos para notificar.")
+        return
 
-        lines = [f"🔔 *Teste de Notificação ({mode.title()})*", ""]
-        
-        for cat in sorted(grouped_tasks.keys()):
-            lines.append(f"📂 *{cat}*")
-            items = sorted(grouped_tasks[cat], key=lambda x: x[0])
-            
-            for d, t, dias in items:
-                prio_raw = t.get('prioridade', 'low')
-                
-                # --- MUDANÇA 2: Ícones condizentes com a Árvore ---
-                if prio_raw == 'critical' or dias <= 7:
-                    ico = "🚨" # Vermelho
-                elif prio_raw == 'medium' or dias <= 30:
-                    ico = "⚠️" # Laranja
-                else:
-                    ico = "🔹" # Verde/Azul (Só aparece no Manual ou se for tag Alta longe)
-                
-                t_str = "HOJE 🔥" if dias == 0 else ("AMANHÃ" if dias == 1 else f"em {dias}d")
-                lines.append(f"{ico} {t['materia']}: {t['data']} ({t_str})")
-            
-            lines.append("")
+    if not digest.sections:
+        send_tg(chat_id, f"🔕 *Teste ({mode.title()}):* Nenhum evento nos critérios (30 dias/Urgente).")
+        return
 
-        lines.append(generate_ascii_tree(all_tasks, mode=mode))
-        send_tg(chat_id, "\n".join(lines))
-        
-    elif data == "ajuda": enviar_ajuda(chat_id, msg_id=msg_id)
+    send_tg(chat_id, digest.summary(f"🔔 *Teste de Notificação ({mode.title()})*", bold="*") + "\n" + digest.tree)
 
-    elif data == "revoke_token":
-        new_token = str(uuid.uuid4())
-        # Atualiza no banco
-        db.user_settings.update_one({"user_id": chat_id}, {"$set": {"export_token": new_token}})
-        
-        new_link = f"{Config.API_PUBLIC_URL}/export/{new_token}"
-        
-        msg = (
-            "✅ *Token Revogado!*\n"
-            "O link antigo foi desativado.\n\n"
-            "🔑 *Novo Link:*\n"
-            f"`{new_link}`"
-        )
-        send_tg(chat_id, msg)
-        
-    elif data == "do_unlink_confirm":
-        success, msg = unlink_account(chat_id)
-        # Remove os botões da mensagem anterior para ficar limpo
-        delete_msg(chat_id, msg_id) 
-        send_tg(chat_id, msg)
-        # Volta pro menu principal
-        listar_agenda(chat_id)
+@registry.callback("ajuda")
+def cb_ajuda(chat_id, data, msg_id):
+    enviar_ajuda(chat_id, msg_id=msg_id)
 
-    elif data.startswith("import_do:"):
-        action = data.split(":")[1]
-        state = get_state(chat_id)
-        
-        # Segurança: Verifica se tem dados salvos no estado
-        if not state or "items" not in state.get("temp_data", {}):
-            send_tg(chat_id, "⚠️ Sessão expirada. Envie o arquivo novamente via `/import`.")
-            return
+@registry.callback("revoke_token")
+def cb_revoke_token(chat_id, data, msg_id):
+    new_token = str(uuid.uuid4())
+    # Atualiza no banco
+    db.user_settings.update_one({"user_id": chat_id}, {"$set": {"export_token": new_token}})
 
-        items_to_import = state["temp_data"]["items"]
-        
-        if action == "replace":
-            # 1. MODO SUBSTITUIR: Apaga tudo e insere
-            db.provas.delete_many({"user_id": chat_id})
-            db.provas.insert_many(items_to_import)
-            
-            # Atualiza categorias
-            db.user_settings.update_one({"user_id": chat_id}, {"$set": {"custom_cats": []}}) # Reseta cats antigas
-            for it in items_to_import:
-                 db.user_settings.update_one({"user_id": chat_id}, {"$addToSet": {"custom_cats": it["tipo"]}}, upsert=True)
+    new_link = f"{Config.API_PUBLIC_URL}/export/{new_token}"
 
-            send_tg(chat_id, f"✅ **Sucesso!**\nSua agenda foi totalmente substituída por {len(items_to_import)} novos eventos.", msg_id=msg_id)
+    msg = (
+        "✅ *Token Revogado!*\n"
+        "O link antigo foi desativado.\n\n"
+        "🔑 *Novo Link:*\n"
+        f"`{new_link}`"
+    )
+    send_tg(chat_id, msg)
+
+@registry.callback("do_unlink_confirm")
+def cb_do_unlink_confirm(chat_id, data, msg_id):
+    success, msg = unlink_account(chat_id)
+    # Remove os botões da mensagem anterior para ficar limpo
+    delete_msg(chat_id, msg_id) 
+    send_tg(chat_id, msg)
+    # Volta pro menu principal
+    listar_agenda(chat_id)
 
-        elif action == "merge":
-            # 2. MODO MESCLAR: Verifica duplicidade INTELIGENTE (Tipo + Materia + Data + OBS)
-            
-            # Busca eventos existentes
-            existing = db.provas.find({"user_id": chat_id})
-            existing_sigs = set()
-            
-            for doc in existing:
-                # Assinatura Única: Inclui OBSERVAÇÕES agora!
-                sig = (
-                    str(doc.get("tipo", "")).strip().lower(),
-                    str(doc.get("materia", "")).strip().lower(),
-                    str(doc.get("data", "")).strip(),
-                    str(doc.get("observacoes", "")).strip().lower() # <--- Correção aqui
-                )
-                existing_sigs.add(sig)
-            
-            final_list = []
-            duplicates = 0
-            
-            for item in items_to_import:
-                # Cria assinatura do item novo
-                item_sig = (
-                    str(item["tipo"]).strip().lower(),
-                    str(item["materia"]).strip().lower(),
-                    str(item["data"]).strip(),
-                    str(item["observacoes"]).strip().lower()
-                )
-                
-                if item_sig in existing_sigs:
-                    duplicates += 1
-                else:
-                    final_list.append(item)
-                    existing_sigs.add(item_sig) # Evita duplicação interna no próprio JSON
+@registry.callback("import_do:")
+def cb_import_do(chat_id, data, msg_id):
+    action = data.split(":")[1]
+    state = get_state(chat_id)
 
-            if final_list:
-                db.provas.insert_many(final_list)
-                # Atualiza cats
-                for it in final_list:
-                     db.user_settings.update_one({"user_id": chat_id}, {"$addToSet": {"custom_cats": it["tipo"]}}, upsert=True)
+    # Segurança: Verifica se tem dados salvos no estado
+    if not state or "items" not in state.get("temp_data", {}):
+        send_tg(chat_id, "⚠️ Sessão expirada. Envie o arquivo novamente via `/import`.")
+        return
 
-            send_tg(chat_id, f"✅ **Mesclagem Concluída!**\n📥 {len(final_list)} novos adicionados.\n♻️ {duplicates} já existiam (ignorados).", msg_id=msg_id)
+    items_to_import = state["temp_data"]["items"]
 
-        # Limpa o estado e mostra a agenda
-        clear_state(chat_id)
-        listar_agenda(chat_id)
+    # Progresso: edita a mensagem a cada ~20% (só vale para imports grandes)
+    last_pct = [0]
+    def report(done, total):
+        pct = done * 100 // total
+        if total > IMPORT_CHUNK_SIZE and pct - last_pct[0] >= 20 and done < total:
+            last_pct[0] = pct
+            send_tg(chat_id, f"⏳ Importando... {done}/{total} ({pct}%)", msg_id=msg_id)
+
+    if action == "replace":
+        # 1. MODO SUBSTITUIR: Apaga tudo e insere
+        inserted, _ = import_items(chat_id, items_to_import, mode="replace", progress=report)
+        send_tg(chat_id, f"✅ **Sucesso!**\nSua agenda foi totalmente substituída por {inserted} novos eventos.", msg_id=msg_id)
+
+    elif action == "merge":
+        # 2. MODO MESCLAR: Verifica duplicidade INTELIGENTE (Tipo + Materia + Data + OBS)
+        inserted, duplicates = import_items(chat_id, items_to_import, mode="merge", progress=report)
+        send_tg(chat_id, f"✅ **Mesclagem Concluída!**\n📥 {inserted} novos adicionados.\n♻️ {duplicates} já existiam (ignorados).", msg_id=msg_id)
+
+    # Limpa o estado e mostra a agenda
+    clear_state(chat_id)
+    listar_agenda(chat_id)
 
 def rabbit_callback(ch, method, properties, body):
     try:
@@ -1464,13 +1408,20 @@ def rabbit_callback(ch, method, properties, body):
         print(f"❌ Erro Worker: {e}")
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
-while True:
-    try:
-        creds = pika.PlainCredentials(Config.RABBIT_USER, Config.RABBIT_PASS)
-        conn = pika.BlockingConnection(pika.ConnectionParameters(host=Config.RABBIT_HOST, credentials=creds))
-        ch = conn.channel()
-        ch.queue_declare(queue=Config.QUEUE_NAME, durable=True)
-        ch.basic_consume(queue=Config.QUEUE_NAME, on_message_callback=rabbit_callback)
-        print("🚀 Worker Conectado!", flush=True)
-        ch.start_consuming()
-    except: time.sleep(5)
\ No newline at end of file
+def main():
+    print("👷 Worker (CLI V21 - Secure Alerts) Iniciado...", flush=True)
+    start_http_server(8001)
+    start_listener()
+    while True:
+        try:
+            creds = pika.PlainCredentials(Config.RABBIT_USER, Config.RABBIT_PASS)
+            conn = pika.BlockingConnection(pika.ConnectionParameters(host=Config.RABBIT_HOST, credentials=creds))
+            ch = conn.channel()
+            ch.queue_declare(queue=Config.QUEUE_NAME, durable=True)
+            ch.basic_consume(queue=Config.QUEUE_NAME, on_message_callback=rabbit_callback)
+            print("🚀 Worker Conectado!", flush=True)
+            ch.start_consuming()
+        except: time.sleep(5)
+
+if __name__ == "__main__":
+    main()